@@ -1,15 +1,20 @@
 import tkinter as tk
 from tkinter import messagebox, filedialog
 import threading
+import time
 import os
 
-from Engine import DownloadEngine  
+# Engine (y con él yt_dlp, cientos de extractores) se importa en segundo plano: ver _boot
 from MainView import MainView
 from SettingsView import SettingsView 
+from Logger import LogChannel
+
+LOG_TICK_MS = 100
 
 class AppController:
     def __init__(self, root):
         self.root = root
+        self.started = time.perf_counter()
         
         # 1. Variables por defecto
         self.variables = {
@@ -18,8 +23,15 @@ class AppController:
             'cookie_path': tk.StringVar(),
             'format': tk.StringVar(value="mp3"),
             'bitrate': tk.StringVar(value="192"),
-            'separator': tk.StringVar(value=" - ")
+            'separator': tk.StringVar(value=" - "),
+            'concurrency': tk.StringVar(value="1"),
+            'incremental': tk.BooleanVar(value=False),
+            'replaygain': tk.BooleanVar(value=False)
         }
+        # Lo que el usuario cambia mientras carga el motor no lo pisa la configuración guardada (ver _on_ready)
+        self.edited = set()
+        self.edit_traces = [(var, var.trace_add('write', lambda *_, name=name: self.edited.add(name)))
+                            for name, var in self.variables.items()]
         
         self.tags_data = [
             {"label": "Artista", "code": "%(artist)s", "active": tk.BooleanVar(value=True)},
@@ -29,29 +41,66 @@ class AppController:
             {"label": "ID Video","code": "%(id)s",     "active": tk.BooleanVar(value=False)},
         ]
 
-        # 2. Motor Lógico (Incluye DB)
-        self.engine = DownloadEngine(log_callback=self.update_log_safe)
-        
-        # 3. CARGAR CONFIGURACIÓN PERSISTENTE
-        self.load_app_settings()
+        # 2. Motor Lógico (Incluye DB): se crea en segundo plano, la ventana no lo espera
+        # Los hilos del motor escriben en el canal; la UI lo vacía cada LOG_TICK_MS
+        self.log_channel = LogChannel()
+        self.engine = None
+        self.verifier = None
+        self.task = None # Hilo de la descarga o verificación en curso
+        self.closing = False
 
-        # 4. Vista
+        # 3. Vista (INICIAR se habilita cuando el motor está listo)
         callbacks = {
             'start': self.start_download,
             'stop': self.stop_download,
             'open_settings': self.open_settings_window,
-            'select_folder': self.select_folder
+            'select_folder': self.select_folder,
+            'verify': self.verify_library,
+            'pause': self.toggle_pause,
+            'skip': self.skip_current
         }
         self.view = MainView(root, callbacks, self.variables)
+        self.view.set_loading(True)
 
         # Guardar configuración al cerrar ventana
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(LOG_TICK_MS, self._drain_log)
 
-    def load_app_settings(self):
-        """Carga la configuración desde la base de datos."""
+        # 4. CARGAR MOTOR Y CONFIGURACIÓN PERSISTENTE
+        threading.Thread(target=self._boot, name="boot", daemon=True).start()
+
+    def _boot(self):
+        """Hilo de arranque: importa yt_dlp, abre la DB y lee la configuración."""
+        try:
+            from Engine import DownloadEngine
+            from Verifier import LibraryVerifier
+            engine = DownloadEngine(log_callback=self.update_log_safe,
+                                    progress_callback=self.log_channel.set_progress)
+            verifier = LibraryVerifier(engine.db, self.update_log_safe)
+            settings = engine.db.load_settings()
+        except Exception as e:
+            self.update_log_safe(f"❌ No se pudo iniciar el motor: {e}")
+            return
+        # Las variables de Tk solo se tocan desde el hilo de la interfaz
+        try:
+            self.root.after(0, lambda: self._on_ready(engine, verifier, settings))
+        except (tk.TclError, RuntimeError):
+            engine.close() # La ventana se cerró antes de terminar el arranque
+
+    def _on_ready(self, engine, verifier, settings):
+        self.engine = engine
+        self.verifier = verifier
+        for var, trace in self.edit_traces:
+            var.trace_remove('write', trace)
+        self.load_app_settings({key: value for key, value in settings.items() if key not in self.edited})
+        # Ej. una carpeta elegida durante la carga: save_app_settings no pudo guardarla sin DB
+        if self.edited: self.save_app_settings()
+        self.view.set_loading(False)
+        self.update_log_safe(f"Listo en {time.perf_counter() - self.started:.2f} s.")
+
+    def load_app_settings(self, settings):
+        """Aplica la configuración leída de la base de datos."""
         try:
-            settings = self.engine.db.load_settings()
-            
             if 'download_path' in settings and os.path.isdir(settings['download_path']):
                 self.variables['download_path'].set(settings['download_path'])
             if 'cookie_path' in settings:
@@ -62,6 +111,12 @@ class AppController:
                 self.variables['bitrate'].set(settings['bitrate'])
             if 'separator' in settings:
                 self.variables['separator'].set(settings['separator'])
+            if 'concurrency' in settings:
+                self.variables['concurrency'].set(settings['concurrency'])
+            if 'incremental' in settings:
+                self.variables['incremental'].set(settings['incremental'] == 'True')
+            if 'replaygain' in settings:
+                self.variables['replaygain'].set(settings['replaygain'] == 'True')
             
             # Nota: Cargar el estado de los tags es más complejo, 
             # se podría guardar como un string JSON en la DB si se desea.
@@ -70,14 +125,35 @@ class AppController:
 
     def save_app_settings(self):
         """Guarda el estado actual en la DB."""
+        # Antes de que arranque el motor no hay DB: _on_ready guarda lo cambiado mientras tanto
+        if self.engine is None: return
         self.engine.db.save_setting('download_path', self.variables['download_path'].get())
         self.engine.db.save_setting('cookie_path', self.variables['cookie_path'].get())
         self.engine.db.save_setting('format', self.variables['format'].get())
         self.engine.db.save_setting('bitrate', self.variables['bitrate'].get())
         self.engine.db.save_setting('separator', self.variables['separator'].get())
+        self.engine.db.save_setting('concurrency', self.variables['concurrency'].get())
+        self.engine.db.save_setting('incremental', self.variables['incremental'].get())
+        self.engine.db.save_setting('replaygain', self.variables['replaygain'].get())
+        # El modo sin interfaz (Cli.py) reutiliza la plantilla de nombres
+        self.engine.db.save_setting('name_template', self._build_name_template())
 
     def on_close(self):
+        if self.engine is None:
+            self.root.destroy()
+            return
         self.save_app_settings()
+        self.closing = True
+        if self.task is not None and self.task.is_alive():
+            self.stop_download()
+        self._close_when_idle()
+
+    def _close_when_idle(self):
+        # Sin join(): el hilo de trabajo todavía envía llamadas a Tk y el bucle debe atenderlas
+        if self.task is not None and self.task.is_alive():
+            self.root.after(LOG_TICK_MS, self._close_when_idle)
+            return
+        self.engine.close() # La DB se cierra solo cuando nadie más la usa
         self.root.destroy()
 
     def select_folder(self):
@@ -91,6 +167,7 @@ class AppController:
         # Podrías agregar un callback al SettingsView para guardar al cerrar el modal
 
     def start_download(self):
+        if self.engine is None: return # Todavía cargando
         # Guardamos configuración al iniciar descarga también
         self.save_app_settings()
 
@@ -99,32 +176,102 @@ class AppController:
             messagebox.showwarning("Error", "Ingrese una URL válida")
             return
 
-        active_tags = [t["code"] for t in self.tags_data if t["active"].get()]
-        if not active_tags: active_tags = ["%(title)s"]
-        template = self.variables['separator'].get().join(active_tags)
+        template = self._build_name_template()
 
         config = {
             'cookie_path': self.variables['cookie_path'].get(),
             'format': self.variables['format'].get(),
             'bitrate': self.variables['bitrate'].get(),
-            'name_template': template
+            'name_template': template,
+            'concurrency': self._get_concurrency(),
+            'incremental': self.variables['incremental'].get(),
+            'replaygain': self.variables['replaygain'].get()
         }
 
+        # Las variables de Tk se leen aquí, en el hilo de la interfaz
+        path = self.variables['download_path'].get()
         self.view.toggle_controls(is_running=True)
-        threading.Thread(target=self._run_thread, args=(url, config)).start()
+        self.task = threading.Thread(target=self._run_thread, args=(url, path, config))
+        self.task.start()
 
-    def _run_thread(self, url, config):
-        path = self.variables['download_path'].get()
-        self.engine.run(url, path, config)
-        self.root.after(0, lambda: self.view.toggle_controls(is_running=False))
-        self.root.after(0, lambda: messagebox.showinfo("Fin", "Proceso terminado"))
+    def _build_name_template(self):
+        active_tags = [t["code"] for t in self.tags_data if t["active"].get()]
+        if not active_tags: active_tags = ["%(title)s"]
+        return self.variables['separator'].get().join(active_tags)
+
+    def _get_concurrency(self):
+        try:
+            return max(1, min(8, int(self.variables['concurrency'].get())))
+        except ValueError:
+            return 1
+
+    def _run_thread(self, url, path, config):
+        message = "Proceso terminado"
+        try:
+            self.engine.run(url, path, config)
+        except Exception as e:
+            self.update_log_safe(f"❌ Error inesperado: {e}")
+            message = f"El proceso terminó con un error: {e}"
+        finally:
+            # Pase lo que pase, los controles vuelven a habilitarse
+            self.root.after(0, lambda: self._on_task_done("Fin", message))
+
+    def verify_library(self):
+        if self.verifier is None: return
+        # La verificación no se pausa ni salta videos: solo DETENER tiene efecto
+        self.view.toggle_controls(is_running=True, pausable=False)
+        self.task = threading.Thread(target=self._verify_thread)
+        self.task.start()
+
+    def _verify_thread(self):
+        try:
+            result = self.verifier.run()
+            message = f"Correctos: {result['ok']}\nDevueltos a la cola: {result['broken']}"
+        except Exception as e:
+            self.update_log_safe(f"❌ Error inesperado en la verificación: {e}")
+            message = f"La verificación terminó con un error: {e}"
+        finally:
+            self.root.after(0, lambda: self._on_task_done("Verificación", message))
+
+    def _on_task_done(self, title, message):
+        self.view.toggle_controls(is_running=False)
+        # Cerrando la ventana no se abre el aviso: bloquearía el cierre
+        if not self.closing:
+            messagebox.showinfo(title, message)
 
     def stop_download(self):
+        if self.engine is None: return
         self.engine.request_stop()
+        self.verifier.request_stop()
         self.update_log_safe("!!! SOLICITANDO PARADA... !!!")
 
+    def toggle_pause(self):
+        if self.engine is None: return
+        if self.engine.paused:
+            self.engine.resume()
+            self.update_log_safe("▶ REANUDANDO...")
+        else:
+            self.engine.pause()
+            self.update_log_safe("⏸ PAUSANDO...")
+        self.view.set_paused(self.engine.paused)
+
+    def skip_current(self):
+        """Salta los videos que se están descargando en este momento."""
+        if self.engine is None: return
+        if not self.engine.skip():
+            self.update_log_safe("No hay descargas activas para saltar.")
+
     def update_log_safe(self, msg):
-        self.root.after(0, lambda: self.view.append_log(msg))
+        self.log_channel.put(msg)
+
+    def _drain_log(self):
+        lines, dropped, progress = self.log_channel.drain()
+        if dropped:
+            lines.insert(0, f"… {dropped} mensajes omitidos …")
+        self.view.append_logs(lines)
+        if progress is not None:
+            self.view.set_progress(progress)
+        self.root.after(LOG_TICK_MS, self._drain_log)
 
 if __name__ == "__main__":
     root = tk.Tk()
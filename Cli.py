@@ -0,0 +1,174 @@
+"""Modo sin interfaz: sincroniza todas las playlists guardadas en la base de datos.
+
+Uso:
+    python Cli.py [sync] [--db downloads.db] [--max-downloads 4] [--playlists 2] [--every 60] [--metrics-dir DIR]
+    python Cli.py verify [--db downloads.db] [--workers 8] [--probe]
+    python Cli.py drain [--node NOMBRE] [--lease 120] [opciones de sync]
+    python Cli.py loudness [--db downloads.db] [--workers N]
+
+Usa la configuración guardada por la app (tabla settings). Al terminar imprime
+en stdout un resumen JSON con los videos completados, fallidos y omitidos, y el ritmo de
+descarga de toda la pasada (items/hora y 429 recibidos).
+Código de salida: 0 si no hubo fallos, 1 si alguno falló.
+Con --metrics-dir se escribe un archivo .prom por playlist (textfile collector de node_exporter).
+'verify' comprueba en disco los videos completados y devuelve a la cola los que falten o estén dañados
+(código de salida 1 si encontró alguno).
+'drain' es un sync que comparte la cola con otros nodos: cada lote de videos se reclama con
+un lease que el nodo renueva mientras trabaja, y ningún otro nodo lo toma. Los nodos son
+procesos del mismo equipo contra la misma base de datos local (Leases.SqliteLeaseStore):
+SQLite no admite compartir el archivo entre máquinas por una carpeta de red. Todos salen por
+la misma IP, así que drain no suma presupuesto anti-bloqueo: reparte la descarga y la
+conversión entre procesos, y cada uno regula su ritmo por su cuenta (más nodos, más 429).
+'loudness' mide la sonoridad de los videos completados y escribe las etiquetas ReplayGain
+(requiere NumPy); se saltan los archivos que no cambiaron desde su último análisis.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Database import DatabaseManager
+from RateLimiter import AdaptiveThrottle
+
+def build_config(settings, args):
+    """Traduce la configuración guardada por la app al dict que espera DownloadEngine.run."""
+    path = args.path or settings.get('download_path') or os.path.join(os.path.expanduser("~"), "Downloads")
+    config = {
+        'cookie_path': settings.get('cookie_path', ''),
+        'format': settings.get('format', 'mp3'),
+        'bitrate': settings.get('bitrate', '192'),
+        'name_template': settings.get('name_template', '%(title)s'),
+        # Cada motor puede lanzar hasta el tope global; el semáforo compartido hace cumplir el límite
+        'concurrency': args.max_downloads,
+        'incremental': settings.get('incremental') == 'True',
+        'replaygain': settings.get('replaygain') == 'True',
+        # Los núcleos se reparten entre las playlists que corren a la vez
+        'transcode_workers': max(1, (os.cpu_count() or 1) // max(1, args.playlists)),
+        'lease_seconds': args.lease,
+        # Carpeta local rápida para descargar y convertir; el destino solo recibe archivos terminados
+        'staging_path': args.staging or settings.get('staging_path', ''),
+    }
+    return path, config
+
+def log_to_stderr(prefix):
+    def log(msg):
+        msg = msg.strip()
+        if msg: print(f"[{prefix}] {msg}", file=sys.stderr, flush=True)
+    return log
+
+def sync_all(db, args, leases=None):
+    """Sincroniza todas las playlists en paralelo y devuelve el resumen agregado."""
+    from Engine import DownloadEngine
+
+    playlists = db.get_all_playlists()
+    path, config = build_config(db.load_settings(), args)
+    # Un único controlador de ritmo y un único tope de descargas para todo el proceso
+    # (sus contadores arrancan aquí, una vez por pasada)
+    throttle = AdaptiveThrottle(db)
+    slots = threading.BoundedSemaphore(args.max_downloads)
+
+    def sync_one(playlist):
+        pl_id, url, title = playlist
+        engine = DownloadEngine(log_callback=log_to_stderr(title or pl_id), db=db,
+                                throttle=throttle, download_slots=slots, leases=leases, node_id=args.node)
+        engines.append(engine)
+        pl_config = dict(config)
+        if args.metrics_dir:
+            pl_config['metrics_path'] = os.path.join(args.metrics_dir, f"musicdl_pl{pl_id}.prom")
+        try:
+            result = engine.run(url, path, pl_config)
+        finally:
+            engine.close()
+        return {'playlist_id': pl_id, 'url': url, 'title': title, **result}
+
+    engines = []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, args.playlists)) as pool:
+        try:
+            results = list(pool.map(sync_one, playlists))
+        except KeyboardInterrupt:
+            # Se detienen los motores antes de que el pool espere a sus hilos
+            for engine in engines: engine.request_stop()
+            raise
+
+    totals = {key: sum(r[key] for r in results) for key in ('completed', 'failed', 'skipped')}
+    saved = [r['cpu_saved_s'] for r in results if r['cpu_saved_s'] is not None]
+    # None: hubo copias sin recodificar pero todavía no se midió lo que cuesta recodificar
+    totals['cpu_saved_s'] = round(sum(saved), 1) if len(saved) == len(results) else None
+    # Ritmo de toda la pasada: el controlador compartido no se reinicia por playlist
+    totals['downloads'] = throttle.completed
+    totals['items_per_hour'] = round(throttle.items_per_hour())
+    totals['rate_limits'] = throttle.rate_limits
+    return {'started_at': started, 'elapsed_s': round(time.time() - started, 1),
+            'playlists': results, **totals}
+
+def verify(db, args):
+    from Verifier import LibraryVerifier
+    verifier = LibraryVerifier(db, log_to_stderr("verify"), workers=args.workers, probe=args.probe)
+    return verifier.run()
+
+def loudness(db, args):
+    from Loudness import LoudnessScanner
+    scanner = LoudnessScanner(db, log_to_stderr("loudness"), workers=args.workers)
+    return scanner.run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sincroniza todas las playlists guardadas sin interfaz gráfica.")
+    parser.add_argument('command', nargs='?', choices=('sync', 'verify', 'drain', 'loudness'), default='sync')
+    parser.add_argument('--db', default="downloads.db", help="Base de datos de la app")
+    parser.add_argument('--path', default=None, help="Carpeta destino (por defecto la guardada en settings)")
+    parser.add_argument('--max-downloads', type=int, default=4, help="Tope global de descargas simultáneas")
+    parser.add_argument('--playlists', type=int, default=2, help="Playlists sincronizadas a la vez")
+    parser.add_argument('--every', type=float, default=0, help="Repetir cada N minutos (modo daemon)")
+    parser.add_argument('--metrics-dir', default=None, help="Carpeta para exportar métricas en formato Prometheus")
+    parser.add_argument('--workers', type=int, default=8, help="verify/loudness: archivos procesados en paralelo")
+    parser.add_argument('--probe', action='store_true', help="verify: comprobar además la duración con ffprobe")
+    parser.add_argument('--node', default=None, help="drain: nombre del nodo (por defecto equipo-pid; uno fijo recupera sus leases al reiniciar)")
+    parser.add_argument('--staging', default=None, help="Carpeta local de trabajo (por defecto una en el temporal del sistema)")
+    parser.add_argument('--lease', type=float, default=120, help="drain: vigencia de cada lease en segundos")
+    args = parser.parse_args(argv)
+
+    db = DatabaseManager(args.db, log_callback=log_to_stderr("db"))
+    if args.command == 'loudness':
+        try:
+            summary = loudness(db, args)
+            print(json.dumps(summary), flush=True)
+            return 1 if summary['failed'] else 0
+        except KeyboardInterrupt:
+            return 130
+        finally:
+            db.close()
+    if args.command == 'verify':
+        try:
+            summary = verify(db, args)
+            print(json.dumps(summary), flush=True)
+            return 1 if summary['broken'] else 0
+        except KeyboardInterrupt:
+            return 130
+        finally:
+            db.close()
+
+    leases = None
+    if args.command == 'drain':
+        from Leases import SqliteLeaseStore
+        leases = SqliteLeaseStore(db)
+
+    failed = 0
+    try:
+        while True:
+            summary = sync_all(db, args, leases)
+            print(json.dumps(summary, ensure_ascii=False), flush=True)
+            failed = summary['failed']
+            if not args.every: break
+            time.sleep(args.every * 60)
+    except KeyboardInterrupt:
+        return 130
+    finally:
+        db.close()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
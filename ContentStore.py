@@ -0,0 +1,74 @@
+import errno
+import os
+import shutil
+
+from Transcoder import LOSSLESS
+
+# Campos de la info de yt-dlp que se guardan para poder renombrar sin volver a extraer
+NAME_FIELDS = ('id', 'title', 'track', 'artist', 'creator', 'uploader', 'channel',
+               'album', 'upload_date', 'release_date', 'webpage_url')
+
+FICLONE = 0x40049409 # ioctl de Linux (btrfs, xfs, ...): copia por referencia
+
+def content_key(fmt, bitrate):
+    """(formato, bitrate) con que se indexa el almacén; en formatos sin pérdida el bitrate no cuenta."""
+    return fmt, "" if fmt in LOSSLESS else str(bitrate or "")
+
+def name_info(info):
+    return {k: info[k] for k in NAME_FIELDS if info.get(k) is not None}
+
+def _reflink(src, dst):
+    import fcntl # Solo existe en POSIX
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def link_into(src, dst):
+    """Materializa src en dst sin volver a descargar. Devuelve el método usado.
+
+    Orden: hardlink (misma partición), reflink (FICLONE) y por último copia.
+    Se escribe a un temporal y se renombra: dst nunca queda a medias.
+    """
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    base, ext = os.path.splitext(dst)
+    tmp = f"{base}.link{os.getpid()}{ext}"
+    try:
+        try:
+            os.link(src, tmp)
+            method = "hardlink"
+        except OSError:
+            try:
+                _reflink(src, tmp)
+                method = "reflink"
+            except (OSError, ImportError):
+                # Otra partición o sistema de archivos sin reflink: copia normal
+                shutil.copyfile(src, tmp)
+                method = "copy"
+        os.replace(tmp, dst)
+        return method
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+
+def publish(src, dst):
+    """Mueve un archivo terminado de staging a su destino. Devuelve "rename" o "copy".
+
+    En la misma partición basta un rename atómico. Si el destino está en otro disco
+    (ej. una carpeta de red) se copia a un temporal junto a dst y se renombra: quien
+    lea la carpeta nunca ve un archivo a medias.
+    """
+    os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+    try:
+        os.replace(src, dst)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV: raise
+    base, ext = os.path.splitext(dst)
+    tmp = f"{base}.pub{os.getpid()}{ext}"
+    try:
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise
+    os.remove(src)
+    return "copy"
\ No newline at end of file
@@ -0,0 +1,120 @@
+import time
+import threading
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+
+class RunControl:
+    """Plano de control de una ejecución: parada, pausa y salto de videos.
+
+    Todas las esperas del motor pasan por aquí y se basan en eventos: una orden
+    despierta de inmediato a quien esté esperando. Las descargas activas se
+    cortan desde el hook de progreso (should_abort), dejando el .part en disco.
+    Se mide la latencia entre cada orden y el momento en que no queda ninguna
+    transferencia activa.
+    """
+    def __init__(self):
+        self.stop_event = threading.Event()
+        self.stop_future = Future() # Se resuelve con la parada: permite esperar un Future o la orden
+        self.resume_event = threading.Event() # Puesto = no pausado
+        self.resume_event.set()
+        self.lock = threading.Lock()
+        self.active = set()  # db_id con transferencia en curso
+        self.skipped = set() # db_id a saltar en esta ejecución
+        self.pending = {}    # {'stop'|'pause': momento de la orden} hasta que se vacía active
+        self.stop_requested = None
+        self.latencies = {'stop': [], 'pause': []}
+
+    def reset(self):
+        """Nueva ejecución: se conservan solo las latencias medidas."""
+        with self.lock:
+            self.stop_event.clear()
+            if self.stop_future.done(): self.stop_future = Future()
+            self.resume_event.set()
+            self.active.clear()
+            self.skipped.clear()
+            self.pending.clear()
+            self.stop_requested = None
+
+    # --- ÓRDENES ---
+    def stop(self):
+        with self.lock:
+            if self.stop_requested is None:
+                self.stop_requested = time.perf_counter()
+            self.pending.setdefault('stop', self.stop_requested)
+            self._settle_if_idle()
+        self.stop_event.set()
+        if not self.stop_future.done(): self.stop_future.set_result(None)
+        self.resume_event.set() # Libera a quien espera la reanudación
+
+    def pause(self):
+        with self.lock:
+            if self.resume_event.is_set():
+                self.pending['pause'] = time.perf_counter()
+                self._settle_if_idle()
+        self.resume_event.clear()
+
+    def resume(self):
+        with self.lock:
+            self.pending.pop('pause', None)
+        self.resume_event.set()
+
+    def skip(self, db_id=None):
+        """Salta un video (o, sin db_id, todos los que se están descargando). Devuelve los saltados."""
+        with self.lock:
+            targets = {db_id} if db_id is not None else set(self.active)
+            self.skipped |= targets
+        return targets
+
+    # --- CONSULTAS ---
+    @property
+    def stopped(self):
+        return self.stop_event.is_set()
+
+    @property
+    def paused(self):
+        return not self.resume_event.is_set()
+
+    def is_skipped(self, db_id):
+        with self.lock:
+            return db_id in self.skipped
+
+    def should_abort(self, db_id):
+        """Lo consulta el hook de progreso en cada bloque descargado."""
+        return self.stopped or self.paused or self.is_skipped(db_id)
+
+    # --- ESPERAS ---
+    def sleep(self, seconds):
+        """Duerme hasta seconds o hasta la orden de parada. Devuelve False si se pidió parar."""
+        return not self.stop_event.wait(max(0.0, seconds))
+
+    def wait_future(self, future):
+        """Espera el resultado de future salvo que llegue antes la parada (devuelve None y lo cancela)."""
+        wait([future, self.stop_future], return_when=FIRST_COMPLETED)
+        if future.done():
+            return future.result()
+        future.cancel()
+        return None
+
+    def wait_resumed(self):
+        """Bloquea mientras dure la pausa. Devuelve False si se pidió parar."""
+        self.resume_event.wait()
+        return not self.stopped
+
+    # --- TRANSFERENCIAS ACTIVAS ---
+    def enter(self, db_id):
+        with self.lock:
+            self.active.add(db_id)
+
+    def leave(self, db_id):
+        """Devuelve [(orden, segundos)] de las órdenes que quedaron cumplidas al salir este video."""
+        with self.lock:
+            self.active.discard(db_id)
+            return self._settle_if_idle()
+
+    def _settle_if_idle(self):
+        if self.active: return []
+        now = time.perf_counter()
+        settled = [(kind, now - started) for kind, started in self.pending.items()]
+        for kind, latency in settled:
+            self.latencies[kind].append(latency)
+        self.pending.clear()
+        return settled
\ No newline at end of file
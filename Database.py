@@ -1,18 +1,144 @@
 import sqlite3
 import datetime
+import time
+import json
+import threading
+import queue
+from concurrent.futures import Future
 
 class DatabaseManager:
-    def __init__(self, db_name="downloads.db"):
-        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+    """Acceso a SQLite con un único hilo escritor.
+
+    Todas las escrituras se encolan y el hilo escritor las agrupa en una sola
+    transacción por lote (group commit). Las lecturas usan una conexión aparte,
+    posible gracias al modo WAL; solo las que necesitan ver las escrituras propias
+    aún encoladas esperan al escritor (fresh=True). Tras close() cualquier acceso
+    lanza sqlite3.ProgrammingError.
+    """
+    MAX_BATCH = 500
+
+    def __init__(self, db_name="downloads.db", log_callback=None):
+        self.db_name = db_name
+        # Las escrituras sin espera no tienen a quién devolver el error: se informa por aquí
+        self.log = log_callback or (lambda msg: None)
+        # Conexión de lectura, compartida entre los hilos de descarga
+        self.conn = self._connect()
+        self.lock = threading.Lock()
+        # Segundos acumulados en transacciones del hilo escritor (métricas por etapa)
+        self.commit_seconds = 0.0
+
+        self._write_queue = queue.Queue()
+        self._closed = False
+        self._state_lock = threading.Lock() # Ordena los encolados frente al centinela de close()
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
         self.create_tables()
 
+    def _connect(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        return conn
+
+    # --- HILO ESCRITOR ---
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._write_queue.get()]
+            # Todo lo que se acumuló mientras se confirmaba el lote anterior va en este
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self._write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = any(op is None for op, _ in batch)
+            ops = [(op, fut) for op, fut in batch if op is not None]
+            results = []
+            started = time.perf_counter()
+            try:
+                # IMMEDIATE: el lote toma el bloqueo de escritura al empezar, así una lectura
+                # seguida de un UPDATE (ver _update_returning) no se intercala con otro proceso
+                conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                for op, fut in ops:
+                    # Un savepoint por operación: un error no deshace el resto del lote
+                    cursor.execute("SAVEPOINT op")
+                    try:
+                        results.append((fut, op(cursor), None))
+                        cursor.execute("RELEASE op")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO op")
+                        cursor.execute("RELEASE op")
+                        results.append((fut, None, e))
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction: conn.execute("ROLLBACK")
+                results = [(fut, None, e) for _, fut in ops]
+            self.commit_seconds += time.perf_counter() - started
+
+            for fut, value, error in results:
+                if error is None: fut.set_result(value)
+                else: fut.set_exception(error)
+            for _, fut in batch:
+                if fut is not None and not fut.done(): fut.set_result(None)
+
+            if stop:
+                conn.close()
+                return
+
+    def _check_open(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("La base de datos ya está cerrada.")
+
+    def _write(self, op, wait=False):
+        """Encola op(cursor) para el hilo escritor. Con wait=True devuelve su resultado."""
+        fut = Future()
+        with self._state_lock:
+            # Después del centinela nadie vacía la cola: se falla en lugar de quedar esperando
+            self._check_open()
+            self._write_queue.put((op, fut))
+        if wait:
+            return fut.result()
+        fut.add_done_callback(self._report_write_error)
+        return fut
+
+    def _report_write_error(self, fut):
+        if fut.exception() is not None:
+            self.log(f"❌ Error de escritura en DB: {fut.exception()}")
+
+    def flush(self):
+        """Espera a que se confirmen todas las escrituras encoladas hasta ahora."""
+        self._write(lambda cursor: None, wait=True)
+
+    def _read(self, sql, params=(), fresh=False):
+        """Consulta en la conexión de lectura. fresh=True espera antes a las escrituras encoladas."""
+        if fresh:
+            self.flush()
+        with self.lock:
+            self._check_open()
+            return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        """Confirma lo encolado y cierra. Repetir la llamada no hace nada."""
+        with self._state_lock:
+            if self._closed: return
+            self._closed = True
+            # El centinela va último: el escritor confirma todo lo anterior antes de salir
+            self._write_queue.put((None, None))
+        self._writer.join()
+        with self.lock:
+            self.conn.close()
+
     def create_tables(self):
-        cursor = self.conn.cursor()
-        
+        self._write(self._create_tables, wait=True)
+
+    def _create_tables(self, cursor):
         # 1. Tabla de Configuración (NUEVA)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS settings (
-                key TEXT PRIMARY KEY, 
+                key TEXT PRIMARY KEY,
                 value TEXT
             )
         ''')
@@ -27,7 +153,7 @@ class DatabaseManager:
                 last_updated TIMESTAMP
             )
         ''')
-        
+
         # Tabla de Videos
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS videos (
@@ -36,45 +162,176 @@ class DatabaseManager:
                 video_id TEXT,
                 title TEXT,
                 url TEXT,
-                status TEXT DEFAULT 'PENDING', 
+                status TEXT DEFAULT 'PENDING',
                 error_msg TEXT,
                 filepath TEXT,
                 FOREIGN KEY(playlist_id) REFERENCES playlists(id),
                 UNIQUE(playlist_id, video_id)
             )
         ''')
-        self.conn.commit()
+        # Columnas añadidas después (migración de bases de datos existentes)
+        self._add_column_if_missing(cursor, 'videos', 'staging_path', 'TEXT')
+        self._add_column_if_missing(cursor, 'videos', 'meta_json', 'TEXT')
+        # Cola de reintentos: clase de error (Retry.py), intentos fallidos y próximo intento (epoch)
+        self._add_column_if_missing(cursor, 'videos', 'error_class', 'TEXT')
+        self._add_column_if_missing(cursor, 'videos', 'attempt_count', 'INTEGER DEFAULT 0')
+        self._add_column_if_missing(cursor, 'videos', 'next_attempt_at', 'REAL')
+        # Tamaño real del archivo final (lo informa la conversión; lo usa el verificador)
+        self._add_column_if_missing(cursor, 'videos', 'filesize', 'INTEGER')
+        # Descarga a medias (.part de yt-dlp): se retoma con Range en la siguiente ejecución
+        self._add_column_if_missing(cursor, 'videos', 'part_path', 'TEXT')
+        self._add_column_if_missing(cursor, 'videos', 'bytes_done', 'INTEGER')
+        self._add_column_if_missing(cursor, 'videos', 'total_bytes', 'INTEGER')
+        # Reparto entre nodos (Leases.py): quién trabaja el video y hasta cuándo (epoch)
+        self._add_column_if_missing(cursor, 'videos', 'lease_owner', 'TEXT')
+        self._add_column_if_missing(cursor, 'videos', 'lease_expires', 'REAL')
+        # Sonoridad (Loudness.py) y mtime del archivo al analizarlo, para no repetir el análisis
+        self._add_column_if_missing(cursor, 'videos', 'loudness_lufs', 'REAL')
+        self._add_column_if_missing(cursor, 'videos', 'loudness_peak', 'REAL')
+        self._add_column_if_missing(cursor, 'videos', 'loudness_mtime_ns', 'INTEGER')
+
+        # get_pending_videos filtra siempre por playlist y estado
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_playlist_status ON videos(playlist_id, status)")
+        # Índice parcial para recorrer la cola pendiente por páginas (keyset sobre id)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_videos_pending ON videos(playlist_id, id) WHERE status NOT IN ('COMPLETED', 'DOWNLOADED')")
+
+        # Resultados crudos de extract_flat, para no repetir la extracción en arranques seguidos
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                url TEXT PRIMARY KEY,
+                title TEXT,
+                fetched_at REAL,
+                entries_json TEXT
+            )
+        ''')
+
+        # Índice de archivos en disco (video_id -> ruta) por carpeta
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_index (
+                video_id TEXT,
+                folder TEXT,
+                filepath TEXT,
+                PRIMARY KEY(folder, video_id)
+            )
+        ''')
+
+        # Último mtime conocido de cada carpeta indexada
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS indexed_folders (
+                folder TEXT PRIMARY KEY,
+                mtime_ns INTEGER
+            )
+        ''')
+
+        # Almacén global de contenido: un archivo convertido por (video, formato, bitrate)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS content_store (
+                video_id TEXT,
+                format TEXT,
+                bitrate TEXT,
+                filepath TEXT,
+                info_json TEXT,
+                PRIMARY KEY(video_id, format, bitrate)
+            )
+        ''')
+
+        # Último estado verificado de cada archivo: si size y mtime no cambian no se vuelve a revisar
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stat_cache (
+                filepath TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                duration REAL,
+                checked_at REAL
+            )
+        ''')
+
+        # Duración de cada etapa por video y ejecución (video_db_id NULL = etapa de toda la ejecución)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS video_metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT,
+                video_db_id INTEGER,
+                stage TEXT,
+                seconds REAL,
+                bytes INTEGER,
+                recorded_at REAL
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_video_metrics_run ON video_metrics(run_id, stage)")
+
+    def _add_column_if_missing(self, cursor, table, column, decl):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
 
     # --- MÉTODOS DE CONFIGURACIÓN (NUEVOS) ---
     def save_setting(self, key, value):
         """Guarda o actualiza una configuración individual."""
-        cursor = self.conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (str(key), str(value)))
-        self.conn.commit()
+        self._write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (str(key), str(value))))
 
     def load_settings(self):
         """Devuelve un diccionario con toda la configuración guardada."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT key, value FROM settings")
-        return {row[0]: row[1] for row in cursor.fetchall()}
+        return {row[0]: row[1] for row in self._read("SELECT key, value FROM settings", fresh=True)}
 
     # --- MÉTODOS DE PLAYLIST Y VIDEO ---
     def get_or_create_playlist(self, url, title="Unknown"):
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM playlists WHERE url = ?", (url,))
-        row = cursor.fetchone()
-        if row:
-            return row[0]
-        else:
-            now = datetime.datetime.now()
-            cursor.execute("INSERT INTO playlists (url, title, created_at, last_updated) VALUES (?, ?, ?, ?)",
-                           (url, title, now, now))
-            self.conn.commit()
+        def op(cursor):
+            cursor.execute("SELECT id FROM playlists WHERE url = ?", (url,))
+            row = cursor.fetchone()
+            if row:
+                return row[0]
+            # last_updated queda en NULL hasta la primera sincronización completa
+            cursor.execute("INSERT INTO playlists (url, title, created_at, last_updated) VALUES (?, ?, ?, NULL)",
+                           (url, title, datetime.datetime.now()))
             return cursor.lastrowid
+        return self._write(op, wait=True)
+
+    def get_all_playlists(self):
+        """Devuelve [(id, url, title)] de todas las playlists registradas."""
+        return self._read("SELECT id, url, title FROM playlists ORDER BY id", fresh=True)
+
+    def get_playlist(self, url):
+        """Devuelve (id, last_updated) o None si la playlist nunca se sincronizó."""
+        rows = self._read("SELECT id, last_updated FROM playlists WHERE url = ?", (url,), fresh=True)
+        return rows[0] if rows else None
+
+    def touch_playlist(self, playlist_id):
+        """Marca la playlist como sincronizada (base para la sincronización incremental)."""
+        self._write(lambda cursor: cursor.execute(
+            "UPDATE playlists SET last_updated = ? WHERE id = ?", (datetime.datetime.now(), playlist_id)))
+
+    def get_known_video_ids(self, playlist_id, video_ids):
+        """Subconjunto de video_ids que ya están registrados en la playlist.
+
+        Sin esperar al escritor: las altas de la ingesta se confirman antes de volver.
+        """
+        known = set()
+        video_ids = list(video_ids)
+        for start in range(0, len(video_ids), 500): # Límite de parámetros de SQLite
+            part = video_ids[start:start + 500]
+            marks = ",".join("?" * len(part))
+            rows = self._read(f"SELECT video_id FROM videos WHERE playlist_id = ? AND video_id IN ({marks})",
+                              (playlist_id, *part))
+            known.update(row[0] for row in rows)
+        return known
+
+    # --- CACHÉ DE EXTRACCIÓN ---
+    def get_cached_extraction(self, url, max_age):
+        """Devuelve (título, entradas) si hay una extracción más reciente que max_age segundos."""
+        rows = self._read("SELECT title, entries_json FROM extraction_cache WHERE url = ? AND fetched_at >= ?",
+                          (url, time.time() - max_age), fresh=True)
+        return (rows[0][0], json.loads(rows[0][1])) if rows else None
+
+    def save_extraction(self, url, title, entries):
+        payload = json.dumps(entries)
+        self._write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO extraction_cache (url, title, fetched_at, entries_json) VALUES (?, ?, ?, ?)",
+            (url, title, time.time(), payload)))
 
     def add_videos_to_playlist(self, playlist_id, entries):
-        cursor = self.conn.cursor()
-        count = 0
+        rows = []
         for entry in entries:
             if not entry: continue
             vid_id = entry.get('id')
@@ -82,35 +339,301 @@ class DatabaseManager:
             web_url = entry.get('url') or entry.get('webpage_url')
             if not web_url and vid_id:
                 web_url = f"https://www.youtube.com/watch?v={vid_id}"
+            rows.append((playlist_id, vid_id, title, web_url))
 
-            # Intentamos insertar. Si ya existe (por UNIQUE constraint), lo ignoramos.
-            try:
-                cursor.execute('''
-                    INSERT INTO videos (playlist_id, video_id, title, url, status) 
-                    VALUES (?, ?, ?, ?, 'PENDING')
-                ''', (playlist_id, vid_id, title, web_url))
-                count += 1
-            except sqlite3.IntegrityError:
-                pass
-        self.conn.commit()
-        return count
+        def op(cursor):
+            # Los duplicados (UNIQUE(playlist_id, video_id)) se ignoran sin excepción
+            before = cursor.connection.total_changes
+            cursor.executemany('''
+                INSERT OR IGNORE INTO videos (playlist_id, video_id, title, url, status)
+                VALUES (?, ?, ?, ?, 'PENDING')
+            ''', rows)
+            return cursor.connection.total_changes - before
+        return self._write(op, wait=True)
 
     def get_pending_videos(self, playlist_id):
-        cursor = self.conn.cursor()
-        # Solo trae videos que no estén completados
-        cursor.execute("SELECT id, title, url, video_id, filepath FROM videos WHERE playlist_id = ? AND status != 'COMPLETED'", (playlist_id,))
-        return cursor.fetchall()
-    
+        # Solo trae videos que no estén completados ni esperando conversión
+        return self._read("SELECT id, title, url, video_id, filepath FROM videos WHERE playlist_id = ? AND status NOT IN ('COMPLETED', 'DOWNLOADED')", (playlist_id,), fresh=True)
+
+    # Condición de "listo para intentar": ni fallido sin remedio ni esperando su backoff
+    DUE = "(error_class IS NULL OR error_class != 'PERMANENT') AND (next_attempt_at IS NULL OR next_attempt_at <= ?)"
+    # Sin lease vigente de ningún nodo
+    LEASE_FREE = "(lease_expires IS NULL OR lease_expires < ?)"
+    PENDING_COLUMNS = "id, title, url, video_id, filepath, part_path, bytes_done, total_bytes"
+
+    def iter_pending_videos(self, playlist_id, page_size=200, after_id=0, now=None):
+        """Videos pendientes que ya vencieron su backoff, paginados por id (keyset).
+
+        Cada fila: (id, title, url, video_id, filepath, part_path, bytes_done, total_bytes).
+        Se omiten los que otro nodo tiene reclamados (lease vigente).
+        """
+        now = time.time() if now is None else now
+        self.flush() # Una vez por recorrido: los estados que acaban de escribir los workers
+        while True:
+            page = self._read(f'''
+                SELECT {self.PENDING_COLUMNS} FROM videos
+                WHERE playlist_id = ? AND status NOT IN ('COMPLETED', 'DOWNLOADED') AND id > ? AND {self.DUE} AND {self.LEASE_FREE}
+                ORDER BY id LIMIT ?
+            ''', (playlist_id, after_id, now, now, page_size))
+            if not page: return
+            yield from page
+            after_id = page[-1][0]
+
+    def count_pending_videos(self, playlist_id, after_id=0, now=None):
+        now = time.time() if now is None else now
+        return self._read(f"SELECT COUNT(*) FROM videos WHERE playlist_id = ? AND status NOT IN ('COMPLETED', 'DOWNLOADED') AND id > ? AND {self.DUE} AND {self.LEASE_FREE}",
+                          (playlist_id, after_id, now, now), fresh=True)[0][0]
+
+    # --- LEASES (reparto de la cola entre nodos) ---
+    # UPDATE ... RETURNING existe desde SQLite 3.35; antes se emula con SELECT + UPDATE
+    HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+    def _update_returning(self, cursor, assign, assign_params, where, where_params, columns="id", limit=None):
+        """UPDATE videos SET assign sobre las filas que cumplen where; devuelve columns de esas filas, por id.
+
+        Sin RETURNING se lee y luego se actualiza en la misma transacción: el escritor la
+        abre con BEGIN IMMEDIATE, así que ningún otro proceso escribe entremedio.
+        """
+        select = f"SELECT id FROM videos WHERE {where} ORDER BY id" + (" LIMIT ?" if limit else "")
+        select_params = (*where_params, limit) if limit else tuple(where_params)
+        if self.HAS_RETURNING:
+            return sorted(cursor.execute(f"UPDATE videos SET {assign} WHERE id IN ({select}) RETURNING {columns}",
+                                         (*assign_params, *select_params)).fetchall())
+        ids = [row[0] for row in cursor.execute(select, select_params).fetchall()]
+        if not ids: return []
+        marks = ",".join("?" * len(ids))
+        cursor.execute(f"UPDATE videos SET {assign} WHERE id IN ({marks})", (*assign_params, *ids))
+        return cursor.execute(f"SELECT {columns} FROM videos WHERE id IN ({marks}) ORDER BY id", ids).fetchall()
+
+    def claim_videos(self, owner, playlist_id, limit, until, now):
+        """Reclama de forma atómica hasta limit videos pendientes y sin lease vigente."""
+        return self._write(lambda cursor: self._update_returning(
+            cursor, "lease_owner = ?, lease_expires = ?", (owner, until),
+            f"playlist_id = ? AND status NOT IN ('COMPLETED', 'DOWNLOADED') AND {self.DUE} AND {self.LEASE_FREE}",
+            (playlist_id, now, now), columns=self.PENDING_COLUMNS, limit=limit), wait=True)
+
+    def acquire_leases(self, owner, ids, until, now):
+        """Toma las filas indicadas si están libres, vencidas o ya eran de owner. Devuelve los ids obtenidos."""
+        ids = list(ids)
+        if not ids: return set()
+        marks = ",".join("?" * len(ids))
+        return {row[0] for row in self._write(lambda cursor: self._update_returning(
+            cursor, "lease_owner = ?, lease_expires = ?", (owner, until),
+            f"id IN ({marks}) AND (lease_owner = ? OR {self.LEASE_FREE})", (*ids, owner, now)), wait=True)}
+
+    def renew_leases(self, owner, ids, until):
+        """Extiende los leases que siguen siendo de owner. Devuelve esos ids."""
+        ids = list(ids)
+        if not ids: return set()
+        marks = ",".join("?" * len(ids))
+        return {row[0] for row in self._write(lambda cursor: self._update_returning(
+            cursor, "lease_expires = ?", (until,), f"id IN ({marks}) AND lease_owner = ?", (*ids, owner)), wait=True)}
+
+    def release_leases(self, owner, ids):
+        """Libera los leases de owner. Un DOWNLOADED lo conserva: su archivo de staging es local al nodo."""
+        ids = list(ids)
+        if not ids: return
+        marks = ",".join("?" * len(ids))
+        self._write(lambda cursor: cursor.execute(f'''
+            UPDATE videos SET lease_owner = NULL, lease_expires = NULL
+            WHERE id IN ({marks}) AND lease_owner = ? AND status != 'DOWNLOADED'
+        ''', (*ids, owner)))
+
+    def next_retry_at(self, playlist_id):
+        """Momento (epoch) del próximo reintento programado en la playlist, o None."""
+        return self._read('''
+            SELECT MIN(next_attempt_at) FROM videos
+            WHERE playlist_id = ? AND status = 'ERROR' AND error_class != 'PERMANENT' AND next_attempt_at IS NOT NULL
+        ''', (playlist_id,), fresh=True)[0][0]
+
+    def get_staged_videos(self, playlist_id):
+        """Videos ya descargados en staging que quedaron pendientes de conversión."""
+        return self._read("SELECT id, title, video_id, staging_path, meta_json FROM videos WHERE playlist_id = ? AND status = 'DOWNLOADED'", (playlist_id,), fresh=True)
+
     def get_completed_videos(self, playlist_id):
         """Para verificar si existen físicamente."""
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id, filepath FROM videos WHERE playlist_id = ? AND status = 'COMPLETED'", (playlist_id,))
-        return cursor.fetchall()
+        return self._read("SELECT id, filepath FROM videos WHERE playlist_id = ? AND status = 'COMPLETED'", (playlist_id,), fresh=True)
+
+    def iter_completed_videos(self, playlist_id=None, page_size=500, after_id=0):
+        """(id, filepath, filesize, meta_json) de los COMPLETED, paginados por id; sin playlist_id, de todas."""
+        scope = "AND playlist_id = ?" if playlist_id is not None else ""
+        extra = (playlist_id,) if playlist_id is not None else ()
+        self.flush()
+        while True:
+            page = self._read(f'''
+                SELECT id, filepath, filesize, meta_json FROM videos
+                WHERE status = 'COMPLETED' AND id > ? {scope}
+                ORDER BY id LIMIT ?
+            ''', (after_id, *extra, page_size))
+            if not page: return
+            yield from page
+            after_id = page[-1][0]
+
+    def iter_loudness_candidates(self, playlist_id=None, page_size=200, after_id=0):
+        """(id, filepath, loudness_mtime_ns) de los COMPLETED, paginados por id; sin playlist_id, de todas."""
+        scope = "AND playlist_id = ?" if playlist_id is not None else ""
+        extra = (playlist_id,) if playlist_id is not None else ()
+        self.flush()
+        while True:
+            page = self._read(f'''
+                SELECT id, filepath, loudness_mtime_ns FROM videos
+                WHERE status = 'COMPLETED' AND id > ? {scope}
+                ORDER BY id LIMIT ?
+            ''', (after_id, *extra, page_size))
+            if not page: return
+            yield from page
+            after_id = page[-1][0]
+
+    def save_loudness(self, db_id, lufs, peak, filesize, mtime_ns):
+        """Resultado del análisis; filesize cambia al escribir las etiquetas ReplayGain."""
+        self._write(lambda cursor: cursor.execute('''
+            UPDATE videos SET loudness_lufs = ?, loudness_peak = ?, loudness_mtime_ns = ?, filesize = ? WHERE id = ?
+        ''', (lufs, peak, mtime_ns, filesize, db_id)))
 
     def update_video_status(self, db_id, status, error_msg="", filepath=""):
-        cursor = self.conn.cursor()
         # Actualizamos también el filepath real
-        cursor.execute('''
+        self._write(lambda cursor: cursor.execute('''
             UPDATE videos SET status = ?, error_msg = ?, filepath = ? WHERE id = ?
-        ''', (status, error_msg, filepath, db_id))
-        self.conn.commit()
\ No newline at end of file
+        ''', (status, error_msg, filepath, db_id)))
+
+    def mark_completed(self, db_id, filepath, filesize=None):
+        """Archivo final en su sitio: se guarda la ruta y el tamaño reales."""
+        self._write(lambda cursor: cursor.execute('''
+            UPDATE videos SET status = 'COMPLETED', error_msg = '', filepath = ?, filesize = ? WHERE id = ?
+        ''', (filepath, filesize, db_id)))
+
+    def update_filesize(self, db_id, filesize):
+        """Tamaño aceptado tras un cambio externo comprobado (ej. etiquetas editadas)."""
+        self._write(lambda cursor: cursor.execute("UPDATE videos SET filesize = ? WHERE id = ?", (filesize, db_id)))
+
+    def reset_broken(self, db_id, filepath, reason):
+        """Devuelve a la cola un COMPLETED cuyo archivo falta o está dañado."""
+        def op(cursor):
+            cursor.execute('''
+                UPDATE videos SET status = 'PENDING', error_msg = ?, filepath = NULL, filesize = NULL,
+                    error_class = NULL, attempt_count = 0, next_attempt_at = NULL
+                WHERE id = ?
+            ''', (reason, db_id))
+            cursor.execute("DELETE FROM stat_cache WHERE filepath = ?", (filepath,))
+            cursor.execute("DELETE FROM content_store WHERE filepath = ?", (filepath,))
+            cursor.execute("DELETE FROM file_index WHERE filepath = ?", (filepath,))
+        self._write(op)
+
+    def mark_downloaded(self, db_id, staging_path, meta_json):
+        """Etapa 1 terminada: el audio original está en staging esperando conversión."""
+        self._write(lambda cursor: cursor.execute('''
+            UPDATE videos SET status = 'DOWNLOADED', staging_path = ?, meta_json = ?,
+                error_class = NULL, attempt_count = 0, next_attempt_at = NULL,
+                part_path = NULL, bytes_done = NULL, total_bytes = NULL
+            WHERE id = ?
+        ''', (staging_path, meta_json, db_id)))
+
+    def update_partial(self, db_id, part_path, bytes_done, total_bytes):
+        """Progreso de una descarga en curso (se escribe a intervalos, no en cada bloque)."""
+        self._write(lambda cursor: cursor.execute(
+            "UPDATE videos SET part_path = ?, bytes_done = ?, total_bytes = ? WHERE id = ?",
+            (part_path, bytes_done, total_bytes, db_id)))
+
+    def clear_partial(self, db_id):
+        self.update_partial(db_id, None, None, None)
+
+    def get_scratch_refs(self):
+        """[(staging_path, part_path)] de los archivos de staging que alguna fila todavía puede usar."""
+        return self._read('''
+            SELECT CASE WHEN status = 'DOWNLOADED' THEN staging_path END,
+                   CASE WHEN status NOT IN ('COMPLETED', 'DOWNLOADED') THEN part_path END
+            FROM videos WHERE (status = 'DOWNLOADED' AND staging_path IS NOT NULL)
+                OR (status NOT IN ('COMPLETED', 'DOWNLOADED') AND part_path IS NOT NULL)
+        ''', fresh=True)
+
+    def get_partials(self, playlist_id):
+        """[(id, status, part_path)] de los videos con una descarga a medias registrada."""
+        return self._read("SELECT id, status, part_path FROM videos WHERE playlist_id = ? AND part_path IS NOT NULL", (playlist_id,), fresh=True)
+
+    def record_failure(self, db_id, error_class, error_msg, next_attempt_at=None):
+        """Marca un intento fallido. Con next_attempt_at=None (PERMANENT) no se vuelve a intentar."""
+        self._write(lambda cursor: cursor.execute('''
+            UPDATE videos SET status = 'ERROR', error_class = ?, error_msg = ?, next_attempt_at = ?,
+                attempt_count = COALESCE(attempt_count, 0) + 1
+            WHERE id = ?
+        ''', (error_class, error_msg, next_attempt_at, db_id)))
+
+    def get_attempt_count(self, db_id):
+        return self._read("SELECT COALESCE(attempt_count, 0) FROM videos WHERE id = ?", (db_id,), fresh=True)[0][0]
+
+    # --- MÉTODOS DEL ÍNDICE DE ARCHIVOS ---
+    def get_folder_mtime(self, folder):
+        """Devuelve el mtime (ns) registrado de la carpeta o None si nunca se indexó."""
+        rows = self._read("SELECT mtime_ns FROM indexed_folders WHERE folder = ?", (folder,), fresh=True)
+        return rows[0][0] if rows else None
+
+    def load_file_index(self, folder):
+        """Devuelve {video_id: filepath} para una carpeta."""
+        return {row[0]: row[1] for row in self._read("SELECT video_id, filepath FROM file_index WHERE folder = ?", (folder,), fresh=True)}
+
+    def update_file_index(self, folder, mtime_ns, added, removed):
+        """Aplica los cambios de un escaneo: {video_id: filepath} nuevos y video_ids desaparecidos."""
+        rows = [(vid_id, folder, fpath) for vid_id, fpath in added.items()]
+        gone = [(folder, vid_id) for vid_id in removed]
+
+        def op(cursor):
+            cursor.executemany("DELETE FROM file_index WHERE folder = ? AND video_id = ?", gone)
+            cursor.executemany("INSERT OR REPLACE INTO file_index (video_id, folder, filepath) VALUES (?, ?, ?)", rows)
+            cursor.execute("INSERT OR REPLACE INTO indexed_folders (folder, mtime_ns) VALUES (?, ?)", (folder, mtime_ns))
+        self._write(op)
+
+    def add_file_index_entry(self, folder, video_id, filepath, mtime_ns=None):
+        """Registra un archivo recién descargado en el índice (y el mtime que dejó en la carpeta)."""
+        def op(cursor):
+            cursor.execute("INSERT OR REPLACE INTO file_index (video_id, folder, filepath) VALUES (?, ?, ?)",
+                           (video_id, folder, filepath))
+            if mtime_ns is not None:
+                cursor.execute("INSERT OR REPLACE INTO indexed_folders (folder, mtime_ns) VALUES (?, ?)", (folder, mtime_ns))
+        self._write(op)
+
+    # --- ALMACÉN DE CONTENIDO ---
+    def get_content(self, video_id, fmt, bitrate):
+        """Devuelve (filepath, info_json) de una conversión ya hecha en cualquier playlist, o None."""
+        rows = self._read("SELECT filepath, info_json FROM content_store WHERE video_id = ? AND format = ? AND bitrate = ?",
+                          (video_id, fmt, bitrate))
+        return rows[0] if rows else None
+
+    def add_content(self, video_id, fmt, bitrate, filepath, info_json):
+        self._write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO content_store (video_id, format, bitrate, filepath, info_json) VALUES (?, ?, ?, ?, ?)",
+            (video_id, fmt, bitrate, filepath, info_json)))
+
+    def remove_content(self, video_id, fmt, bitrate):
+        """Olvida una entrada cuyo archivo ya no existe."""
+        self._write(lambda cursor: cursor.execute(
+            "DELETE FROM content_store WHERE video_id = ? AND format = ? AND bitrate = ?", (video_id, fmt, bitrate)))
+
+    # --- CACHÉ DE VERIFICACIÓN ---
+    def get_stat_cache(self, filepaths):
+        """{filepath: (size, mtime_ns, duration)} de las rutas pedidas."""
+        cached = {}
+        filepaths = list(filepaths)
+        for start in range(0, len(filepaths), 500): # Límite de parámetros de SQLite
+            part = filepaths[start:start + 500]
+            marks = ",".join("?" * len(part))
+            for row in self._read(f"SELECT filepath, size, mtime_ns, duration FROM stat_cache WHERE filepath IN ({marks})", part):
+                cached[row[0]] = row[1:]
+        return cached
+
+    def save_stat_cache(self, filepath, size, mtime_ns, duration):
+        self._write(lambda cursor: cursor.execute(
+            "INSERT OR REPLACE INTO stat_cache (filepath, size, mtime_ns, duration, checked_at) VALUES (?, ?, ?, ?, ?)",
+            (filepath, size, mtime_ns, duration, time.time())))
+
+    # --- MÉTRICAS ---
+    def add_metric(self, run_id, video_db_id, stage, seconds, nbytes=0):
+        self._write(lambda cursor: cursor.execute(
+            "INSERT INTO video_metrics (run_id, video_db_id, stage, seconds, bytes, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (run_id, video_db_id, stage, seconds, nbytes, time.time())))
+
+    def get_run_metrics(self, run_id):
+        """Devuelve [(stage, segundos, mediciones, bytes)] de una ejecución."""
+        return self._read('''
+            SELECT stage, SUM(seconds), COUNT(*), SUM(bytes) FROM video_metrics
+            WHERE run_id = ? GROUP BY stage ORDER BY SUM(seconds) DESC
+        ''', (run_id,), fresh=True)
\ No newline at end of file
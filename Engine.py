@@ -1,171 +1,1041 @@
 import yt_dlp
-from yt_dlp.utils import DownloadError
+from yt_dlp.utils import DownloadError, DownloadCancelled
 import os
+import re
 import time
-import random
-from Logger import ConsoleLogger
+import queue
+import threading
+import json
+import uuid
+import functools
+import importlib.util
+import hashlib
+import shutil
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait
+from Logger import ConsoleLogger, YTDLP_PROGRESS_KEY
+from Metrics import RunMetrics
+from Control import RunControl
 from Database import DatabaseManager
+from FileIndex import FileIndex
+from ContentStore import content_key, name_info, link_into, publish
+from Transcoder import transcode_job, tags_from_info, format_selector, can_copy
+from YdlPool import YdlPool
+from RateLimiter import AdaptiveThrottle, retry_after_from_error
+from Prefetch import MetadataPrefetcher
+from Leases import LEASE_SECONDS, default_node_id
+import Retry
+from Ingest import IngestState, iter_chunks, slim_entry, KNOWN_RUN, CACHE_MAX_ENTRIES
+
+# Temporales de yt-dlp en staging: X.part, X.part-FragN(.part) y X.ytdl (grupo 1 = X)
+PARTIAL_RE = re.compile(r'^(.*?)\.(?:part|ytdl)(?:-Frag\d+(?:\.part)?)?$')
+# Nombre de staging: %(id)s.f%(format_id)s.%(ext)s(.part)
+STAGING_FORMAT_RE = re.compile(r'\.f([^.]+)\.[^.]+\.part$')
+# Salida de ffmpeg en staging a la espera de publicarse (ver _make_transcode_job). Grupo 1: escritura a
+# medias, de ffmpeg (.tmp) o del remux que agrega las etiquetas ReplayGain (.rg, ver Loudness.write_tags)
+SCRATCH_OUT_RE = re.compile(r'\.out\d*(\.rg|\.tmp)?\.[^.]+$')
+MAX_URL_HOPS = 5 # Redirecciones (_type url) que se siguen al leer una playlist
 
 class DownloadEngine:
-    def __init__(self, log_callback):
+    PROGRESS_INTERVAL = 0.5 # Segundos mínimos entre actualizaciones de progreso por video
+    POLL_INTERVAL = 0.2 # Tope de espera en colas y semáforos antes de revisar la orden de parada
+    PARTIAL_INTERVAL = 2.0 # Segundos entre registros en la DB del avance de un .part
+    SPACE_WAIT = 300.0 # Segundos que un worker espera a que se libere espacio en staging
+    SCRATCH_MAX_AGE = 24 * 3600.0 # Un temporal sin referencias y sin tocar desde hace tanto ya no es de nadie
+
+    def __init__(self, log_callback, progress_callback=None, db=None, throttle=None, download_slots=None,
+                 leases=None, node_id=None):
         self.log = log_callback
-        self.stop_flag = False
-        self.db = DatabaseManager()
-        self.is_paused_by_limit = False
+        self.progress = progress_callback or (lambda key, text: None)
+        # Parada, pausa y salto: todas las esperas del motor se despiertan con estas órdenes
+        self.control = RunControl()
+        # db, throttle y download_slots se comparten cuando varios motores corren a la vez (Cli.py)
+        self.owns_db = db is None
+        self.db = db or DatabaseManager(log_callback=log_callback)
+        self.file_index = FileIndex(self.db)
+        # Ritmo adaptativo (AIMD) con estado persistido en settings
+        # Uno compartido (Cli.py) lleva los contadores de todo el proceso: lo reinicia su dueño
+        self.owns_throttle = throttle is None
+        self.throttle = throttle or AdaptiveThrottle(self.db)
+        self.download_slots = download_slots # Semáforo global de descargas simultáneas
+        # Con un almacén de leases (Leases.py) la cola se reparte con otros nodos
+        self.leases = leases
+        self.node_id = node_id or default_node_id()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        # Instancias de YoutubeDL reutilizables; los hooks de progreso se enrutan por hilo
+        self.ydl_pool = YdlPool(self._new_ydl, keep_on=(DownloadError, DownloadCancelled))
+        self._local = threading.local()
+        self.metrics = None # Tiempos por etapa de la ejecución en curso
+        # Videos despachados y aún sin resolver (el repaso de reintentos no los vuelve a encolar)
+        self.inflight = set()
+        self.inflight_cv = threading.Condition()
+        self.retry_scheduled = set() # Fallos transitorios de esta ejecución aún sin éxito
+        self.prefetcher = None # Extracción anticipada de los videos ya encolados (Prefetch.py)
+
+    @property
+    def stop_flag(self):
+        return self.control.stopped
 
     def request_stop(self):
-        self.stop_flag = True
-        self.is_paused_by_limit = False 
+        self.control.stop()
+
+    def pause(self):
+        """Corta las descargas activas (el .part queda en disco) y no empieza otras hasta resume()."""
+        self.control.pause()
+
+    def resume(self):
+        self.control.resume()
+
+    @property
+    def paused(self):
+        return self.control.paused
+
+    def skip(self, db_id=None):
+        """Salta un video en esta ejecución (sin db_id, los que se están descargando)."""
+        return self.control.skip(db_id)
+
+    def close(self):
+        """Libera las instancias de YoutubeDL (cookies, conexiones) y confirma las escrituras pendientes."""
+        self.ydl_pool.close()
+        if self.owns_db:
+            self.db.close()
+
+    def _new_ydl(self, opts):
+        opts = dict(opts)
+        opts['logger'] = ConsoleLogger(self.log, self.progress)
+        opts['progress_hooks'] = [self._dispatch_progress]
+        return yt_dlp.YoutubeDL(opts)
+
+    def _dispatch_progress(self, d):
+        # Cada hilo instala el hook del video que está descargando
+        hook = getattr(self._local, 'progress_hook', None)
+        if hook: hook(d)
+
+    def _count(self, key):
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def summary(self):
+        """Resumen legible por máquina de la última ejecución."""
+        with self.stats_lock:
+            result = {key: self.stats[key] for key in ('completed', 'failed', 'skipped')}
+            result['cpu_saved_s'] = self._cpu_saved()
+            return result
+
+    def _cpu_saved(self):
+        """CPU que ahorraron las copias sin recodificar; None si hubo copias pero nunca se midió una recodificación."""
+        if not self.stats['copied_audio']:
+            return 0
+        if self.cpu_ratio is None:
+            return None
+        return round(max(0.0, self.stats['copied_audio'] * self.cpu_ratio - self.stats['copied_cpu']), 1)
 
     def run(self, url, path, config):
-        self.stop_flag = False
+        """Sincroniza y descarga una playlist. Devuelve el resumen (completados, fallidos, omitidos)."""
+        self.control.reset()
+        with self.stats_lock:
+            self.stats = Counter()
+            self.retry_scheduled = set()
+        self.metrics = RunMetrics(self.db, uuid.uuid4().hex[:12])
+        # Costo aprendido de recodificar (s de CPU por s de audio) para estimar lo que ahorra la copia.
+        # None hasta la primera recodificación medida: sin él, el ahorro no se informa
+        ratio = self.db.load_settings().get('transcode_cpu_ratio')
+        self.cpu_ratio = float(ratio) if ratio else None
+        # NumPy (Loudness.py) solo se importa en los procesos de conversión que lo usan
+        self.loudness_ok = importlib.util.find_spec('numpy') is not None
+        if config.get('replaygain') and not self.loudness_ok:
+            self.log("⚠️ ReplayGain desactivado: falta NumPy.")
         cookie = config.get('cookie_path')
-        name_template = config.get('name_template', '%(title)s')
         
-        # 1. Extracción (Flat)
-        ydl_opts_list = { 'extract_flat': True, 'quiet': True, 'ignoreerrors': True }
+        # 1. Extracción (Flat) en streaming: las entradas llegan a la DB por bloques
+        ydl_opts_list = { 'extract_flat': True, 'lazy_playlist': True, 'quiet': True, 'ignoreerrors': True }
         if cookie: ydl_opts_list['cookiefile'] = cookie
 
-        playlist_id = None
-        
+        self.log("--- SINCRONIZANDO CON BASE DE DATOS... ---")
+        ingest = IngestState()
+        ingest_thread = threading.Thread(target=self._ingest, args=(url, ydl_opts_list, ingest, config), daemon=True)
+        ingest_thread.start()
+
+        playlist_id = ingest.wait_ready()
+        if playlist_id is None:
+            self.log(f"Error al analizar URL: {ingest.error}")
+            return self.summary()
+
+        # 2. Descarga + conversión + publicación (pipeline de tres etapas)
+        # Se empieza a descargar en cuanto aterriza el primer bloque de la playlist
+        # Subcarpeta por playlist: dos playlists con el mismo video no comparten archivos temporales
+        scratch = self._scratch_root(config)
+        self._sweep_scratch(scratch)
+        staging = os.path.join(scratch, f"pl{playlist_id}")
+        lease_s = float(config.get('lease_seconds') or LEASE_SECONDS)
+        if self.leases:
+            # Cada nodo con su staging: los .part de otro nodo no son huérfanos
+            staging = os.path.join(staging, self.node_id)
+            self.log(f"🤝 Nodo {self.node_id}: cola compartida con leases de {lease_s:.0f} s.")
+        staged_jobs = self._resume_staged(playlist_id, path, config, lease_s)
+        if staged_jobs:
+            self.log(f"♻️ Reanudando {len(staged_jobs)} conversiones interrumpidas.")
+        self._clean_partials(playlist_id, staging)
+        os.makedirs(staging, exist_ok=True)
+        reserve = float(config.get('staging_reserve_mb', 512)) * 1048576
+
+        if self.owns_throttle:
+            self.throttle.start_run()
+
+        # Un único escaneo de la carpeta (solo si cambió desde la última vez)
+        with self.metrics.stage('scan'):
+            refreshed = self.file_index.refresh(path)
+        if refreshed:
+            self.log("📇 Índice de archivos actualizado.")
+
+        concurrency = max(1, int(config.get('concurrency', 1) or 1))
+        transcoders = max(1, int(config.get('transcode_workers') or os.cpu_count() or 1))
+        if concurrency > 1:
+            self.log(f"⚙️ Descargas simultáneas: {concurrency}")
+
+        # Cola acotada hacia los workers: la cola pendiente se lee de la DB por páginas
+        # Lo que espera en ella es lo que se extrae por adelantado (prefetch = N videos)
+        lookahead = max(0, int(config.get('prefetch', 4) or 0))
+        work_queue = queue.Queue(maxsize=max(concurrency * 2, lookahead))
+        # Cola acotada entre etapas: si ffmpeg se atrasa, la red espera
+        transcode_queue = queue.Queue(maxsize=transcoders * 2)
+        # Pocas copias a la vez hacia el destino (puede ser una carpeta de red)
+        publishers = max(1, int(config.get('publish_workers', 2) or 1))
+        publish_queue = queue.Queue(maxsize=publishers * 2)
+
+        cpu_pool = ProcessPoolExecutor(max_workers=transcoders)
+        heartbeat_done = threading.Event()
+        if lookahead:
+            prefetch_opts = {'quiet': True, 'no_warnings': True}
+            if cookie: prefetch_opts['cookiefile'] = cookie
+            self.prefetcher = MetadataPrefetcher(
+                self.ydl_pool, prefetch_opts, workers=min(lookahead, concurrency),
+                ttl=float(config.get('prefetch_ttl', 20)) * 60, metrics=self.metrics,
+                should_defer=lambda: self.throttle.cooldown_remaining() > 0, throttle=self.throttle)
         try:
-            self.log("--- SINCRONIZANDO CON BASE DE DATOS... ---")
-            with yt_dlp.YoutubeDL(ydl_opts_list) as ydl:
-                info = ydl.extract_info(url, download=False)
-                pl_title = info.get('title', 'Lista Sin Titulo')
+            with ThreadPoolExecutor(max_workers=2 + concurrency + transcoders + publishers) as pool:
+                if self.leases:
+                    pool.submit(self._heartbeat, lease_s, heartbeat_done)
+                publishing = [pool.submit(self._publisher, publish_queue, path) for _ in range(publishers)]
+                feeders = [pool.submit(self._transcode_feeder, transcode_queue, cpu_pool, publish_queue)
+                           for _ in range(transcoders)]
+                try:
+                    for job in staged_jobs:
+                        if not self._stage_put(transcode_queue, job): break
+
+                    retry_window = float(config.get('retry_window', Retry.RETRY_WINDOW))
+                    feed = functools.partial(self._feed_leased, lease_s=lease_s) if self.leases else self._feed_pending
+                    dispatcher = pool.submit(self._dispatch, feed, playlist_id, ingest, work_queue, concurrency,
+                                             retry_window, lambda item: self._prefetch(item, path, config))
+                    workers = [pool.submit(self._worker, work_queue, transcode_queue, staging, path, config, reserve)
+                               for _ in range(concurrency)]
+                    for w in workers:
+                        w.result()
+                    dispatched = dispatcher.result()
+                finally:
+                    # Fin de la etapa de red, o un fallo arriba: sin los centinelas, los feeders, los
+                    # publicadores y el latido esperarían para siempre y el pool no se cerraría
+                    for _ in feeders:
+                        if not self._stage_put(transcode_queue, None): break
+                    wait(feeders)
+                    # Lo ya convertido se publica aunque se haya pedido parar
+                    for _ in publishing:
+                        publish_queue.put(None)
+                    wait(publishing)
+                    heartbeat_done.set()
+                for future in feeders + publishing:
+                    future.result()
+        finally:
+            heartbeat_done.set()
+            # Nadie más la actualiza: sin esto la última línea de yt-dlp queda en pantalla
+            self.progress(YTDLP_PROGRESS_KEY, None)
+            # Lo despachado que ningún worker llegó a tomar (parada) no debe bloquear la próxima ejecución
+            with self.inflight_cv:
+                unresolved = list(self.inflight)
+                self.inflight.clear()
+            if self.leases and unresolved:
+                # Lo reclamado que no llegó a resolverse vuelve al resto de nodos
+                self.leases.release(self.node_id, unresolved)
+            # Con la parada pedida no se espera a ffmpeg: lo no iniciado se cancela y sigue en staging
+            cpu_pool.shutdown(wait=not self.stop_flag, cancel_futures=True)
+            if self.prefetcher:
+                prefetch_stats = (self.prefetcher.hits, self.prefetcher.misses, self.prefetcher.expired)
+                self.prefetcher.close()
+                self.prefetcher = None
+
+        # Tras una parada la ingesta termina sola en su próximo bloque; no se la espera
+        if not self.stop_flag:
+            ingest_thread.join()
+        if ingest.error:
+            self.log(f"⚠️ La lectura de la playlist terminó con error: {ingest.error}")
+        if dispatched == 0 and not staged_jobs and not self.stop_flag:
+            self.log("¡Todos los videos registrados están marcados como completados!")
+
+        if self.stop_flag:
+            stopped_in = time.perf_counter() - self.control.stop_requested
+            self.log(f"⛔ DETENIDO POR USUARIO (parada efectiva en {stopped_in:.2f} s).")
+        with self.stats_lock:
+            # Lo que quedó programado para más tarde cuenta como fallido en esta ejecución
+            self.stats['failed'] += len(self.retry_scheduled)
+        if self.retry_scheduled:
+            self.log(f"🔁 {len(self.retry_scheduled)} videos quedaron en la cola de reintentos.")
+        if lookahead and any(prefetch_stats):
+            self.log("🔭 Extracción anticipada: %d aprovechadas, %d sin anticipar, %d caducadas." % prefetch_stats)
+        if self.stats['copied']:
+            saved = self._cpu_saved()
+            detail = f"~{saved:.0f} s de CPU ahorrados" if saved is not None else "ahorro de CPU sin estimar: aún no se midió ninguna recodificación"
+            self.log(f"⚡ Sin recodificar: {self.stats['copied']} videos ({detail}).")
+        if self.cpu_ratio is not None:
+            self.db.save_setting('transcode_cpu_ratio', f"{self.cpu_ratio:.5f}")
+
+        t = self.throttle
+        self.log(f"📈 Rendimiento: {t.items_per_hour():.0f} items/hora "
+                 f"(intervalo {t.interval:.2f} s, 429 recibidos: {t.rate_limits})")
+
+        self.metrics.finish()
+        self.log(self.metrics.summary())
+        if config.get('metrics_path'):
+            try:
+                self.metrics.write_prometheus(config['metrics_path'], self.summary(), playlist_id)
+            except OSError as e:
+                self.log(f"⚠️ No se pudieron exportar las métricas: {e}")
+
+        self.log("\n--- TAREA FINALIZADA ---")
+        return self.summary()
+
+    def _ingest(self, url, opts, state, config):
+        """Hilo de ingesta: recorre las entradas planas y las guarda en bloques de tamaño fijo."""
+        started = time.perf_counter()
+        try:
+            # Incremental solo si la playlist ya tuvo una sincronización completa
+            known = self.db.get_playlist(url)
+            stop_after = int(config.get('known_run') or KNOWN_RUN) if config.get('incremental') and known and known[1] else 0
+            ttl = float(config.get('cache_ttl', 10)) * 60
+
+            cached = self.db.get_cached_extraction(url, ttl) if ttl > 0 else None
+            if cached:
+                pl_title, entries = cached
                 playlist_id = self.db.get_or_create_playlist(url, pl_title)
-                
-                entries = info.get('entries', [info]) if 'entries' in info else [info]
-                added = self.db.add_videos_to_playlist(playlist_id, list(entries))
-                self.log(f"Nuevos videos en cola: {added}")
+                state.set_playlist(playlist_id)
+                stats = self._ingest_entries(playlist_id, entries, state, stop_after, None)
+                source = "caché"
+            else:
+                with self.ydl_pool.get(opts) as ydl:
+                    # process=False deja 'entries' como generador: nada se materializa de golpe
+                    info = self._follow_url_results(ydl, ydl.extract_info(url, download=False, process=False))
+                    pl_title = info.get('title', 'Lista Sin Titulo')
+                    playlist_id = self.db.get_or_create_playlist(url, pl_title)
+                    state.set_playlist(playlist_id)
+
+                    entries = info['entries'] if 'entries' in info else [info]
+                    to_cache = [] if ttl > 0 else None
+                    stats = self._ingest_entries(playlist_id, entries, state, stop_after, to_cache)
+                if stats['complete'] and to_cache is not None and len(to_cache) <= CACHE_MAX_ENTRIES:
+                    self.db.save_extraction(url, pl_title, to_cache)
+                source = "red"
 
+            if stats['complete']:
+                self.db.touch_playlist(playlist_id)
+            self.log(f"Entradas leídas ({source}): {stats['fetched']}, ya conocidas: {stats['fetched'] - state.added}")
+            if stats['stopped_early']:
+                self.log(f"⏩ Sincronización incremental: lectura detenida tras {stop_after} entradas conocidas seguidas.")
+            self.log(f"Nuevos videos en cola: {state.added}")
+            state.finish()
+        except Exception as e:
+            state.finish(error=e)
+        finally:
+            self.metrics.record('extract', time.perf_counter() - started)
+
+    def _follow_url_results(self, ydl, info):
+        """Sin procesar, un enlace watch?v=...&list=... o un handle de canal devuelve solo una
+        redirección (_type url); se sigue hasta la lista (o el video) de verdad."""
+        for _ in range(MAX_URL_HOPS):
+            if info.get('_type') not in ('url', 'url_transparent'):
+                return info
+            outer = info
+            info = ydl.extract_info(outer['url'], download=False, process=False, ie_key=outer.get('ie_key'))
+            if outer.get('_type') == 'url_transparent' and outer.get('title'):
+                # En url_transparent los campos de la redirección tienen prioridad
+                info = {**info, 'title': outer['title']}
+        raise ValueError(f"Demasiadas redirecciones al resolver la URL ({MAX_URL_HOPS}).")
+
+    def _ingest_entries(self, playlist_id, entries, state, stop_after, to_cache):
+        """Guarda las entradas por bloques. Con stop_after > 0 corta al ver esa racha de IDs conocidos
+        (asume listas ordenadas de más reciente a más antigua, como las subidas de un canal)."""
+        stats = {'fetched': 0, 'stopped_early': False, 'complete': False}
+        run = 0
+        for chunk in iter_chunks(entries):
+            if self.stop_flag: return stats
+            chunk = [slim_entry(e) for e in chunk if e]
+            if stop_after:
+                known_ids = self.db.get_known_video_ids(playlist_id, [e['id'] for e in chunk])
+                for n, entry in enumerate(chunk):
+                    run = run + 1 if entry['id'] in known_ids else 0
+                    if run >= stop_after:
+                        chunk = chunk[:n + 1]
+                        stats['stopped_early'] = True
+                        break
+            stats['fetched'] += len(chunk)
+            if to_cache is not None and len(to_cache) <= CACHE_MAX_ENTRIES:
+                to_cache.extend(chunk)
+            state.chunk_landed(self.db.add_videos_to_playlist(playlist_id, chunk))
+            if stats['stopped_early']: break
+        # Una lectura cortada no es la lista entera: ni se cachea ni cuenta como sincronización completa
+        stats['complete'] = not stats['stopped_early']
+        return stats
+
+    def _dispatch(self, feed, playlist_id, ingest, work_queue, concurrency, *args):
+        """Corre el despachador y, pase lo que pase, deja un centinela por worker.
+
+        Un error (ej. 'database is locked' con varios procesos) se registra y termina la
+        etapa de red: lo ya despachado se procesa y run() vuelve. Devuelve None en ese caso.
+        """
+        try:
+            return feed(playlist_id, ingest, work_queue, concurrency, *args)
         except Exception as e:
-            self.log(f"Error al analizar URL: {e}")
+            self.log(f"❌ Error al repartir la cola: {e}")
+            return None
+        finally:
+            for _ in range(concurrency):
+                if not self._stage_put(work_queue, None): break
+
+    def _feed_pending(self, playlist_id, ingest, work_queue, concurrency, retry_window=Retry.RETRY_WINDOW, prefetch=None):
+        """Reparte la cola pendiente a los workers mientras la ingesta sigue agregando filas.
+
+        Solo se despachan los videos cuyo backoff ya venció. Al terminar la ingesta, si
+        algún reintento vence dentro de retry_window, se espera y se repasa la cola.
+        prefetch(item) se llama al encolar cada video, antes de que un worker lo tome.
+        """
+        dispatched = 0
+        last_id = 0
+        while not self.stop_flag:
+            # Se toma la marca de bloques antes de leer: así no se pierde uno que llegue entremedio
+            done = ingest.done
+            chunks = ingest.chunks
+            now = time.time()
+            total = dispatched + self.db.count_pending_videos(playlist_id, last_id, now)
+            for item in self.db.iter_pending_videos(playlist_id, after_id=last_id, now=now):
+                last_id = item[0]
+                with self.inflight_cv:
+                    if item[0] in self.inflight or self.control.is_skipped(item[0]): continue
+                    self.inflight.add(item[0])
+                if prefetch: prefetch(item)
+                if not self._stage_put(work_queue, (dispatched, max(total, dispatched + 1), item)):
+                    return dispatched
+                dispatched += 1
+            if not done:
+                ingest.wait_for_more(chunks)
+                continue
+            # Los videos en curso pueden programar reintentos: se espera a que terminen
+            if not self._wait_inflight() or not self._wait_next_retry(playlist_id, retry_window):
+                return dispatched
+            last_id = 0 # Repaso desde el principio: solo aparecen los que vencieron
+        return dispatched
+
+    def _feed_leased(self, playlist_id, ingest, work_queue, concurrency, retry_window=Retry.RETRY_WINDOW, prefetch=None,
+                     lease_s=LEASE_SECONDS):
+        """Como _feed_pending, pero cada lote se reclama con un lease y ningún otro nodo lo toma.
+
+        Se reclaman lotes chicos (concurrency videos) cuando la cola local tiene lugar, para
+        no acaparar trabajo que otro nodo podría hacer ya. Los leases de un nodo caído se
+        recuperan al vencer, en la próxima pasada de cualquier nodo.
+        """
+        dispatched = 0
+        while not self.stop_flag:
+            done = ingest.done
+            chunks = ingest.chunks
+            now = time.time()
+            batch = self.leases.claim(self.node_id, playlist_id, concurrency, lease_s, now)
+            if batch:
+                total = dispatched + len(batch) + self.db.count_pending_videos(playlist_id, 0, now)
+                with self.inflight_cv:
+                    self.inflight.update(item[0] for item in batch)
+                for item in batch:
+                    if prefetch: prefetch(item)
+                    if not self._stage_put(work_queue, (dispatched, total, item)):
+                        return dispatched
+                    dispatched += 1
+                continue
+            if not done:
+                ingest.wait_for_more(chunks)
+                continue
+            if not self._wait_inflight() or not self._wait_next_retry(playlist_id, retry_window):
+                return dispatched
+        return dispatched
+
+    def _heartbeat(self, lease_s, done):
+        """Renueva cada tercio de la vigencia los leases de lo que está en curso en este nodo."""
+        while not done.wait(lease_s / 3):
+            with self.inflight_cv:
+                held = set(self.inflight)
+            if not held: continue
+            try:
+                kept = self.leases.renew(self.node_id, held, lease_s, time.time())
+            except Exception as e:
+                self.log(f"⚠️ No se pudieron renovar los leases: {e}")
+                continue
+            # Perdido = venció y otro nodo lo reclamó: se salta para no descargarlo dos veces
+            for db_id in held - kept:
+                if self.control.is_skipped(db_id): continue
+                self.log(f"⚠️ Lease perdido del video {db_id}: lo tomó otro nodo, se salta.")
+                self.control.skip(db_id)
+
+    def _prefetch(self, item, path, config):
+        """Pide la extracción anticipada salvo que el video no vaya a descargarse."""
+        if not self.prefetcher: return
+        db_id, _, video_url, vid_id = item[:4]
+        existing = self.file_index.lookup(path, vid_id)
+        if existing and os.path.exists(existing): return
+        if self.db.get_content(vid_id, *content_key(config.get('format'), config.get('bitrate'))): return
+        self.prefetcher.submit(video_url)
+
+    def _wait_inflight(self):
+        """Espera a que los workers resuelvan lo despachado. False si se pidió parar."""
+        with self.inflight_cv:
+            while self.inflight and not self.stop_flag:
+                self.inflight_cv.wait(self.POLL_INTERVAL)
+        return not self.stop_flag
+
+    def _wait_next_retry(self, playlist_id, window):
+        """Espera el próximo reintento si vence dentro de la ventana. False si no hay o se pidió parar."""
+        due = self.db.next_retry_at(playlist_id)
+        if due is None or due - time.time() > window:
+            return False
+        self.log(f"🔁 Próximo reintento en {max(0, due - time.time()):.0f} s.")
+        return self.control.sleep(due - time.time())
+
+    def _resolve(self, db_id):
+        with self.inflight_cv:
+            self.inflight.discard(db_id)
+            self.inflight_cv.notify_all()
+        if self.leases:
+            self.leases.release(self.node_id, [db_id])
+
+    def _worker(self, work_queue, transcode_queue, staging, path, config, reserve=0):
+        """Toma videos de la cola compartida hasta recibir el centinela o la orden de parada."""
+        while not self.stop_flag:
+            try:
+                task = work_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if task is None:
+                return
+            i, total, item = task
+            job = None
+            try:
+                job = self._process_video(i, item, total, staging, path, config, reserve)
+                # Con trabajo de conversión, el video se resuelve en el feeder
+                if job and not self._stage_put(transcode_queue, job):
+                    job = None
+            except Exception as e:
+                self.log(f"❌ Error inesperado en worker: {e}")
+                self._fail(item[0], str(e))
+            finally:
+                if not job: self._resolve(item[0])
+
+    def _process_video(self, i, item, total, staging, path, config, reserve=0):
+        """Etapa de red: descarga el audio original a staging. Devuelve el trabajo de conversión."""
+        # item trae: (db_id, title, url, video_id, filepath_antiguo, part_path, bytes_done, total_bytes)
+        db_id, title, video_url, vid_id, old_path, part_path, bytes_done, total_bytes = item
+        cookie = config.get('cookie_path')
+
+        # --- VERIFICACIÓN DE ARCHIVO EXISTENTE (Lógica Anti-Duplicados) ---
+        # A veces la DB dice PENDING pero el archivo ya está ahí (crash anterior, etc.)
+        # El índice se alimenta del sufijo [%(id)s] que escribe outtmpl
+        existing = self.file_index.lookup(path, vid_id)
+        if existing and os.path.exists(existing):
+            self.log(f"✨ El archivo ya existe: {os.path.basename(existing)}. Marcando como completado.")
+            self.db.mark_completed(db_id, existing, os.path.getsize(existing))
+            self._count('skipped')
+            return None
+
+        # --- ALMACÉN GLOBAL: otra playlist ya lo convirtió con el mismo formato y bitrate ---
+        if self._reuse_content(db_id, vid_id, path, config):
+            return None
+
+        # --- ESPACIO EN STAGING: lo liberan las conversiones y publicaciones en curso ---
+        if not self._wait_for_space(staging, reserve):
+            if not self.stop_flag:
+                self._fail(db_id, f"Sin espacio libre en staging ({staging})")
+            return None
+
+        # --- DESCARGA A MEDIAS DE UNA EJECUCIÓN ANTERIOR ---
+        # Se fija el mismo formato para que yt-dlp encuentre el .part y pida el resto con Range
+        selector = format_selector(config.get('format'))
+        resume_format, resumed_from = self._resumable(part_path)
+        if resume_format:
+            done = f"{resumed_from * 100 / total_bytes:.0f}%" if total_bytes else f"{resumed_from / 1048576:.1f} MiB"
+            self.log(f"⏯ Retomando {title} desde {done}.")
+            selector = f"{resume_format}/{selector}"
+
+        ydl_opts_down = {
+            # Se prefiere un stream que ya esté en el códec destino (solo remux, sin recodificar)
+            'format': selector,
+            # En staging el nombre solo depende del ID y del formato elegido
+            'outtmpl': os.path.join(staging, '%(id)s.f%(format_id)s.%(ext)s'),
+            'continuedl': True, 'nopart': False,
+            'quiet': True, 'no_warnings': True,
+        }
+        if cookie: ydl_opts_down['cookiefile'] = cookie
+
+        # Un único intento: los fallos van a la cola de reintentos persistente (Retry.py).
+        # Solo se repite si la pausa cortó la descarga; se retoma desde el .part
+        use_prefetch = self.prefetcher is not None
+        while True:
+            if self.control.is_skipped(db_id):
+                self.log(f"⏭ Saltado: {title}")
+                self._count('skipped')
+                return None
+            if not self.control.wait_resumed(): return None
+
+            # --- MANEJO DE RATE LIMIT ---
+            # Info extraída mientras el video esperaba en la cola (se espera si está en curso).
+            # Solo en el primer intento: tras una pausa se vuelve a extraer
+            info = self.prefetcher.take(video_url, self.control.wait_future) if use_prefetch else None
+            use_prefetch = False
+            # Turno global: respeta el intervalo adaptativo y el enfriamiento tras un 429.
+            # Una extracción anticipada ya gastó el suyo
+            if info is None and not self._acquire_slot(db_id): return None
+
+            self.log(f"\n[{i+1}/{total}] Descargando: {title}")
+            with self._download_slot(db_id) as got_slot:
+                if not got_slot: return None
+                self.control.enter(db_id)
+                try:
+                    status, err_msg, payload = self._download_safe(ydl_opts_down, video_url, path, config, title,
+                                                                   db_id, resumed_from, info)
+                finally:
+                    self._leave(db_id)
+            if status != "CANCELLED":
+                break
+            if self.stop_flag: return None
+            if self.control.paused:
+                self.log(f"⏸ {title}: descarga interrumpida por la pausa, se retomará al reanudar.")
+
+        if status == "OK":
+            raw_path, meta = payload
+            # Si el formato fijado ya no existía se bajó otro: el .part viejo no sirve
+            if part_path and os.path.exists(part_path):
+                os.remove(part_path)
+            self.throttle.on_success()
+            self.db.mark_downloaded(db_id, raw_path, json.dumps(meta))
+            return self._make_transcode_job(db_id, vid_id, raw_path, meta, config)
+
+        if status == "RATE_LIMIT":
+            wait = self.throttle.on_rate_limit(retry_after=payload)
+            origin = "Retry-After" if payload is not None else "adaptativo"
+            self.log(f"⚠️ BLOQUEO DE YOUTUBE DETECTADO (429). Enfriando {wait / 60:.1f} min ({origin}).")
+            # Vuelve a la cola cuando termine el enfriamiento
+            self._schedule_retry(db_id, Retry.RATE_LIMIT, err_msg, wait)
+        else:
+            self._fail(db_id, err_msg)
+        return None
+
+    def _scratch_root(self, config):
+        """Staging local y rápido (por defecto en el temporal del sistema), uno por base de datos."""
+        if config.get('staging_path'):
+            return config['staging_path']
+        tag = hashlib.sha1(os.path.abspath(self.db.db_name).encode('utf-8')).hexdigest()[:8]
+        return os.path.join(tempfile.gettempdir(), f"musicdl-staging-{tag}")
+
+    def _wait_for_space(self, staging, reserve):
+        """Espera a que staging tenga reserve bytes libres. False si no se liberan a tiempo o se pidió parar."""
+        deadline = time.monotonic() + self.SPACE_WAIT
+        warned = False
+        while shutil.disk_usage(staging).free < reserve:
+            if not warned:
+                self.log(f"💾 Poco espacio en staging ({reserve / 1048576:.0f} MiB mínimos): esperando a que se libere.")
+                warned = True
+            if time.monotonic() > deadline or not self.control.sleep(1.0):
+                return False
+        return True
+
+    def _resumable(self, part_path):
+        """(format_id, bytes en disco) si el .part registrado sigue ahí; si no (None, 0)."""
+        if not part_path or not os.path.exists(part_path):
+            return None, 0
+        match = STAGING_FORMAT_RE.search(os.path.basename(part_path))
+        return (match.group(1), os.path.getsize(part_path)) if match else (None, 0)
+
+    def _sweep_scratch(self, root):
+        """Borra de todo el staging (todas las playlists y nodos) los temporales que ninguna fila referencia.
+
+        Otros procesos del mismo equipo pueden estar usando el mismo staging: solo se toca lo
+        que lleva SCRATCH_MAX_AGE sin modificarse, y las carpetas que quedaron vacías.
+        """
+        if not os.path.isdir(root):
             return
+        keep = set() # (carpeta, raíz del nombre): original, .part y salida de un mismo video comparten raíz
+        for staging_path, part_path in self.db.get_scratch_refs():
+            if staging_path:
+                keep.add((self._dir_key(staging_path), os.path.splitext(os.path.basename(staging_path))[0]))
+            match = part_path and PARTIAL_RE.match(os.path.basename(part_path))
+            if match:
+                keep.add((self._dir_key(part_path), match.group(1)))
+        cutoff = time.time() - self.SCRATCH_MAX_AGE
+        removed = 0
+        for dirpath, _, filenames in os.walk(root, topdown=False):
+            folder = os.path.normcase(os.path.abspath(dirpath))
+            try:
+                # Antes de borrar nada dentro: cada borrado actualiza el mtime de la carpeta
+                stale_dir = dirpath != root and os.path.getmtime(dirpath) <= cutoff
+            except OSError:
+                stale_dir = False
+            for name in filenames:
+                filepath = os.path.join(dirpath, name)
+                match, out = PARTIAL_RE.match(name), SCRATCH_OUT_RE.search(name)
+                stem = match.group(1) if match else name[:out.start()] if out else os.path.splitext(name)[0]
+                try:
+                    if (folder, stem) in keep or os.path.getmtime(filepath) > cutoff:
+                        continue
+                    os.remove(filepath)
+                    removed += 1
+                except OSError:
+                    pass
+            if stale_dir:
+                try:
+                    os.rmdir(dirpath) # Solo si quedó vacía
+                except OSError:
+                    pass
+        if removed:
+            self.log(f"🧹 {removed} temporales abandonados eliminados de {root}.")
 
-        # 2. Descarga
-        pending_videos = self.db.get_pending_videos(playlist_id)
-        total_pending = len(pending_videos)
-        
-        if total_pending == 0:
-            self.log("¡Todos los videos registrados están marcados como completados!")
+    @staticmethod
+    def _dir_key(filepath):
+        return os.path.normcase(os.path.abspath(os.path.dirname(filepath)))
+
+    def _clean_partials(self, playlist_id, staging):
+        """Borra de staging los fragmentos que ninguna fila puede retomar, las salidas de ffmpeg
+        cuyo original ya no está y olvida los .part perdidos."""
+        keep = set()
+        for db_id, status, part_path in self.db.get_partials(playlist_id):
+            if status in ('COMPLETED', 'DOWNLOADED') or not os.path.exists(part_path):
+                self.db.clear_partial(db_id)
+            else:
+                match = PARTIAL_RE.match(os.path.basename(part_path))
+                if match: keep.add(match.group(1))
+        if not os.path.isdir(staging):
             return
+        names = os.listdir(staging)
+        # El original se borra al publicar: mientras esté, su salida convertida se publica sin convertir de nuevo
+        sources = {os.path.splitext(name)[0] for name in names
+                   if not PARTIAL_RE.match(name) and not SCRATCH_OUT_RE.search(name)}
+        removed = 0
+        for name in names:
+            match, out = PARTIAL_RE.match(name), SCRATCH_OUT_RE.search(name)
+            if match:
+                orphan = match.group(1) not in keep
+            elif out:
+                orphan = bool(out.group(1)) or name[:out.start()] not in sources # .tmp/.rg: se cortó a medias
+            else:
+                orphan = False
+            if orphan:
+                try:
+                    os.remove(os.path.join(staging, name))
+                    removed += 1
+                except OSError:
+                    pass
+        if removed:
+            self.log(f"🧹 {removed} temporales huérfanos eliminados de staging.")
 
-        self.log(f"--- PROCESANDO {total_pending} VIDEOS PENDIENTES ---")
+    def _leave(self, db_id):
+        for kind, latency in self.control.leave(db_id):
+            if kind == 'pause':
+                self.log(f"⏸ Pausado: transferencias detenidas en {latency:.2f} s.")
 
-        # pending_videos ahora trae: (db_id, title, url, video_id, filepath_antiguo)
-        for i, (db_id, title, video_url, vid_id, old_path) in enumerate(pending_videos):
-            if self.stop_flag:
-                self.log("⛔ DETENIDO POR USUARIO.")
-                break
+    def _fail(self, db_id, err_msg):
+        """Clasifica el error: permanente (no se reintenta) o transitorio (backoff exponencial)."""
+        if Retry.classify_error(err_msg) == Retry.PERMANENT:
+            self.log(f"❌ Error permanente, no se reintentará: {err_msg}")
+            self.db.record_failure(db_id, Retry.PERMANENT, err_msg)
+            with self.stats_lock:
+                self.retry_scheduled.discard(db_id)
+            self._count('failed')
+            return
+        delay = Retry.retry_delay(self.db.get_attempt_count(db_id) + 1)
+        self.log(f"⚠️ Error: {err_msg}. Reintento en {delay / 60:.1f} min.")
+        self._schedule_retry(db_id, Retry.TRANSIENT, err_msg, delay)
+
+    def _schedule_retry(self, db_id, error_class, err_msg, delay):
+        self.db.record_failure(db_id, error_class, err_msg, time.time() + delay)
+        with self.stats_lock:
+            self.retry_scheduled.add(db_id)
 
-            # --- VERIFICACIÓN DE ARCHIVO EXISTENTE (Lógica Anti-Duplicados) ---
-            # A veces la DB dice PENDING pero el archivo ya está ahí (crash anterior, etc.)
-            # Intentamos adivinar si existe buscando el ID en la carpeta
-            already_downloaded = False
-            for f_name in os.listdir(path):
-                # Si el ID del video está en el nombre del archivo y es de audio
-                if vid_id in f_name and any(f_name.endswith(ext) for ext in ['.mp3', '.m4a', '.wav', '.flac']):
-                    full_path = os.path.join(path, f_name)
-                    self.log(f"✨ El archivo ya existe: {f_name}. Marcando como completado.")
-                    self.db.update_video_status(db_id, "COMPLETED", filepath=full_path)
-                    already_downloaded = True
-                    break
-            
-            if already_downloaded:
+    def _make_transcode_job(self, db_id, vid_id, raw_path, meta, config):
+        fmt, bitrate = content_key(config.get('format'), config.get('bitrate'))
+        return {
+            'db_id': db_id, 'video_id': vid_id, 'src': raw_path, 'dst': meta['target'],
+            'format': config.get('format'), 'bitrate': config.get('bitrate'),
+            'tags': meta.get('tags', {}), 'info': meta.get('info'),
+            'copy': can_copy(config.get('format'), config.get('bitrate'), meta.get('source')),
+            'duration': (meta.get('source') or {}).get('duration'),
+            'replaygain': bool(config.get('replaygain')) and self.loudness_ok,
+            # ffmpeg escribe en staging (local); la publicación mueve el resultado al destino.
+            # El bitrate va en el nombre: una salida de otra configuración no se reutiliza
+            'out': f"{os.path.splitext(raw_path)[0]}.out{bitrate}.{fmt}",
+        }
+
+    def _final_template(self, path, config):
+        # Nombre definitivo: mismo template que antes con el ID como sufijo
+        name_template = config.get('name_template', '%(title)s')
+        return os.path.join(path, f"{name_template} [%(id)s].{config.get('format')}")
+
+    def _reuse_content(self, db_id, vid_id, path, config):
+        """Enlaza en la carpeta destino una conversión existente. Devuelve True si no hace falta descargar."""
+        fmt, bitrate = content_key(config.get('format'), config.get('bitrate'))
+        row = self.db.get_content(vid_id, fmt, bitrate)
+        if not row:
+            return False
+        src, info_json = row
+        if not os.path.exists(src):
+            self.db.remove_content(vid_id, fmt, bitrate)
+            return False
+
+        started = time.perf_counter()
+        try:
+            # prepare_filename solo rellena el template: no hay acceso a la red
+            with self.ydl_pool.get({'quiet': True}) as ydl:
+                dst = ydl.prepare_filename(json.loads(info_json), outtmpl=self._final_template(path, config))
+            method = link_into(src, dst)
+        except Exception as e:
+            self.log(f"⚠️ No se pudo reutilizar {vid_id} ({e}); se descargará de nuevo.")
+            return False
+        self.metrics.record('link', time.perf_counter() - started, db_id)
+
+        self.db.mark_completed(db_id, dst, os.path.getsize(dst))
+        self.file_index.add(path, vid_id, dst)
+        self._count('completed')
+        self.log(f"🔗 Reutilizado ({method}): {os.path.basename(dst)}")
+        return True
+
+    def _resume_staged(self, playlist_id, path, config, lease_s=LEASE_SECONDS):
+        """Recupera los videos que quedaron descargados pero sin convertir (crash o parada)."""
+        jobs = []
+        staged = self.db.get_staged_videos(playlist_id)
+        if self.leases:
+            # Solo los propios o abandonados: los demás los está convirtiendo otro nodo
+            mine = self.leases.acquire(self.node_id, [row[0] for row in staged], lease_s, time.time())
+            staged = [row for row in staged if row[0] in mine]
+        for db_id, title, vid_id, staging_path, meta_json in staged:
+            meta = json.loads(meta_json) if meta_json else None
+            if meta and staging_path and os.path.exists(staging_path):
+                # El destino se recalcula con el formato actual, por si cambió entre ejecuciones
+                base, _ = os.path.splitext(meta['target'])
+                meta['target'] = f"{base}.{config.get('format')}"
+                jobs.append(self._make_transcode_job(db_id, vid_id, staging_path, meta, config))
+            else:
+                self.db.update_video_status(db_id, "PENDING")
+        if self.leases:
+            # Los que se convierten quedan en curso (el latido los renueva); el resto se libera
+            with self.inflight_cv:
+                self.inflight.update(job['db_id'] for job in jobs)
+            self.leases.release(self.node_id, mine - {job['db_id'] for job in jobs})
+        return jobs
+
+    def _stage_put(self, stage_queue, job):
+        """put() bloqueante sobre la cola acotada que respeta la orden de parada."""
+        while True:
+            try:
+                stage_queue.put(job, timeout=self.POLL_INTERVAL)
+                return True
+            except queue.Full:
+                if self.stop_flag: return False
+
+    def _transcode_feeder(self, transcode_queue, cpu_pool, publish_queue):
+        """Etapa de CPU: envía cada archivo de staging al pool de procesos y pasa el resultado a publicar."""
+        while True:
+            try:
+                job = transcode_queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if self.stop_flag: return
                 continue
+            if job is None or self.stop_flag:
+                return
+            handed = False
+            try:
+                with self.metrics.stage('transcode', job['db_id']):
+                    result = self.control.wait_future(cpu_pool.submit(transcode_job, job))
+                if result is None:
+                    # Parada: el video sigue DOWNLOADED y se convierte en la próxima ejecución
+                    return
+                self._account_cpu(job, result)
+                # put bloqueante: los publicadores vacían la cola incluso tras la parada
+                publish_queue.put((job, result))
+                handed = True
+            except Exception as e:
+                self.log(f"❌ Error al convertir {job['video_id']}: {e}")
+                # Se reintenta desde la descarga, con el mismo backoff que un fallo de red
+                self._discard(job['src'])
+                self._fail(job['db_id'], str(e))
+            finally:
+                # Con el resultado en la cola, el video se resuelve en el publicador
+                if not handed: self._resolve(job['db_id'])
 
-            # --- MANEJO DE RATE LIMIT ---
-            while self.is_paused_by_limit:
-                if self.stop_flag: break
-                self.log("⏳ Pausa por Rate Limit...")
-                for _ in range(60): 
-                    if self.stop_flag: break
-                    time.sleep(1)
-                self.is_paused_by_limit = False 
-
-            self.log(f"\n[{i+1}/{total_pending}] Descargando: {title}")
-
-            # Variable para capturar el nombre final del archivo
-            final_filename = [None] 
-
-            def progress_hook(d):
-                if d['status'] == 'finished':
-                    final_filename[0] = d.get('filename')
-
-            ydl_opts_down = {
-                'format': 'bestaudio/best',
-                # Agregamos el ID al nombre para facilitar la detección futura de duplicados
-                'outtmpl': os.path.join(path, f'{name_template} [%(id)s].%(ext)s'),
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio', 
-                    'preferredcodec': config.get('format'), 
-                    'preferredquality': config.get('bitrate')
-                }, {'key': 'FFmpegMetadata', 'add_metadata': True}],
-                'quiet': True, 'no_warnings': True,
-                'logger': ConsoleLogger(self.log),
-                'progress_hooks': [progress_hook] # Hook para capturar nombre
-            }
-            if cookie: ydl_opts_down['cookiefile'] = cookie
-
-            # Intentos
-            max_retries = 3
-            attempt = 0
-            
-            while attempt < max_retries:
-                if self.stop_flag: break
-                attempt += 1
-                
-                status, err_msg = self._download_safe(ydl_opts_down, video_url)
-                
-                if status == "OK":
-                    # Si yt-dlp convirtió el archivo (ej. webm -> mp3), el filename del hook
-                    # podría tener la extensión vieja. Ajustamos la extensión:
-                    saved_path = final_filename[0] if final_filename[0] else "Unknown"
-                    target_ext = config.get('format')
-                    if saved_path != "Unknown":
-                        base, _ = os.path.splitext(saved_path)
-                        # Predecimos el nombre final post-conversión
-                        saved_path = f"{base}.{target_ext}"
-
-                    self.db.update_video_status(db_id, "COMPLETED", filepath=saved_path)
-                    break 
-                
-                elif status == "RATE_LIMIT":
-                    self.log("⚠️ BLOQUEO DE YOUTUBE DETECTADO (429).")
-                    self.is_paused_by_limit = True
-                    self._wait_cooldown(minutes=5)
-                    break 
+    def _publisher(self, publish_queue, path):
+        """Etapa de E/S: mueve cada archivo convertido de staging al destino y recién entonces lo registra."""
+        while True:
+            item = publish_queue.get()
+            if item is None:
+                return
+            job, result = item
+            try:
+                with self.metrics.stage('publish', job['db_id']):
+                    method = publish(result['filepath'], job['dst'])
+                    st = os.stat(job['dst']) # Tamaño y mtime para la DB; file_index.add hace además un stat de la carpeta
+                # Hasta aquí el original se conserva: un corte antes de publicar no obliga a descargar
+                self._discard(job['src'])
+                # Ruta y tamaño reales del archivo publicado (no se deducen del nombre original)
+                self.db.mark_completed(job['db_id'], job['dst'], st.st_size)
+                with self.stats_lock:
+                    self.retry_scheduled.discard(job['db_id'])
+                self._count('completed')
+                self.file_index.add(path, job['video_id'], job['dst'])
+                if job.get('info'):
+                    fmt, bitrate = content_key(job['format'], job['bitrate'])
+                    self.db.add_content(job['video_id'], fmt, bitrate, job['dst'], json.dumps(job['info']))
+                self._save_loudness(job, result, st)
+                mode = "copia sin recodificar" if job.get('copy') else "recodificado"
+                moved = "" if method == "rename" else ", copiado al destino"
+                self.log(f"🎵 Convertido ({mode}{moved}): {os.path.basename(job['dst'])}")
+            except Exception as e:
+                self.log(f"❌ Error al publicar {job['video_id']}: {e}")
+                self._discard(result['filepath'], job['src'])
+                self._fail(job['db_id'], str(e))
+            finally:
+                self._resolve(job['db_id'])
 
-                else:
-                    if attempt < max_retries:
-                        self.log(f"⚠️ Reintentando ({attempt}/{max_retries})...")
-                        time.sleep(5)
-                    else:
-                        self.log(f"❌ Error final: {err_msg}")
-                        self.db.update_video_status(db_id, "ERROR", error_msg=err_msg)
-            
-            time.sleep(random.uniform(2, 5))
+    @staticmethod
+    def _discard(*paths):
+        """Borra temporales de staging que ya no sirven; si alguno no está, no importa."""
+        for filepath in paths:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
 
-        self.log("\n--- TAREA FINALIZADA ---")
+    def _save_loudness(self, job, result, st):
+        loudness = result.get('loudness')
+        if not loudness: return
+        if 'error' in loudness:
+            self.log(f"⚠️ Sin ReplayGain para {job['video_id']}: {loudness['error']}")
+            return
+        # mtime del archivo ya publicado: una copia entre discos no lo conserva
+        self.db.save_loudness(job['db_id'], loudness['lufs'], loudness['peak'], st.st_size, st.st_mtime_ns)
+
+    def _account_cpu(self, job, result):
+        """Aprende el costo de recodificar y acumula el audio (y la CPU) de cada copia directa."""
+        cpu, duration = result.get('cpu'), job.get('duration')
+        if job.get('copy'):
+            self._count('copied')
+            if duration:
+                with self.stats_lock:
+                    self.stats['copied_audio'] += duration
+                    self.stats['copied_cpu'] += cpu or 0.0
+        elif cpu is not None and duration:
+            # Media móvil: se adapta a la máquina y al códec sin guardar historial
+            with self.stats_lock:
+                ratio = cpu / duration
+                self.cpu_ratio = ratio if self.cpu_ratio is None else 0.8 * self.cpu_ratio + 0.2 * ratio
 
-    def _download_safe(self, opts, url):
+    def _download_safe(self, opts, url, path, config, title="", db_id=None, resumed_from=0, info=None):
+        """Devuelve (estado, mensaje, (ruta_staging, meta)). Con info (extracción anticipada) no se vuelve a extraer."""
+        finished = [None]
+        last_report = [0.0]
+        last_saved = [0.0]
+        transferred = [0]
+        first_byte = [None]
+        key = threading.get_ident()
+        started = time.perf_counter()
+
+        def progress_hook(d):
+            if first_byte[0] is None and d['status'] == 'downloading':
+                first_byte[0] = time.perf_counter()
+            # downloaded_bytes es acumulado por archivo (incluye lo reanudado de un .part)
+            transferred[0] = max(transferred[0], d.get('downloaded_bytes') or 0)
+            if d['status'] == 'finished':
+                finished[0] = d.get('filename')
+            elif d['status'] == 'downloading':
+                done = d.get('downloaded_bytes') or 0
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                now = time.monotonic()
+                # Parada, pausa o salto: se corta la transferencia; el .part queda para continuar
+                abort = self.control.should_abort(db_id)
+                # Avance del .part en la DB: tras un cierre inesperado se retoma desde ahí
+                if db_id is not None and d.get('tmpfilename') and (abort or now - last_saved[0] >= self.PARTIAL_INTERVAL):
+                    last_saved[0] = now
+                    self.db.update_partial(db_id, d['tmpfilename'], done, total)
+                if abort:
+                    raise DownloadCancelled("Descarga interrumpida")
+                # Una línea de progreso por video, como mucho cada PROGRESS_INTERVAL
+                if now - last_report[0] < self.PROGRESS_INTERVAL: return
+                last_report[0] = now
+                amount = f"{done * 100 / total:.0f}%" if total else f"{done / 1048576:.1f} MiB"
+                self.progress(key, f"⬇ {title[:40]} {amount}")
+
+        self._local.progress_hook = progress_hook
         try:
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                ydl.download([url])
-                return "OK", ""
+            if self.stop_flag:
+                raise DownloadCancelled("Descarga interrumpida")
+            with self.ydl_pool.get(opts) as ydl:
+                if info:
+                    # Selección de formato y descarga con las opciones de este video
+                    info = ydl.process_ie_result(info, download=True)
+                else:
+                    info = ydl.extract_info(url, download=True)
+                downloads = info.get('requested_downloads') or [{}]
+                raw_path = downloads[0].get('filepath') or finished[0]
+                meta = {
+                    'target': ydl.prepare_filename(info, outtmpl=self._final_template(path, config)),
+                    'tags': tags_from_info(info),
+                    'info': name_info(info),
+                    # Stream elegido: decide si la conversión puede ser una copia
+                    'source': {k: info.get(k) for k in ('acodec', 'abr', 'duration')},
+                }
+                return "OK", "", (raw_path, meta)
+        except DownloadCancelled:
+            return "CANCELLED", "", None
         except DownloadError as e:
             msg = str(e)
             if "HTTP Error 429" in msg or "rate-limited" in msg:
-                return "RATE_LIMIT", msg
-            return "ERROR", msg
+                return "RATE_LIMIT", msg, retry_after_from_error(e)
+            return "ERROR", msg, None
         except Exception as e:
-            return "CRITICAL", str(e)
-
-    def _wait_cooldown(self, minutes):
-        seconds = minutes * 60
-        for s in range(seconds):
-            if self.stop_flag: return
-            if s % 60 == 0:
-                self.log(f"⏳ Enfriando... {minutes - (s // 60)} min restantes.")
-            time.sleep(1)
\ No newline at end of file
+            return "CRITICAL", str(e), None
+        finally:
+            self._local.progress_hook = None
+            self.progress(key, None)
+            # Tiempo hasta el primer byte: extracción (si no se anticipó) + conexión
+            if first_byte[0] is not None:
+                self.metrics.record('ttfb', first_byte[0] - started, db_id)
+            # Solo cuenta lo que viajó por la red, no lo que ya estaba en el .part
+            self.metrics.record('download', time.perf_counter() - started, db_id, max(0, transferred[0] - resumed_from))
+
+    @contextmanager
+    def _download_slot(self, db_id=None):
+        """Cupo del límite global de descargas (si lo hay). Entrega False si se pidió parar."""
+        if self.download_slots is None:
+            yield True
+            return
+        with self.metrics.stage('wait', db_id):
+            acquired = False
+            while not acquired and not self.stop_flag:
+                acquired = self.download_slots.acquire(timeout=self.POLL_INTERVAL)
+        if not acquired:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            self.download_slots.release()
+
+    def _acquire_slot(self, db_id=None):
+        """Espera el turno del controlador adaptativo. Devuelve False si se pidió parar."""
+        remaining = self.throttle.cooldown_remaining()
+        if remaining > 0:
+            self.log(f"⏳ Pausa por Rate Limit... {remaining / 60:.1f} min restantes.")
+        # Una espera con enfriamiento activo cuenta como enfriamiento, aunque el 429 lo haya recibido otro hilo
+        with self.metrics.stage('cooldown' if remaining > 0 else 'wait', db_id):
+            return self.throttle.acquire(lambda: self.stop_flag, self.control.sleep)
\ No newline at end of file
@@ -0,0 +1,87 @@
+import os
+import re
+import threading
+
+AUDIO_EXTENSIONS = ('.mp3', '.m4a', '.wav', '.flac')
+
+# outtmpl termina siempre en " [%(id)s].%(ext)s"
+ID_SUFFIX_RE = re.compile(r'\[([^\[\]]+)\]\.([A-Za-z0-9]+)$')
+
+class FileIndex:
+    """Índice persistente video_id -> archivo de audio, por carpeta de descarga.
+
+    Solo se relee la carpeta cuando su mtime cambió por algo ajeno al motor (add()
+    registra el mtime que dejan sus propias escrituras), y aun así solo se procesan
+    los nombres nuevos o desaparecidos: la comprobación de duplicados es O(1) por video.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.folders = {} # {carpeta: {video_id: filepath}}
+
+    @staticmethod
+    def _key(folder):
+        return os.path.normcase(os.path.abspath(folder))
+
+    def refresh(self, folder):
+        """Sincroniza el índice de la carpeta con el disco. Devuelve True si el índice cambió."""
+        key = self._key(folder)
+        if not os.path.isdir(folder):
+            with self.lock:
+                self.folders[key] = {}
+            return False
+        mtime_ns = os.stat(folder).st_mtime_ns
+
+        with self.lock:
+            index = self.folders.get(key)
+        if index is None:
+            index = self.db.load_file_index(key)
+        if self.db.get_folder_mtime(key) == mtime_ns:
+            with self.lock:
+                self.folders.setdefault(key, index)
+            return False
+
+        # Un listado de nombres; solo los que no estaban en el índice se examinan
+        known = {os.path.basename(fpath): vid_id for vid_id, fpath in index.items()}
+        names = set()
+        added = {}
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.name.lower().endswith(AUDIO_EXTENSIONS):
+                    continue
+                names.add(entry.name)
+                if entry.name in known:
+                    continue
+                match = ID_SUFFIX_RE.search(entry.name)
+                if match and entry.is_file():
+                    added[match.group(1)] = entry.path
+        removed = [vid_id for name, vid_id in known.items() if name not in names and vid_id not in added]
+
+        self.db.update_file_index(key, mtime_ns, added, removed)
+        index = dict(index)
+        for vid_id in removed:
+            del index[vid_id]
+        index.update(added)
+        with self.lock:
+            self.folders[key] = index
+        return bool(added or removed)
+
+    def lookup(self, folder, video_id):
+        """Devuelve la ruta del archivo ya descargado o None."""
+        with self.lock:
+            return self.folders.get(self._key(folder), {}).get(video_id)
+
+    def add(self, folder, video_id, filepath):
+        """Registra una descarga completada sin re-escanear la carpeta.
+
+        Se guarda también el mtime que dejó la escritura: la próxima ejecución no la
+        confunde con un cambio externo.
+        """
+        key = self._key(folder)
+        with self.lock:
+            self.folders.setdefault(key, {})[video_id] = filepath
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        self.db.add_file_index_entry(key, video_id, filepath, mtime_ns)
\ No newline at end of file
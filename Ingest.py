@@ -0,0 +1,69 @@
+import itertools
+import threading
+
+CHUNK_SIZE = 200
+KNOWN_RUN = 20 # Entradas ya conocidas seguidas para cortar una sincronización incremental
+CACHE_MAX_ENTRIES = 20000 # Listas más grandes no se cachean (se prioriza la memoria)
+
+def iter_chunks(entries, size=CHUNK_SIZE):
+    """Agrupa un iterable (generador de yt-dlp, PagedList o lista) en listas de tamaño fijo."""
+    if hasattr(entries, 'getslice'):
+        # PagedList: se piden las páginas bajo demanda en lugar de materializarla entera
+        for start in itertools.count(0, size):
+            chunk = entries.getslice(start, start + size)
+            if not chunk: return
+            yield chunk
+        return
+    it = iter(entries)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk: return
+        yield chunk
+
+class IngestState:
+    """Estado compartido entre el hilo que ingiere la playlist y el que reparte el trabajo."""
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.playlist_id = None
+        self.ready = False # La playlist ya tiene id en la DB
+        self.done = False
+        self.error = None
+        self.added = 0
+        self.chunks = 0
+
+    def set_playlist(self, playlist_id):
+        with self.cond:
+            self.playlist_id = playlist_id
+            self.ready = True
+            self.cond.notify_all()
+
+    def chunk_landed(self, added):
+        with self.cond:
+            self.added += added
+            self.chunks += 1
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.ready = True
+            self.done = True
+            self.cond.notify_all()
+
+    def wait_ready(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.ready)
+        return self.playlist_id
+
+    def wait_for_more(self, seen_chunks, timeout=0.5):
+        """Espera a que llegue un bloque nuevo o termine la ingesta."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.done or self.chunks > seen_chunks, timeout=timeout)
+
+def slim_entry(entry):
+    """Solo lo que necesita la tabla videos (y lo que se guarda en la caché de extracción)."""
+    return {
+        'id': entry.get('id'),
+        'title': entry.get('title', 'Unknown'),
+        'url': entry.get('url') or entry.get('webpage_url'),
+    }
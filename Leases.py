@@ -0,0 +1,85 @@
+import os
+import socket
+import threading
+
+LEASE_SECONDS = 120.0 # Vigencia de un lease; el latido lo renueva cada tercio
+
+def default_node_id():
+    # Único por proceso: los nodos comparten equipo. Con un --node fijo, un nodo que
+    # reinicia recupera sus propios leases sin esperar a que venzan
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+class SqliteLeaseStore:
+    """Leases guardados en videos.lease_owner / videos.lease_expires.
+
+    Solo para varios procesos en un mismo equipo, contra un archivo de base de
+    datos local: SQLite en modo WAL no funciona sobre una carpeta de red (el
+    índice en memoria compartida y los bloqueos no se ven entre máquinas).
+    Cada reclamo es una única transacción BEGIN IMMEDIATE en el hilo escritor,
+    así que dos nodos nunca reciben la misma fila. Para varias máquinas no
+    basta con otro almacén de leases: los estados, los reintentos y el almacén de
+    contenido también viven en la base de datos local.
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def claim(self, owner, playlist_id, limit, lease_s, now):
+        """Reclama hasta limit videos pendientes sin lease vigente. Filas como iter_pending_videos."""
+        return self.db.claim_videos(owner, playlist_id, limit, now + lease_s, now)
+
+    def acquire(self, owner, ids, lease_s, now):
+        """Toma filas concretas si están libres, vencidas o ya eran propias. Devuelve los ids obtenidos."""
+        return self.db.acquire_leases(owner, ids, now + lease_s, now)
+
+    def renew(self, owner, ids, lease_s, now):
+        """Extiende los leases propios. Devuelve los ids que se siguen teniendo."""
+        return self.db.renew_leases(owner, ids, now + lease_s)
+
+    def release(self, owner, ids):
+        """Devuelve las filas al resto de nodos (los DOWNLOADED conservan el lease hasta convertirse)."""
+        self.db.release_leases(owner, ids)
+
+class MemoryLeaseStore:
+    """Sustituto en memoria para varios motores dentro de un mismo proceso (pruebas y benchmarks).
+
+    Los estados siguen en la DB; solo los leases viven aquí, protegidos por un lock.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.leases = {} # {db_id: (dueño, vence)}
+
+    def _free(self, db_id, owner, now):
+        held = self.leases.get(db_id)
+        return held is None or held[0] == owner or held[1] < now
+
+    def claim(self, owner, playlist_id, limit, lease_s, now):
+        claimed = []
+        with self.lock:
+            for item in self.db.iter_pending_videos(playlist_id, now=now):
+                if len(claimed) >= limit: break
+                held = self.leases.get(item[0])
+                if held is None or held[1] < now:
+                    self.leases[item[0]] = (owner, now + lease_s)
+                    claimed.append(item)
+        return claimed
+
+    def acquire(self, owner, ids, lease_s, now):
+        with self.lock:
+            taken = {db_id for db_id in ids if self._free(db_id, owner, now)}
+            for db_id in taken:
+                self.leases[db_id] = (owner, now + lease_s)
+        return taken
+
+    def renew(self, owner, ids, lease_s, now):
+        with self.lock:
+            kept = {db_id for db_id in ids if self.leases.get(db_id, (None,))[0] == owner}
+            for db_id in kept:
+                self.leases[db_id] = (owner, now + lease_s)
+        return kept
+
+    def release(self, owner, ids):
+        with self.lock:
+            for db_id in ids:
+                if self.leases.get(db_id, (None,))[0] == owner:
+                    del self.leases[db_id]
\ No newline at end of file
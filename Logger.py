@@ -1,26 +1,68 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
-import yt_dlp
 import threading
-import os
-import time
-import random
-import csv
-import datetime
+from collections import deque
+
+YTDLP_PROGRESS_KEY = "yt-dlp" # Línea de progreso que escribe el propio yt-dlp (ver ConsoleLogger)
 
 class ConsoleLogger:
     """Manejador de logs que conecta yt-dlp con la UI mediante un callback."""
-    def __init__(self, callback):
+    def __init__(self, callback, progress_callback=None):
         self.callback = callback
+        self.progress_callback = progress_callback
 
     def debug(self, msg): pass 
 
     def info(self, msg):
         if "[download]" in msg and "Hz" in msg: return 
+        if msg.startswith("[download]") and "%" in msg:
+            # El avance por fragmento va a la línea de progreso, no al log
+            if self.progress_callback: self.progress_callback(YTDLP_PROGRESS_KEY, msg.strip())
+            return
         self.callback(msg)
 
     def warning(self, msg):
         self.callback(f"⚠️ ADVERTENCIA: {msg}")
 
     def error(self, msg):
-        self.callback(f"❌ ERROR INTERNO: {msg}")
\ No newline at end of file
+        self.callback(f"❌ ERROR INTERNO: {msg}")
+
+class LogChannel:
+    """Buffer circular thread-safe entre los hilos del motor y la UI.
+
+    Los hilos solo encolan; la UI vacía el buffer en cada tick con una sola
+    inserción. Si la UI se atrasa se descartan las líneas más viejas. El
+    progreso se guarda como "último valor" por clave, así que por mucho que
+    se actualice solo se dibuja una vez por tick.
+    """
+    def __init__(self, capacity=2000):
+        self.lock = threading.Lock()
+        self.lines = deque(maxlen=capacity)
+        self.dropped = 0
+        self.progress = {}
+        self.progress_dirty = False
+
+    def put(self, msg):
+        with self.lock:
+            if len(self.lines) == self.lines.maxlen:
+                self.dropped += 1
+            self.lines.append(msg)
+
+    def set_progress(self, key, text):
+        """text=None elimina la línea de esa clave (descarga terminada)."""
+        with self.lock:
+            if text is None:
+                self.progress.pop(key, None)
+            else:
+                self.progress[key] = text
+            self.progress_dirty = True
+
+    def drain(self):
+        """Devuelve (líneas, descartadas, progreso). progreso es None si no cambió desde el último drain."""
+        with self.lock:
+            lines = list(self.lines)
+            self.lines.clear()
+            dropped, self.dropped = self.dropped, 0
+            progress = None
+            if self.progress_dirty:
+                progress = " | ".join(self.progress.values())
+                self.progress_dirty = False
+        return lines, dropped, progress
@@ -0,0 +1,241 @@
+import functools
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+try:
+    import numpy as np # Opcional: sin NumPy no hay análisis de sonoridad
+except ImportError:
+    np = None
+try:
+    import mutagen # Opcional: sin mutagen las etiquetas se escriben con un remux de ffmpeg
+except ImportError:
+    mutagen = None
+
+# Como Transcoder.py, se importa en los procesos del pool: sin yt_dlp ni tkinter.
+
+RATE = 48000 # Los coeficientes de ponderación K de BS.1770 están definidos a 48 kHz
+# Ponderación K (ITU-R BS.1770-4): filtro de estante + pasa altos, (b, a) de cada biquad
+K_FILTERS = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+BLOCK = RATE * 400 // 1000 # Bloques de 400 ms...
+HOP = BLOCK // 4           # ...solapados un 75%
+TAPS = 8192                # Respuesta al impulso de la ponderación K: el polo más lento (r ≈ 0.995) ya cayó bajo 1e-17
+ABSOLUTE_GATE = -70.0      # LUFS
+RELATIVE_GATE = -10.0      # LU por debajo de la media de los bloques que pasan el umbral absoluto
+REFERENCE_LUFS = -18.0     # Referencia de ReplayGain 2.0
+
+def available():
+    return np is not None
+
+def decode(filepath, frames=RATE):
+    """Decodifica con ffmpeg a float32 estéreo a 48 kHz. Genera arrays (muestras, canales) de hasta frames muestras.
+
+    Se lee la salida de ffmpeg a medida que llega: la pista nunca está entera en memoria.
+    """
+    cmd = ['ffmpeg', '-v', 'error', '-i', filepath, '-vn', '-f', 'f32le', '-ac', '2', '-ar', str(RATE), '-']
+    # stderr a un archivo: si se llenara una tubería sin leer, ffmpeg se bloquearía
+    with tempfile.TemporaryFile() as errors:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+        try:
+            while True:
+                data = proc.stdout.read(frames * 8) # 2 canales x 4 bytes
+                if not data: break
+                yield np.frombuffer(data[:len(data) // 8 * 8], dtype=np.float32).reshape(-1, 2)
+        except BaseException:
+            proc.kill() # Se dejó de leer antes del final: no hace falta el resto de la pista
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode != 0:
+            errors.seek(0)
+            raise RuntimeError(f"ffmpeg no pudo decodificar: {errors.read().decode('utf-8', 'replace').strip()[-300:]}")
+
+@functools.lru_cache(maxsize=1)
+def _k_impulse():
+    """Respuesta al impulso de los dos biquads en cascada, truncada a TAPS muestras."""
+    x = [1.0] + [0.0] * (TAPS - 1)
+    for b, a in K_FILTERS:
+        y = []
+        x1 = x2 = y1 = y2 = 0.0
+        for v in x:
+            out = b[0] * v + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+            x2, x1, y2, y1 = x1, v, y1, out
+            y.append(out)
+        x = y
+    return np.array(x)
+
+class _Meter:
+    """Sonoridad BS.1770 por bloques: solo guarda el estado del filtro y la energía de cada tramo de 100 ms."""
+    def __init__(self, channels=2):
+        self.history = np.zeros((TAPS - 1, channels)) # Últimas entradas: el estado del filtro entre bloques
+        self.pending = np.zeros((0, channels))        # Resto que aún no completa un tramo
+        self.segments = []                            # Energía ponderada por tramo (L y R pesan 1.0)
+        self.peak = 0.0
+        self.spectra = {}                             # {tamaño de FFT: espectro del filtro}
+
+    def feed(self, samples):
+        if not len(samples): return
+        self.peak = max(self.peak, float(np.max(np.abs(samples))))
+        pending = np.concatenate((self.pending, samples))
+        usable = len(pending) // HOP * HOP
+        if usable:
+            self._filter(pending[:usable])
+        self.pending = pending[usable:]
+
+    def _filter(self, x):
+        # Overlap-save: con la historia delante, las muestras desde TAPS-1 salen como del filtro continuo
+        full = np.concatenate((self.history, x))
+        size = 1 << (len(full) - 1).bit_length()
+        spectrum = self.spectra.get(size)
+        if spectrum is None:
+            spectrum = self.spectra[size] = np.fft.rfft(_k_impulse(), size)[:, None]
+        weighted = np.fft.irfft(np.fft.rfft(full, size, axis=0) * spectrum, size, axis=0)[TAPS - 1:len(full)]
+        self.history = full[-(TAPS - 1):]
+        self.segments.extend(np.square(weighted).sum(axis=1).reshape(-1, HOP).sum(axis=1))
+
+    def result(self):
+        if len(self.segments) < 4:
+            return None, self.peak
+        # Cada bloque de 400 ms suma cuatro tramos seguidos; el resto final (< 100 ms) no completa ninguno
+        energy = np.convolve(self.segments, np.ones(4), mode='valid') / BLOCK
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(energy)
+        gated = energy[loudness > ABSOLUTE_GATE]
+        if not len(gated):
+            return None, self.peak # Silencio
+        threshold = -0.691 + 10 * np.log10(gated.mean()) + RELATIVE_GATE
+        gated = energy[(loudness > ABSOLUTE_GATE) & (loudness > threshold)]
+        return float(-0.691 + 10 * np.log10(gated.mean())), self.peak
+
+def measure(blocks):
+    """(sonoridad integrada en LUFS, pico de muestra) de audio a 48 kHz.
+
+    blocks es un array (muestras, canales) o un iterable de ellos, como el que genera
+    decode(): la ponderación K se aplica bloque a bloque y la memoria no crece con la pista.
+    """
+    if isinstance(blocks, np.ndarray):
+        blocks = (blocks,)
+    meter = None
+    for samples in blocks:
+        if meter is None:
+            meter = _Meter(samples.shape[1])
+        meter.feed(samples)
+    return meter.result() if meter else (None, 0.0)
+
+def replaygain_tags(lufs, peak):
+    return {
+        'REPLAYGAIN_TRACK_GAIN': f"{REFERENCE_LUFS - lufs:+.2f} dB",
+        'REPLAYGAIN_TRACK_PEAK': f"{peak:.6f}",
+    }
+
+def write_tags(filepath, tags):
+    """Escribe las etiquetas en el archivo. Con mutagen en el sitio; si no, remux con ffmpeg."""
+    if mutagen is not None and _write_tags_mutagen(filepath, tags):
+        return
+    base, ext = os.path.splitext(filepath)
+    tmp = f"{base}.rg{ext}"
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-i', filepath, '-map', '0', '-c', 'copy', '-map_metadata', '0']
+    if ext.lower() == '.m4a':
+        cmd += ['-movflags', 'use_metadata_tags'] # Si no, el muxer MP4 descarta las claves no estándar
+    for key, value in tags.items():
+        cmd += ['-metadata', f'{key}={value}']
+    cmd.append(tmp)
+    proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        if os.path.exists(tmp): os.remove(tmp)
+        raise RuntimeError(f"ffmpeg no pudo etiquetar: {proc.stderr.decode('utf-8', 'replace').strip()[-300:]}")
+    os.replace(tmp, filepath)
+
+def _write_tags_mutagen(filepath, tags):
+    """False si mutagen no sabe etiquetar este contenedor (ej. wav)."""
+    audio = mutagen.File(filepath)
+    if audio is None:
+        return False
+    if audio.tags is None:
+        audio.add_tags()
+    from mutagen.id3 import ID3, TXXX
+    from mutagen.mp4 import MP4Tags, MP4FreeForm
+    for key, value in tags.items():
+        if isinstance(audio.tags, ID3):
+            audio.tags.add(TXXX(encoding=3, desc=key, text=[value]))
+        elif isinstance(audio.tags, MP4Tags):
+            audio.tags[f"----:com.apple.iTunes:{key}"] = [MP4FreeForm(value.encode('utf-8'))]
+        else: # Comentarios Vorbis (flac, ogg, opus)
+            audio.tags[key] = [value]
+    audio.save()
+    return True
+
+def analyze_file(filepath, tag=True):
+    """Decodifica en bloques, mide y (con tag=True) escribe ReplayGain. Se ejecuta en el pool de procesos.
+
+    Devuelve {'filepath', 'lufs', 'peak', 'size', 'mtime_ns'}; lufs es None en un archivo en silencio.
+    """
+    lufs, peak = measure(decode(filepath))
+    if tag and lufs is not None:
+        write_tags(filepath, replaygain_tags(lufs, peak))
+    st = os.stat(filepath) # Después de etiquetar: es el estado que se guarda
+    return {'filepath': filepath, 'lufs': lufs, 'peak': peak, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+class LoudnessScanner:
+    """Analiza la biblioteca existente (videos COMPLETED) en un pool de procesos.
+
+    Se saltan los archivos cuyo mtime no cambió desde su último análisis. El tamaño
+    nuevo (tras escribir las etiquetas) se guarda en videos.filesize para que el
+    verificador no los tome por dañados.
+    """
+    def __init__(self, db, log_callback, workers=None, tag=True):
+        self.db = db
+        self.log = log_callback
+        self.workers = workers or os.cpu_count() or 1
+        self.tag = tag
+        self.stop_flag = False
+
+    def request_stop(self):
+        self.stop_flag = True
+
+    def run(self, playlist_id=None, page_size=200):
+        """Devuelve {'analyzed', 'unchanged', 'failed'}."""
+        self.stop_flag = False
+        stats = {'analyzed': 0, 'unchanged': 0, 'failed': 0}
+        if not available():
+            self.log("⚠️ Análisis de sonoridad no disponible: falta NumPy.")
+            return stats
+        self.log("--- ANALIZANDO SONORIDAD... ---")
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for db_id, filepath, mtime_ns in self.db.iter_loudness_candidates(playlist_id, page_size):
+                if self.stop_flag: break
+                try:
+                    st = os.stat(filepath)
+                except (OSError, TypeError):
+                    continue # Falta el archivo: es trabajo del verificador
+                if mtime_ns == st.st_mtime_ns:
+                    stats['unchanged'] += 1
+                    continue
+                pending[pool.submit(analyze_file, filepath, self.tag)] = db_id
+                # Ventana acotada: no se encolan miles de trabajos de golpe
+                if len(pending) >= self.workers * 2:
+                    self._collect(pending, stats, wait_all=False)
+            self._collect(pending, stats, wait_all=True)
+
+        self.log(f"🔊 Sonoridad: {stats['analyzed']} analizados, {stats['unchanged']} sin cambios, {stats['failed']} con error.")
+        return stats
+
+    def _collect(self, pending, stats, wait_all):
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                db_id = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    self.log(f"❌ Sonoridad del video {db_id}: {e}")
+                    continue
+                self.db.save_loudness(db_id, result['lufs'], result['peak'], result['size'], result['mtime_ns'])
+                stats['analyzed'] += 1
+            if not wait_all: return
\ No newline at end of file
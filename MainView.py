@@ -3,6 +3,8 @@ from tkinter import ttk, filedialog, scrolledtext
 
 class MainView:
     """Interfaz Gráfica Principal."""
+    MAX_LOG_LINES = 2000 # El log se recorta para que el widget no crezca sin límite
+
     def __init__(self, root, callbacks, context_vars):
         self.root = root
         self.cb = callbacks # Diccionario de funciones (start, stop, settings, folder)
@@ -23,6 +25,8 @@ class MainView:
         top.pack(fill="x", pady=(0, 10))
         ttk.Label(top, text="Gestor de Descargas Modular", font=("Arial", 12, "bold")).pack(side="left")
         ttk.Button(top, text="⚙️ Configuración", command=self.cb['open_settings']).pack(side="right")
+        self.btn_verify = ttk.Button(top, text="🩺 Verificar biblioteca", command=self.cb['verify'])
+        self.btn_verify.pack(side="right", padx=5)
 
         # URL
         url_frame = ttk.LabelFrame(main_frame, text="URL del Video/Playlist", padding="10")
@@ -47,18 +51,54 @@ class MainView:
                                   state="disabled", command=self.cb['stop'], height=2)
         self.btn_stop.pack(side="right", fill="x", expand=True, padx=(5, 0))
 
+        self.btn_skip = tk.Button(btn_frame, text="⏭ SALTAR", state="disabled", command=self.cb['skip'], height=2)
+        self.btn_skip.pack(side="right", padx=5)
+        self.btn_pause = tk.Button(btn_frame, text="⏸ PAUSAR", state="disabled", command=self.cb['pause'], height=2)
+        self.btn_pause.pack(side="right", padx=5)
+
         # Log
         self.log_area = scrolledtext.ScrolledText(main_frame, height=15, state='disabled', bg="#1e1e1e", fg="#00ff00")
         self.log_area.pack(fill="both", expand=True)
 
+        # Línea de progreso (se reemplaza, no se acumula en el log)
+        self.progress_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.progress_var, anchor="w").pack(fill="x", pady=(5, 0))
+
     def append_log(self, msg):
+        self.append_logs([msg])
+
+    def append_logs(self, lines):
+        """Inserta un lote de líneas con un solo insert y recorta lo que exceda MAX_LOG_LINES."""
+        if not lines: return
         self.log_area.config(state='normal')
-        self.log_area.insert(tk.END, f"{msg}\n")
+        self.log_area.insert(tk.END, "\n".join(lines) + "\n")
+        total = int(self.log_area.index('end-1c').split('.')[0])
+        excess = total - self.MAX_LOG_LINES
+        if excess > 0:
+            self.log_area.delete('1.0', f'{excess + 1}.0')
         self.log_area.see(tk.END)
         self.log_area.config(state='disabled')
 
-    def toggle_controls(self, is_running):
+    def set_progress(self, text):
+        self.progress_var.set(text)
+
+    def set_loading(self, loading):
+        """Mientras el motor arranca en segundo plano no se puede iniciar ni verificar."""
+        state = "disabled" if loading else "normal"
+        self.btn_start.config(state=state, text="⏳ CARGANDO..." if loading else "▶ INICIAR")
+        self.btn_verify.config(state=state)
+
+    def toggle_controls(self, is_running, pausable=True):
+        """pausable=False: tarea en curso sin pausa ni salto (ej. la verificación)."""
         state_start = "disabled" if is_running else "normal"
         state_stop = "normal" if is_running else "disabled"
+        state_pause = state_stop if pausable else "disabled"
         self.btn_start.config(state=state_start)
-        self.btn_stop.config(state=state_stop)
\ No newline at end of file
+        self.btn_stop.config(state=state_stop)
+        self.btn_verify.config(state=state_start)
+        self.btn_pause.config(state=state_pause)
+        self.btn_skip.config(state=state_pause)
+        self.set_paused(False)
+
+    def set_paused(self, paused):
+        self.btn_pause.config(text="▶ REANUDAR" if paused else "⏸ PAUSAR")
\ No newline at end of file
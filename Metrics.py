@@ -0,0 +1,121 @@
+import os
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# Etiquetas legibles para el resumen del log
+STAGE_LABELS = {
+    'extract': "extracción",
+    'scan': "escaneo de carpeta",
+    'wait': "espera de turno",
+    'cooldown': "enfriamiento 429",
+    'prefetch': "extracción anticipada",
+    'ttfb': "hasta el primer byte",
+    'download': "descarga",
+    'transcode': "conversión",
+    'publish': "publicación",
+    'link': "enlaces del almacén",
+    'db_commit': "commits DB",
+}
+# Mediciones contenidas en otra etapa (ttfb es parte de download): no suman al reparto
+OVERLAPPING = ('ttfb',)
+
+class RunMetrics:
+    """Tiempos por etapa y por video de una ejecución de DownloadEngine.
+
+    Cada medición se guarda en la tabla video_metrics (video_db_id NULL para las
+    etapas de toda la ejecución) y se acumula en memoria para el resumen del log
+    y la exportación en formato de texto de Prometheus.
+    """
+    def __init__(self, db, run_id):
+        self.db = db
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.seconds = Counter()
+        self.counts = Counter()
+        self.bytes = 0
+        self.started = time.time()
+        self.commit_base = db.commit_seconds
+
+    @contextmanager
+    def stage(self, name, db_id=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, db_id)
+
+    def record(self, name, seconds, db_id=None, nbytes=0):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.counts[name] += 1
+            self.bytes += nbytes
+        self.db.add_metric(self.run_id, db_id, name, seconds, nbytes)
+
+    def finish(self):
+        """Cierra la ejecución: agrega el tiempo de commits del hilo escritor de la DB
+        (con la DB compartida entre motores de Cli.py incluye también los commits de los demás)."""
+        self.db.flush()
+        self.record('db_commit', self.db.commit_seconds - self.commit_base)
+        self.wall = time.time() - self.started
+
+    def summary(self):
+        """Texto para el log: dónde se fue el tiempo (suma de todos los hilos)."""
+        with self.lock:
+            stages = [(name, secs) for name, secs in self.seconds.most_common() if name not in OVERLAPPING]
+            total = sum(secs for _, secs in stages) or 1
+            parts = [f"{STAGE_LABELS.get(name, name)} {secs:.1f} s ({secs * 100 / total:.0f}%)"
+                     for name, secs in stages if secs >= 0.05]
+            ttfb = self.seconds['ttfb'] / self.counts['ttfb'] if self.counts['ttfb'] else None
+        mib = self.bytes / 1048576
+        return (f"⏱ Tiempo por etapa (suma de hilos, reloj {self.wall:.1f} s): " + (", ".join(parts) or "sin esperas apreciables")
+                + f" | {mib:.1f} MiB transferidos"
+                + (f" | primer byte en {ttfb * 1000:.0f} ms de media" if ttfb is not None else ""))
+
+    def prometheus_text(self, outcome, playlist_id=None):
+        # Con varias playlists en paralelo (Cli.py) cada archivo lleva su etiqueta
+        extra = f'playlist="{playlist_id}",' if playlist_id is not None else ""
+        labels = f'{{playlist="{playlist_id}"}}' if playlist_id is not None else ""
+        with self.lock:
+            lines = [
+                "# HELP musicdl_last_run_stage_seconds Tiempo acumulado por etapa en la última ejecución.",
+                "# TYPE musicdl_last_run_stage_seconds gauge",
+            ]
+            lines += [f'musicdl_last_run_stage_seconds{{{extra}stage="{name}"}} {secs:.3f}' for name, secs in sorted(self.seconds.items())]
+            lines += [
+                "# HELP musicdl_last_run_stage_count Mediciones por etapa en la última ejecución.",
+                "# TYPE musicdl_last_run_stage_count gauge",
+            ]
+            lines += [f'musicdl_last_run_stage_count{{{extra}stage="{name}"}} {n}' for name, n in sorted(self.counts.items())]
+            lines += [
+                "# HELP musicdl_last_run_bytes Bytes descargados en la última ejecución.",
+                "# TYPE musicdl_last_run_bytes gauge",
+                f"musicdl_last_run_bytes{labels} {self.bytes}",
+                "# HELP musicdl_last_run_items Videos por resultado en la última ejecución.",
+                "# TYPE musicdl_last_run_items gauge",
+            ]
+            lines += [f'musicdl_last_run_items{{{extra}result="{key}"}} {outcome[key]}'
+                      for key in ('completed', 'failed', 'skipped') if key in outcome]
+            if outcome.get('cpu_saved_s') is not None: # Sin costo de recodificar medido no hay estimación
+                lines += [
+                    "# HELP musicdl_last_run_cpu_saved_seconds CPU estimada que no se gastó gracias a la copia sin recodificar.",
+                    "# TYPE musicdl_last_run_cpu_saved_seconds gauge",
+                    f"musicdl_last_run_cpu_saved_seconds{labels} {outcome['cpu_saved_s']}",
+                ]
+            lines += [
+                "# HELP musicdl_last_run_wall_seconds Duración de la última ejecución.",
+                "# TYPE musicdl_last_run_wall_seconds gauge",
+                f"musicdl_last_run_wall_seconds{labels} {self.wall:.3f}",
+                "# HELP musicdl_last_run_timestamp_seconds Fin de la última ejecución (epoch).",
+                "# TYPE musicdl_last_run_timestamp_seconds gauge",
+                f"musicdl_last_run_timestamp_seconds{labels} {time.time():.0f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path, outcome, playlist_id=None):
+        """Escribe el archivo para el textfile collector de node_exporter (reemplazo atómico)."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text(outcome, playlist_id))
+        os.replace(tmp, path)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class _Deferred(Exception):
+    """La extracción no se hizo (enfriamiento activo): el worker la hará al descargar."""
+
+class MetadataPrefetcher:
+    """Extrae la info completa de los próximos videos mientras se descargan los actuales.
+
+    El dispatcher llama a submit() al encolar cada video; el worker recoge la info
+    con take() y descarga con process_ie_result, sin volver a extraer. Las URLs
+    firmadas de los formatos caducan, así que cada entrada vale solo ttl segundos.
+    Cada extracción espera su turno en throttle (AdaptiveThrottle) como una descarga:
+    el worker que la aprovecha con take() ya no pide otro.
+    """
+    def __init__(self, ydl_pool, opts, workers=2, ttl=1200.0, metrics=None, should_defer=None, throttle=None):
+        self.ydl_pool = ydl_pool
+        self.opts = opts
+        self.ttl = ttl
+        self.metrics = metrics
+        self.should_defer = should_defer or (lambda: False)
+        self.throttle = throttle
+        self.closed = threading.Event() # Corta la espera de turno al cerrar
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.lock = threading.Lock()
+        self.entries = {} # {url: Future -> (info, monotonic de la extracción)}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def submit(self, url):
+        with self.lock:
+            if url not in self.entries:
+                self.entries[url] = self.executor.submit(self._extract, url)
+
+    def _extract(self, url):
+        # Durante un enfriamiento por 429 no se suman peticiones a YouTube
+        if self.should_defer(): raise _Deferred()
+        if self.throttle and not self.throttle.acquire(self.closed.is_set, self.closed.wait):
+            raise _Deferred()
+        start = time.perf_counter()
+        with self.ydl_pool.get(self.opts) as ydl:
+            # process=False: solo la extracción; la selección de formato la hace el worker
+            info = ydl.extract_info(url, download=False, process=False)
+        if self.metrics: self.metrics.record('prefetch', time.perf_counter() - start)
+        return info, time.monotonic()
+
+    def take(self, url, wait):
+        """Info ya extraída de url, o None si no se pidió, caducó o se difirió.
+
+        wait(future) espera una extracción en curso (ej. RunControl.wait_future, que
+        devuelve None ante la parada). Los errores de la extracción se propagan.
+        """
+        with self.lock:
+            future = self.entries.pop(url, None)
+        if future is None:
+            self.misses += 1
+            return None
+        try:
+            result = wait(future)
+        except _Deferred:
+            self.misses += 1
+            return None
+        if result is None:
+            return None
+        info, fetched = result
+        if time.monotonic() - fetched > self.ttl:
+            self.expired += 1
+            return None
+        self.hits += 1
+        return info
+
+    def close(self):
+        self.closed.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        with self.lock:
+            self.entries.clear()
\ No newline at end of file
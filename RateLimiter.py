@@ -0,0 +1,121 @@
+import time
+import random
+import threading
+import email.utils
+
+class AdaptiveThrottle:
+    """Controlador AIMD del ritmo de descargas, compartido por todos los workers.
+
+    Se regula el intervalo mínimo entre inicios de descarga: cada racha de éxitos lo
+    reduce en un paso fijo (aumento aditivo de la tasa) y cada 429 lo multiplica
+    (disminución multiplicativa), además de imponer un enfriamiento que respeta
+    Retry-After. El estado se guarda en la tabla settings para no reiniciar a toda
+    velocidad después de un bloqueo.
+    """
+    def __init__(self, db, min_interval=0.5, max_interval=120.0, start_interval=3.0,
+                 step=0.25, backoff=2.0, increase_after=10, base_cooldown=300, max_cooldown=3600):
+        self.db = db
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.step = step
+        self.backoff = backoff
+        self.increase_after = increase_after
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+
+        settings = db.load_settings()
+        self.interval = float(settings.get('throttle_interval', start_interval))
+        self.cooldown = float(settings.get('throttle_cooldown', base_cooldown))
+        self.cooldown_until = float(settings.get('throttle_cooldown_until', 0))
+        self.next_slot = 0.0
+        self.streak = 0
+        self.start_run()
+
+    def start_run(self):
+        with self.lock:
+            self.run_started = time.time()
+            self.completed = 0
+            self.rate_limits = 0
+
+    def _persist(self):
+        self.db.save_setting('throttle_interval', round(self.interval, 3))
+        self.db.save_setting('throttle_cooldown', round(self.cooldown, 1))
+        self.db.save_setting('throttle_cooldown_until', round(self.cooldown_until, 1))
+
+    def cooldown_remaining(self):
+        return max(0.0, self.cooldown_until - time.time())
+
+    def acquire(self, should_stop, wait=None):
+        """Bloquea hasta el próximo turno libre. Devuelve False si se pidió parar.
+
+        wait(segundos) hace la espera; si la orden de parada la interrumpe (ej. Event.wait),
+        la respuesta es inmediata. Por defecto se duerme en tramos de 0.5 s.
+        """
+        wait = wait or (lambda seconds: time.sleep(min(0.5, seconds)))
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_slot, self.cooldown_until)
+            # Jitter de ±20% para no producir un patrón perfectamente regular
+            self.next_slot = start + self.interval * random.uniform(0.8, 1.2)
+        while time.time() < start:
+            if should_stop(): return False
+            wait(start - time.time())
+        return not should_stop()
+
+    def on_success(self):
+        with self.lock:
+            self.completed += 1
+            self.streak += 1
+            self.cooldown = self.base_cooldown # Tras un éxito el próximo 429 vuelve al enfriamiento base
+            if self.streak >= self.increase_after and self.interval > self.min_interval:
+                self.interval = max(self.min_interval, self.interval - self.step)
+                self.streak = 0
+                self._persist()
+
+    def on_rate_limit(self, retry_after=None):
+        """Registra un 429. Devuelve los segundos de enfriamiento aplicados."""
+        with self.lock:
+            self.rate_limits += 1
+            self.streak = 0
+            now = time.time()
+            # Varios workers pueden recibir el mismo 429: solo cuenta el primero
+            if self.cooldown_until > now:
+                return self.cooldown_until - now
+            self.interval = min(self.max_interval, self.interval * self.backoff)
+            wait = retry_after if retry_after is not None else self.cooldown
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self.cooldown_until = now + wait
+            self.next_slot = self.cooldown_until
+            self._persist()
+            return wait
+
+    def items_per_hour(self):
+        elapsed = time.time() - self.run_started
+        return self.completed * 3600 / elapsed if elapsed > 0 else 0.0
+
+def retry_after_from_error(exc):
+    """Busca una cabecera Retry-After en la cadena de excepciones de yt-dlp."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = getattr(exc, 'response', None)
+        headers = getattr(response, 'headers', None) or getattr(exc, 'headers', None)
+        value = headers.get('Retry-After') if headers is not None else None
+        if value:
+            return parse_retry_after(value)
+        exc_info = getattr(exc, 'exc_info', None)
+        nxt = exc_info[1] if exc_info else None
+        exc = nxt or exc.__cause__ or exc.__context__
+    return None
+
+def parse_retry_after(value):
+    """Retry-After puede venir en segundos o como fecha HTTP."""
+    value = str(value).strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
\ No newline at end of file
@@ -0,0 +1,36 @@
+import random
+
+# Clases de error guardadas en videos.error_class
+TRANSIENT = "TRANSIENT"
+RATE_LIMIT = "RATE_LIMIT"
+PERMANENT = "PERMANENT"
+
+BASE_DELAY = 60.0       # Primer reintento de un error transitorio (segundos)
+MAX_DELAY = 6 * 3600.0  # Tope del backoff exponencial
+RETRY_WINDOW = 600.0    # Reintentos que vencen dentro de la misma ejecución
+
+# Fragmentos de los mensajes de yt-dlp que no se arreglan reintentando
+PERMANENT_MARKERS = (
+    "private video",
+    "video unavailable",
+    "this video has been removed",
+    "this video is no longer available",
+    "account associated with this video has been terminated",
+    "this video is not available",
+    "copyright",
+    "members-only",
+    "join this channel",
+    "unsupported url",
+    "is not a valid url",
+    "sign in to confirm your age",
+)
+
+def classify_error(msg):
+    """TRANSIENT o PERMANENT según el mensaje de yt-dlp (los 429 se detectan antes, en el motor)."""
+    text = (msg or "").lower()
+    return PERMANENT if any(marker in text for marker in PERMANENT_MARKERS) else TRANSIENT
+
+def retry_delay(attempts):
+    """Backoff exponencial con jitter de ±20% para el intento número attempts (1 = primer fallo)."""
+    delay = min(MAX_DELAY, BASE_DELAY * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
\ No newline at end of file
@@ -39,6 +39,18 @@ class SettingsView:
         ttk.Label(frame, text="Bitrate:").pack(side="left", padx=10)
         ttk.Combobox(frame, textvariable=self.vars['bitrate'], values=["128", "192", "320"], width=6).pack(side="left")
 
+        perf = ttk.LabelFrame(parent, text="Rendimiento", padding=10)
+        perf.pack(fill="x", pady=5)
+        ttk.Label(perf, text="Descargas simultáneas:").pack(side="left")
+        ttk.Spinbox(perf, textvariable=self.vars['concurrency'], from_=1, to=8, width=4).pack(side="left", padx=5)
+        ttk.Checkbutton(perf, text="Sincronización incremental (listas con lo más nuevo primero)",
+                        variable=self.vars['incremental']).pack(side="left", padx=10)
+
+        level = ttk.LabelFrame(parent, text="Nivel", padding=10)
+        level.pack(fill="x", pady=5)
+        ttk.Checkbutton(level, text="Analizar sonoridad y escribir ReplayGain (requiere NumPy)",
+                        variable=self.vars['replaygain']).pack(side="left")
+
     def _build_tags_frame(self, parent):
         frame = ttk.LabelFrame(parent, text="Constructor de Nombres", padding=10)
         frame.pack(fill="both", expand=True, pady=10)
@@ -0,0 +1,103 @@
+import os
+import subprocess
+try:
+    import resource # Solo POSIX: tiempo de CPU de ffmpeg
+except ImportError:
+    resource = None
+
+# Este módulo se importa en los procesos del pool de conversión:
+# debe seguir siendo liviano (sin yt_dlp ni tkinter).
+
+CODEC_ARGS = {
+    'mp3': ['-c:a', 'libmp3lame'],
+    'm4a': ['-c:a', 'aac'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'flac': ['-c:a', 'flac'],
+}
+LOSSLESS = ('wav', 'flac')
+
+# Códecs de origen que se pueden copiar tal cual al contenedor destino (prefijos de acodec)
+COPY_CODECS = {
+    'm4a': ('mp4a', 'aac'),
+    'mp3': ('mp3',),
+}
+
+def format_selector(fmt):
+    """Selector de yt-dlp que prefiere un stream copiable al formato destino."""
+    prefer = "/".join(f"bestaudio[acodec^={codec}]" for codec in COPY_CODECS.get(fmt, ()))
+    return f"{prefer}/bestaudio/best" if prefer else "bestaudio/best"
+
+def can_copy(fmt, bitrate, source):
+    """True si el audio descargado ya sirve: mismo códec y sin bitrate de más que recortar."""
+    acodec = (source or {}).get('acodec') or ''
+    if not acodec.startswith(COPY_CODECS.get(fmt, ())):
+        return False
+    abr = source.get('abr')
+    # Subir el bitrate no mejora la calidad: solo se recodifica si el origen es bastante mayor
+    return not (abr and bitrate and float(abr) > float(bitrate) * 1.1)
+
+def tags_from_info(info):
+    """Extrae de la info de yt-dlp las etiquetas que antes escribía FFmpegMetadata."""
+    tags = {
+        'title': info.get('track') or info.get('title'),
+        'artist': info.get('artist') or info.get('creator') or info.get('uploader'),
+        'album': info.get('album'),
+        'date': info.get('release_date') or info.get('upload_date'),
+        'comment': info.get('webpage_url'),
+    }
+    return {k: str(v) for k, v in tags.items() if v}
+
+def build_command(src, dst, fmt, bitrate, tags, copy=False):
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-i', src, '-vn', '-map_metadata', '-1']
+    if copy:
+        # Solo remux: el stream de audio se copia sin recodificar
+        cmd += ['-c:a', 'copy']
+    else:
+        cmd += CODEC_ARGS.get(fmt, [])
+        if fmt not in LOSSLESS and bitrate:
+            cmd += ['-b:a', f'{bitrate}k']
+    for key, value in tags.items():
+        cmd += ['-metadata', f'{key}={value}']
+    cmd.append(dst)
+    return cmd
+
+def transcode_job(job):
+    """Convierte y etiqueta un archivo de staging. Se ejecuta en el pool de procesos.
+
+    job: {'db_id', 'video_id', 'src', 'dst', 'format', 'bitrate', 'tags', 'copy', 'replaygain', 'out'}
+    El resultado queda en 'out' (staging) y lo publica el motor, que recién entonces borra
+    'src'. ffmpeg escribe a un temporal que se renombra al terminar: un 'out' que ya existe
+    está completo (ej. una parada antes de publicar) y se reutiliza sin convertir de nuevo.
+    Devuelve también el tiempo de CPU de ffmpeg ('cpu', None si no se puede medir) y, con
+    replaygain, la sonoridad medida ('loudness', ver Loudness.analyze_file).
+    """
+    out = job['out']
+    cpu = None
+    if not os.path.exists(out):
+        base, ext = os.path.splitext(out)
+        tmp = f"{base}.tmp{ext}"
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        cmd = build_command(job['src'], tmp, job['format'], job['bitrate'], job.get('tags', {}), job.get('copy', False))
+        before = _children_cpu()
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        cpu = _children_cpu() - before if resource else None
+        if proc.returncode != 0:
+            if os.path.exists(tmp): os.remove(tmp)
+            err = proc.stderr.decode('utf-8', 'replace').strip()
+            raise RuntimeError(f"ffmpeg falló ({proc.returncode}): {err[-300:]}")
+        os.replace(tmp, out)
+
+    loudness = None
+    if job.get('replaygain'):
+        # Se etiqueta antes de publicar; un fallo del análisis no tira la conversión
+        import Loudness # NumPy solo se carga en los procesos que lo usan
+        try:
+            loudness = Loudness.analyze_file(out)
+        except Exception as e:
+            loudness = {'error': str(e)}
+    return {'db_id': job['db_id'], 'filepath': out, 'size': os.path.getsize(out), 'cpu': cpu, 'loudness': loudness}
+
+def _children_cpu():
+    if resource is None: return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
\ No newline at end of file
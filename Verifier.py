@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+DURATION_TOLERANCE = 2.0 # Segundos (o 2%) de diferencia admitidos frente a la duración original
+
+def probe_duration(filepath):
+    """Duración en segundos según ffprobe, o None si el archivo no se puede leer."""
+    cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', filepath]
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+        return float(proc.stdout.decode().strip()) if proc.returncode == 0 else None
+    except (OSError, ValueError, subprocess.TimeoutExpired):
+        return None
+
+class LibraryVerifier:
+    """Comprueba contra el disco todos los videos COMPLETED, en paralelo.
+
+    Revisa existencia, tamaño y (con probe=True) la duración con ffprobe. Los
+    archivos cuyo tamaño y mtime no cambiaron desde la última verificación se
+    saltan (tabla stat_cache). Un tamaño distinto al registrado no basta para
+    descartar el archivo (puede ser una edición de etiquetas): se comprueba con
+    ffprobe y, si se lee bien, se actualiza el registro. Solo un archivo vacío o
+    ilegible se renombra a .broken (para que el índice de archivos no lo
+    reutilice); las filas rotas vuelven a PENDING.
+    """
+    def __init__(self, db, log_callback, workers=8, probe=False):
+        self.db = db
+        self.log = log_callback
+        self.workers = workers
+        self.probe = probe
+        self.ffprobe = shutil.which('ffprobe') is not None
+        self.stop_flag = False
+
+    def request_stop(self):
+        self.stop_flag = True
+
+    def run(self, playlist_id=None, page_size=500):
+        """Devuelve {'checked', 'cached', 'ok', 'broken', 'changed', 'unverified'}."""
+        self.stop_flag = False
+        stats = Counter()
+        self.log("--- VERIFICANDO BIBLIOTECA... ---")
+        if self.probe and not self.ffprobe:
+            self.log("⚠️ ffprobe no está disponible: no se comprobará la duración.")
+        page = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for row in self.db.iter_completed_videos(playlist_id, page_size):
+                if self.stop_flag: break
+                page.append(row)
+                if len(page) >= page_size:
+                    self._check_page(pool, page, stats)
+                    page = []
+            if page and not self.stop_flag:
+                self._check_page(pool, page, stats)
+
+        self.log(f"🩺 Verificados: {stats['checked']} (sin cambios: {stats['cached']}), "
+                 f"correctos: {stats['ok']} (tamaño actualizado: {stats['changed']}), "
+                 f"sin comprobar: {stats['unverified']}, devueltos a la cola: {stats['broken']}")
+        return {key: stats[key] for key in ('checked', 'cached', 'ok', 'broken', 'changed', 'unverified')}
+
+    def _check_page(self, pool, page, stats):
+        cache = self.db.get_stat_cache(row[1] for row in page if row[1])
+        for row, (verdict, reason) in zip(page, pool.map(lambda r: self._check(r, cache), page)):
+            stats['checked'] += 1
+            name = os.path.basename(row[1] or '?')
+            if verdict == 'broken':
+                self.log(f"🩹 {name}: {reason}")
+                self.db.reset_broken(row[0], row[1], f"Verificación: {reason}")
+                stats['broken'] += 1
+            elif verdict == 'unverified':
+                # El archivo no se toca: sin ffprobe no hay forma de saber si está dañado
+                self.log(f"⚠️ {name}: {reason}")
+                stats['unverified'] += 1
+            else:
+                if verdict == 'changed': self.log(f"📝 {name}: {reason}")
+                stats[verdict] += 1
+                if verdict in ('cached', 'changed'): stats['ok'] += 1
+
+    def _check(self, row, cache):
+        """Devuelve (veredicto, motivo): 'ok', 'cached', 'changed', 'unverified' o 'broken'."""
+        db_id, filepath, filesize, meta_json = row
+        if not filepath:
+            return 'broken', "sin ruta registrada"
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            return 'broken', "no existe"
+
+        cached = cache.get(filepath)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns and (cached[2] or not self.probe):
+            return 'cached', ""
+
+        if st.st_size == 0:
+            return self._quarantine(filepath, "archivo vacío")
+
+        resized = bool(filesize) and st.st_size != filesize
+        if resized and not self.ffprobe:
+            return 'unverified', f"tamaño {st.st_size} (esperado {filesize}); sin ffprobe no se puede comprobar"
+
+        duration = None
+        if self.ffprobe and (self.probe or resized):
+            duration = probe_duration(filepath)
+            if not duration:
+                return self._quarantine(filepath, "ffprobe no pudo leerlo")
+            expected = (json.loads(meta_json or "{}").get('source') or {}).get('duration')
+            if self.probe and expected and abs(duration - expected) > max(DURATION_TOLERANCE, expected * 0.02):
+                return self._quarantine(filepath, f"duración {duration:.0f} s (esperada {expected:.0f} s)")
+
+        self.db.save_stat_cache(filepath, st.st_size, st.st_mtime_ns, duration)
+        if resized:
+            # Se lee bien: el cambio es externo (ej. etiquetas editadas) y pasa a ser el tamaño esperado
+            self.db.update_filesize(db_id, st.st_size)
+            return 'changed', f"tamaño {st.st_size} (registrado {filesize}), se lee bien; registro actualizado"
+        return 'ok', ""
+
+    def _quarantine(self, filepath, reason):
+        # Se conserva el archivo por si el usuario quiere revisarlo, pero fuera del índice
+        try:
+            os.replace(filepath, f"{filepath}.broken")
+        except OSError:
+            pass
+        return 'broken', reason
\ No newline at end of file
@@ -0,0 +1,63 @@
+import os
+import threading
+from contextlib import contextmanager
+
+class YdlPool:
+    """Reutiliza instancias de YoutubeDL entre videos en lugar de crear una por intento.
+
+    Cada instancia mantiene sus cookies ya parseadas, los extractores inicializados y
+    la sesión HTTP abierta (keep-alive). Las instancias no son thread-safe, así que se
+    prestan a un solo hilo a la vez y se agrupan por configuración.
+    """
+    def __init__(self, factory, keep_on=()):
+        self.factory = factory # opts -> YoutubeDL
+        self.keep_on = keep_on # Excepciones que no invalidan la instancia (ej. DownloadError)
+        self.lock = threading.Lock()
+        self.idle = {} # {clave_config: [instancias libres]}
+        self.created = 0
+
+    @staticmethod
+    def _key(opts):
+        cookie = opts.get('cookiefile')
+        # Si el archivo de cookies cambia en disco hay que volver a cargarlo
+        cookie_mtime = os.path.getmtime(cookie) if cookie and os.path.exists(cookie) else None
+        return repr((sorted((k, repr(v)) for k, v in opts.items()), cookie_mtime))
+
+    @contextmanager
+    def get(self, opts):
+        key = self._key(opts)
+        with self.lock:
+            free = self.idle.get(key)
+            ydl = free.pop() if free else None
+        if ydl is None:
+            ydl = self.factory(opts)
+            with self.lock:
+                self.created += 1
+
+        healthy = False
+        try:
+            yield ydl
+            healthy = True
+        except self.keep_on:
+            healthy = True
+            raise
+        finally:
+            if healthy:
+                with self.lock:
+                    self.idle.setdefault(key, []).append(ydl)
+            else:
+                self._close(ydl)
+
+    def close(self):
+        with self.lock:
+            instances = [ydl for free in self.idle.values() for ydl in free]
+            self.idle = {}
+        for ydl in instances:
+            self._close(ydl)
+
+    @staticmethod
+    def _close(ydl):
+        try:
+            ydl.close()
+        except Exception:
+            pass
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Micro-benchmark: costo de preparación por video con y sin YdlPool.
+
+Mide solo el overhead de crear/usar la instancia de YoutubeDL (cookies, extractores,
+sesión HTTP), sin tráfico de red.
+
+    python benchmarks/bench_ydl_reuse.py [--items 200] [--cookies cookies.txt]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import yt_dlp
+from YdlPool import YdlPool
+
+def make_opts(cookie):
+    opts = {'format': 'bestaudio/best', 'outtmpl': '%(id)s.f%(format_id)s.%(ext)s',
+            'quiet': True, 'no_warnings': True}
+    if cookie: opts['cookiefile'] = cookie
+    return opts
+
+def per_item_instance(opts, items):
+    """Comportamiento anterior: una instancia nueva por intento."""
+    start = time.perf_counter()
+    for _ in range(items):
+        with yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.get_info_extractor('Youtube')
+    return time.perf_counter() - start
+
+def pooled_instance(opts, items):
+    pool = YdlPool(yt_dlp.YoutubeDL)
+    start = time.perf_counter()
+    for _ in range(items):
+        with pool.get(opts) as ydl:
+            ydl.get_info_extractor('Youtube')
+    elapsed = time.perf_counter() - start
+    pool.close()
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--cookies', default=None)
+    args = parser.parse_args()
+
+    opts = make_opts(args.cookies)
+    before = per_item_instance(opts, args.items)
+    after = pooled_instance(opts, args.items)
+    print(json.dumps({
+        'items': args.items,
+        'per_item_ms_before': round(before / args.items * 1000, 3),
+        'per_item_ms_after': round(after / args.items * 1000, 3),
+        'speedup': round(before / after, 1) if after else None,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+"""Sustitutos locales para medir DownloadEngine sin tocar YouTube.
+
+- AudioServer: servidor HTTP local que entrega audio sintético con latencia y
+  ancho de banda configurables, soporte de Range e inyección de 429 (con Retry-After).
+- install_fake_yt_dlp(): registra un módulo 'yt_dlp' falso en sys.modules. Su
+  YoutubeDL genera playlists planas de N entradas y descarga desde AudioServer.
+  Debe llamarse antes de importar Engine.
+- fake_transcode(): reemplazo de Transcoder.transcode_job que copia el archivo
+  (opcionalmente con un costo de CPU simulado, salvo en la copia sin
+  recodificar) para no depender de ffmpeg.
+"""
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import types
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class AudioServer:
+    def __init__(self, size_bytes=256 * 1024, latency_s=0.0, p429=0.0, retry_after=1, seed=0, bandwidth_kbps=0):
+        self.size = size_bytes
+        self.latency = latency_s
+        self.bandwidth = bandwidth_kbps * 1024 # 0 = sin límite
+        self.p429 = p429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+        self.bytes_sent = 0
+        self.payload = bytes(range(256)) * (size_bytes // 256 + 1)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    limited = server.rng.random() < server.p429
+                    if limited: server.rate_limited += 1
+                if server.latency: time.sleep(server.latency)
+                if limited:
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                start = 0
+                rng = self.headers.get("Range")
+                if rng and rng.startswith("bytes="):
+                    start = int(rng[6:].split("-")[0] or 0)
+                body = server.payload[start:server.size]
+                with server.lock:
+                    server.bytes_sent += len(body) # Aproximado si el cliente corta antes
+                self.send_response(206 if start else 200)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Content-Type", "audio/webm")
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if not server.bandwidth:
+                    self.wfile.write(body)
+                    return
+                step = 16 * 1024
+                try:
+                    for offset in range(0, len(body), step):
+                        self.wfile.write(body[offset:offset + step])
+                        time.sleep(step / server.bandwidth)
+                except ConnectionError:
+                    pass # El cliente cortó la descarga (parada, pausa o salto)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class DownloadError(Exception):
+    def __init__(self, msg, exc_info=None):
+        super().__init__(msg)
+        self.msg = msg
+        self.exc_info = exc_info
+
+class DownloadCancelled(Exception):
+    pass
+
+class FakeYoutubeDL:
+    """Imita la parte de la API de YoutubeDL que usa DownloadEngine."""
+    server = None # Se fija en install_fake_yt_dlp
+    playlist_size = 10
+    extract_delay = 0.0 # Segundos de la extracción de cada video (página + reproductor)
+    instances = 0
+
+    def __init__(self, params=None):
+        type(self).instances += 1
+        self.params = dict(params or {})
+        self._progress_hooks = list(self.params.get('progress_hooks') or [])
+        self._postprocessor_hooks = list(self.params.get('postprocessor_hooks') or [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def add_progress_hook(self, hook):
+        self._progress_hooks.append(hook)
+
+    def add_postprocessor_hook(self, hook):
+        self._postprocessor_hooks.append(hook)
+
+    def _entries(self):
+        for i in range(self.playlist_size):
+            vid = f"bench{i:06d}"
+            yield {'_type': 'url', 'id': vid, 'title': f"Track {i}",
+                   'url': f"https://www.youtube.com/watch?v={vid}"}
+
+    def _video_info(self, url):
+        vid = url.rsplit("=", 1)[-1]
+        return {
+            'id': vid, 'title': f"Track {vid}", 'artist': "Bench", 'album': "Synthetic",
+            'upload_date': "20240101", 'ext': "webm", 'format_id': "251", 'acodec': "opus",
+            'abr': 128, 'duration': 180, 'webpage_url': url,
+            'url': f"{self.server.base_url}/audio/{vid}",
+        }
+
+    def _select_format(self, info):
+        # Como YouTube: si el selector pide AAC se entrega el stream m4a (itag 140)
+        if str(self.params.get('format', '')).startswith("bestaudio[acodec^=mp4a]"):
+            info.update(ext="m4a", format_id="140", acodec="mp4a.40.2")
+        return info
+
+    def extract_info(self, url, download=True, ie_key=None, process=True):
+        if self.params.get('extract_flat') and "&list=" in url:
+            # Como YoutubeTab: un video dentro de una lista redirige a la lista
+            list_id = url.split("&list=", 1)[1].split("&", 1)[0]
+            return {'_type': 'url', 'url': f"https://www.youtube.com/playlist?list={list_id}", 'ie_key': "YoutubeTab"}
+        if self.params.get('extract_flat'):
+            return {'_type': 'playlist', 'id': "PLBENCH", 'title': "Bench playlist", 'entries': self._entries()}
+        if self.extract_delay: time.sleep(self.extract_delay)
+        info = self._video_info(url)
+        return self.process_ie_result(info, download=download) if process else info
+
+    def prepare_filename(self, info, dir_type='', *, outtmpl=None, warn=False):
+        tmpl = outtmpl or self.params.get('outtmpl') or "%(id)s.%(ext)s"
+        if isinstance(tmpl, dict): tmpl = tmpl.get('default')
+        fields = {'artist': "NA", 'album': "NA", 'upload_date': "NA"}
+        fields.update(info)
+        return tmpl % fields
+
+    def process_ie_result(self, info, download=True, extra_info=None):
+        # La selección de formato ocurre aquí, con las opciones de esta instancia
+        info = self._select_format(dict(info))
+        if not download:
+            return info
+        filename = self.prepare_filename(info)
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        part = filename + ".part"
+        done = os.path.getsize(part) if os.path.exists(part) else 0
+
+        request = urllib.request.Request(info['url'])
+        if done: request.add_header("Range", f"bytes={done}-")
+        try:
+            response = urllib.request.urlopen(request, timeout=30)
+        except urllib.error.HTTPError as e:
+            raise DownloadError(f"ERROR: unable to download video data: HTTP Error {e.code}: {e.reason}",
+                                exc_info=(type(e), e, None))
+
+        total = done + int(response.headers.get("Content-Length", 0))
+        with response, open(part, "ab" if done else "wb") as f:
+            while True:
+                chunk = response.read(64 * 1024)
+                if not chunk: break
+                f.write(chunk)
+                done += len(chunk)
+                self._hook({'status': 'downloading', 'filename': filename, 'tmpfilename': part,
+                            'downloaded_bytes': done, 'total_bytes': total, 'info_dict': info})
+        os.replace(part, filename)
+        info['filepath'] = filename
+        info['requested_downloads'] = [{'filepath': filename, 'filesize': done}]
+        self._hook({'status': 'finished', 'filename': filename, 'downloaded_bytes': done,
+                    'total_bytes': total, 'info_dict': info})
+        return info
+
+    def _hook(self, d):
+        for hook in self._progress_hooks:
+            hook(d)
+
+    def download(self, urls):
+        for url in urls:
+            self.extract_info(url, download=True)
+        return 0
+
+def install_fake_yt_dlp(server, playlist_size, extract_delay=0.0):
+    """Registra el yt_dlp falso. Devuelve la clase para poder consultar contadores."""
+    FakeYoutubeDL.server = server
+    FakeYoutubeDL.playlist_size = playlist_size
+    FakeYoutubeDL.extract_delay = extract_delay
+    module = types.ModuleType("yt_dlp")
+    utils = types.ModuleType("yt_dlp.utils")
+    utils.DownloadError = DownloadError
+    utils.DownloadCancelled = DownloadCancelled
+    module.YoutubeDL = FakeYoutubeDL
+    module.utils = utils
+    sys.modules["yt_dlp"] = module
+    sys.modules["yt_dlp.utils"] = utils
+    return FakeYoutubeDL
+
+def fake_transcode(job):
+    """Copia el archivo de staging a job['out'] como lo haría transcode_job, sin ffmpeg."""
+    cpu_ms = 0.0 if job.get('copy') else float(os.environ.get("BENCH_TRANSCODE_MS", "0"))
+    start = time.process_time()
+    if cpu_ms:
+        end = time.process_time() + cpu_ms / 1000
+        while time.process_time() < end:
+            pass
+    dst = job['out']
+    if not os.path.exists(dst): # Como transcode_job: una salida completa se reutiliza y src se conserva
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+        base, ext = os.path.splitext(dst)
+        shutil.copyfile(job['src'], f"{base}.tmp{ext}")
+        os.replace(f"{base}.tmp{ext}", dst)
+    return {'db_id': job['db_id'], 'filepath': dst, 'size': os.path.getsize(dst),
+            'cpu': time.process_time() - start}
\ No newline at end of file
@@ -0,0 +1,464 @@
+"""Suite de benchmarks offline de DownloadEngine y sus caminos críticos.
+
+Cada caso corre en un subproceso propio (el pico de RSS es por caso) contra los
+sustitutos de fakes.py: ni YouTube ni ffmpeg intervienen.
+
+    python benchmarks/run_benchmarks.py --sizes 10,100,1000 --out bench.json
+    python benchmarks/run_benchmarks.py --suites db,scan --compare bench_anterior.json
+
+Suites:
+    engine  DownloadEngine.run de punta a punta (items/s, p50/p95 por item y hasta el primer byte, RSS)
+    db      caminos críticos de Database.py (ingesta, cola pendiente, updates)
+    scan    detección de duplicados: FileIndex frente al listdir por video anterior
+    log     LogChannel con varios hilos productores
+    control latencia de parada y de pausa con descargas lentas en curso
+    startup arranque en frío: ventana frente a motor listo (import de yt_dlp + DB)
+    lease   varios nodos de un mismo equipo vaciando una cola con leases (escalado y descargas repetidas)
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentiles(samples):
+    if not samples:
+        return {'p50_ms': None, 'p95_ms': None}
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {'p50_ms': round(statistics.median(ordered) * 1000, 2), 'p95_ms': round(p95 * 1000, 2)}
+
+# --- CASOS (se ejecutan dentro del subproceso) ---
+def case_engine(args):
+    from fakes import AudioServer, install_fake_yt_dlp, fake_transcode
+
+    with AudioServer(size_bytes=args.item_kb * 1024, latency_s=args.latency_ms / 1000,
+                     p429=args.p429, retry_after=1) as server:
+        fake = install_fake_yt_dlp(server, args.size, extract_delay=args.extract_ms / 1000)
+        import Engine
+        from Database import DatabaseManager
+        Engine.transcode_job = fake_transcode
+
+        work = tempfile.mkdtemp(prefix="bench_engine_")
+        db = DatabaseManager(os.path.join(work, "bench.db"))
+        engine = Engine.DownloadEngine(log_callback=lambda msg: None, db=db)
+        # Sin pausas artificiales: se mide el motor, no el ritmo anti-bloqueo
+        throttle = engine.throttle
+        throttle.interval = throttle.min_interval = 0.0
+        throttle.cooldown = throttle.base_cooldown = 1
+
+        latencies = []
+        lock = threading.Lock()
+        download = engine._download_safe
+
+        def timed_download(*a, **kw):
+            start = time.perf_counter()
+            try:
+                return download(*a, **kw)
+            finally:
+                with lock: latencies.append(time.perf_counter() - start)
+        engine._download_safe = timed_download
+
+        ttfb = []
+        record = Engine.RunMetrics.record
+        def record_ttfb(metrics, name, seconds, *a, **kw):
+            if name == 'ttfb':
+                with lock: ttfb.append(seconds)
+            return record(metrics, name, seconds, *a, **kw)
+        Engine.RunMetrics.record = record_ttfb
+
+        config = {'format': args.format, 'bitrate': '192', 'name_template': '%(artist)s - %(title)s',
+                  'concurrency': args.concurrency, 'transcode_workers': args.transcoders, 'cache_ttl': 0,
+                  'prefetch': args.prefetch}
+        start = time.perf_counter()
+        summary = engine.run("https://www.youtube.com/playlist?list=PLBENCH", os.path.join(work, "out"), config)
+        elapsed = time.perf_counter() - start
+        engine.close()
+        db.close()
+
+    return {
+        'size': args.size, 'concurrency': args.concurrency, 'latency_ms': args.latency_ms, 'p429': args.p429,
+        'format': args.format, 'extract_ms': args.extract_ms, 'prefetch': args.prefetch, 'elapsed_s': round(elapsed, 3), 'items_per_s': round(summary['completed'] / elapsed, 2) if elapsed else None,
+        **percentiles(latencies), **{f"ttfb_{k}": v for k, v in percentiles(ttfb).items()}, **summary,
+        'http_requests': server.requests, 'http_429': server.rate_limited,
+        'ydl_instances': fake.instances, 'peak_rss_mb': peak_rss_mb(),
+    }
+
+def case_db(args):
+    from Database import DatabaseManager
+
+    work = tempfile.mkdtemp(prefix="bench_db_")
+    db = DatabaseManager(os.path.join(work, "bench.db"))
+    pl = db.get_or_create_playlist("https://bench")
+    n = args.size
+    result = {'size': n}
+
+    start = time.perf_counter()
+    entries = ({'id': f"v{i}", 'title': f"T{i}", 'url': f"u{i}"} for i in range(n))
+    added = 0
+    from Ingest import iter_chunks
+    for chunk in iter_chunks(entries):
+        added += db.add_videos_to_playlist(pl, chunk)
+    result['ingest_rows_per_s'] = round(added / (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    db.add_videos_to_playlist(pl, ({'id': f"v{i}"} for i in range(n)))
+    result['reingest_duplicates_per_s'] = round(n / (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    walked = sum(1 for _ in db.iter_pending_videos(pl))
+    result['pending_walk_rows_per_s'] = round(walked / (time.perf_counter() - start))
+
+    # Updates concurrentes desde varios hilos, como harían los workers
+    threads = 8
+    def updater(k):
+        for db_id in range(k + 1, n + 1, threads):
+            db.update_video_status(db_id, "COMPLETED", filepath=f"/x/{db_id}.mp3")
+    start = time.perf_counter()
+    pool = [threading.Thread(target=updater, args=(k,)) for k in range(threads)]
+    for t in pool: t.start()
+    for t in pool: t.join()
+    db.flush()
+    result['status_updates_per_s'] = round(n / (time.perf_counter() - start))
+
+    start = time.perf_counter()
+    db.get_known_video_ids(pl, [f"v{i}" for i in range(0, n, 2)])
+    result['known_ids_lookup_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    db.close()
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def case_scan(args):
+    from Database import DatabaseManager
+    from FileIndex import FileIndex, AUDIO_EXTENSIONS
+
+    work = tempfile.mkdtemp(prefix="bench_scan_")
+    folder = os.path.join(work, "library")
+    os.makedirs(folder)
+    n = args.size
+    for i in range(n):
+        open(os.path.join(folder, f"Artist - Track {i} [v{i:08d}].mp3"), "wb").close()
+    probes = [f"v{i:08d}" for i in range(0, n, max(1, n // min(n, args.probes)))][:args.probes]
+
+    db = DatabaseManager(os.path.join(work, "bench.db"))
+    index = FileIndex(db)
+    result = {'size': n, 'probes': len(probes)}
+
+    start = time.perf_counter()
+    index.refresh(folder)
+    result['index_cold_scan_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    fresh = FileIndex(db) # Nuevo proceso: el índice sale de la DB si la carpeta no cambió
+    start = time.perf_counter()
+    fresh.refresh(folder)
+    result['index_warm_refresh_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+    start = time.perf_counter()
+    for vid in probes: fresh.lookup(folder, vid)
+    result['index_lookup_us'] = round((time.perf_counter() - start) / len(probes) * 1e6, 3)
+
+    # Comportamiento anterior: un listdir completo por cada video pendiente
+    start = time.perf_counter()
+    for vid in probes:
+        for name in os.listdir(folder):
+            if vid in name and name.endswith(AUDIO_EXTENSIONS): break
+    result['legacy_listdir_per_video_ms'] = round((time.perf_counter() - start) / len(probes) * 1000, 3)
+
+    db.close()
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+def case_log(args):
+    from Logger import LogChannel, ConsoleLogger
+
+    channel = LogChannel()
+    logger = ConsoleLogger(channel.put, channel.set_progress)
+    producers, per_thread = 8, args.size
+    stop = threading.Event()
+    drained = [0]
+
+    def ui_tick():
+        # Simula el after() de la UI cada 100 ms
+        while True:
+            finished = stop.is_set()
+            lines, dropped, _ = channel.drain()
+            drained[0] += len(lines)
+            if finished: return
+            time.sleep(0.1)
+
+    def producer(k):
+        for i in range(per_thread):
+            if i % 4 == 0: logger.info(f"[download]  {i % 100}.0% of 3.2MiB at 1.0MiB/s")
+            else: logger.info(f"[{k}] mensaje {i}")
+
+    tick = threading.Thread(target=ui_tick)
+    tick.start()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=producer, args=(k,)) for k in range(producers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    tick.join()
+    return {'messages': producers * per_thread, 'messages_per_s': round(producers * per_thread / elapsed),
+            'lines_delivered': drained[0], 'peak_rss_mb': peak_rss_mb()}
+
+def case_control(args):
+    from fakes import AudioServer, install_fake_yt_dlp, fake_transcode
+
+    # Descargas de ~4 s cada una: la parada y la pausa siempre encuentran transferencias activas
+    with AudioServer(size_bytes=4 * 1024 * 1024, bandwidth_kbps=1024) as server:
+        install_fake_yt_dlp(server, args.size)
+        import Engine
+        from Database import DatabaseManager
+        Engine.transcode_job = fake_transcode
+
+        work = tempfile.mkdtemp(prefix="bench_control_")
+        db = DatabaseManager(os.path.join(work, "bench.db"))
+        engine = Engine.DownloadEngine(log_callback=lambda msg: None, db=db)
+        engine.throttle.interval = engine.throttle.min_interval = 0.0
+        config = {'format': 'mp3', 'bitrate': '192', 'name_template': '%(title)s',
+                  'concurrency': args.concurrency, 'transcode_workers': args.transcoders, 'cache_ttl': 0}
+
+        runner = threading.Thread(target=engine.run, args=("https://www.youtube.com/playlist?list=PLBENCH",
+                                                          os.path.join(work, "out"), config))
+        runner.start()
+        time.sleep(1.5)
+        engine.pause()
+        time.sleep(1.0)
+        engine.resume()
+        time.sleep(1.5)
+        stop_at = time.perf_counter()
+        engine.request_stop()
+        runner.join()
+        run_returned = time.perf_counter() - stop_at
+        # Los .part quedan en el staging del motor (por defecto en el temporal del sistema, fuera de work)
+        scratch = engine._scratch_root(config)
+        partials = sum(1 for root, _, files in os.walk(scratch) for f in files if f.endswith(".part"))
+        latencies = engine.control.latencies
+        engine.close()
+        db.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {'size': args.size, 'concurrency': args.concurrency,
+            'pause_latency_ms': [round(x * 1000, 1) for x in latencies['pause']],
+            'stop_latency_ms': [round(x * 1000, 1) for x in latencies['stop']],
+            'run_return_after_stop_ms': round(run_returned * 1000, 1),
+            'partials_kept': partials, 'peak_rss_mb': peak_rss_mb()}
+
+def case_startup(args):
+    # El subproceso es nuevo: todos los imports son en frío (salvo la caché de disco del SO)
+    start = time.perf_counter()
+    import App
+    import_app = time.perf_counter() - start
+    result = {'size': args.size, 'import_app_ms': round(import_app * 1000, 1),
+              # La ventana no debe esperar a yt_dlp: App no lo importa
+              'yt_dlp_loaded_by_app': 'yt_dlp' in sys.modules}
+
+    try:
+        import yt_dlp
+        result['yt_dlp'] = "real"
+    except ImportError:
+        from fakes import install_fake_yt_dlp
+        install_fake_yt_dlp(None, 0)
+        result['yt_dlp'] = "fake"
+    result['import_yt_dlp_ms'] = round((time.perf_counter() - start - import_app) * 1000, 1)
+
+    work = tempfile.mkdtemp(prefix="bench_startup_")
+    start = time.perf_counter()
+    import Engine
+    from Database import DatabaseManager
+    engine = Engine.DownloadEngine(log_callback=lambda msg: None, db=DatabaseManager(os.path.join(work, "bench.db")))
+    result['engine_ready_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    engine.close()
+    engine.db.close()
+
+    # Con pantalla disponible: desde Tk() hasta la ventana dibujada y hasta INICIAR habilitado
+    result['window_ms'] = result['start_enabled_ms'] = None
+    try:
+        import tkinter as tk
+        start = time.perf_counter()
+        root = tk.Tk()
+    except Exception:
+        return result
+    os.chdir(work) # downloads.db de la app se crea en la carpeta temporal
+    app = App.AppController(root)
+    root.update()
+    result['window_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    while app.engine is None and time.perf_counter() - start < 60:
+        root.update()
+        time.sleep(0.005)
+    if app.engine is None: # El arranque falló (el error queda en el log de la app)
+        root.destroy()
+        return result
+    result['start_enabled_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    app.engine.close()
+    root.destroy()
+    return result
+
+def case_lease(args):
+    from fakes import AudioServer, install_fake_yt_dlp, fake_transcode
+
+    results = []
+    with AudioServer(size_bytes=args.item_kb * 1024, latency_s=args.latency_ms / 1000) as server:
+        install_fake_yt_dlp(server, args.size)
+        import Engine
+        from Database import DatabaseManager
+        from Leases import SqliteLeaseStore
+        from RateLimiter import AdaptiveThrottle
+        Engine.transcode_job = fake_transcode
+
+        for nodes in [int(n) for n in args.nodes.split(",") if n]:
+            work = tempfile.mkdtemp(prefix="bench_lease_")
+            db_path = os.path.join(work, "bench.db")
+            downloads = []
+            lock = threading.Lock()
+            engines = []
+            throttle = None
+            for k in range(nodes):
+                # Una conexión propia por nodo, como procesos separados sobre el mismo archivo
+                db = DatabaseManager(db_path)
+                if throttle is None:
+                    # Un único presupuesto anti-bloqueo: los nodos de un equipo salen por la misma IP.
+                    # Lo que escala es la concurrencia (descarga y conversión), no el ritmo permitido
+                    throttle = AdaptiveThrottle(db)
+                    throttle.interval = throttle.min_interval = args.node_interval
+                engine = Engine.DownloadEngine(log_callback=lambda msg: None, db=db, throttle=throttle,
+                                               leases=SqliteLeaseStore(db), node_id=f"node{k}")
+                download = engine._download_safe
+                def counted(opts, url, *a, _download=download, **kw):
+                    result = _download(opts, url, *a, **kw)
+                    if result[0] == "OK":
+                        with lock: downloads.append(url)
+                    return result
+                engine._download_safe = counted
+                engines.append((engine, db))
+
+            config = {'format': args.format, 'bitrate': '192', 'name_template': '%(title)s',
+                      'concurrency': args.concurrency, 'transcode_workers': args.transcoders,
+                      'cache_ttl': 0, 'lease_seconds': 30}
+            out = os.path.join(work, "out")
+            start = time.perf_counter()
+            runners = [threading.Thread(target=engine.run, args=("https://www.youtube.com/playlist?list=PLBENCH", out, config))
+                       for engine, _ in engines]
+            for t in runners: t.start()
+            for t in runners: t.join()
+            elapsed = time.perf_counter() - start
+            completed = sum(engine.summary()['completed'] for engine, _ in engines)
+            for engine, db in engines:
+                engine.close()
+                db.close()
+            results.append({'nodes': nodes, 'elapsed_s': round(elapsed, 3),
+                            'items_per_s': round(completed / elapsed, 2) if elapsed else None,
+                            'completed': completed, 'downloads': len(downloads),
+                            'duplicate_downloads': len(downloads) - len(set(downloads))})
+
+    base = results[0]['items_per_s'] if results and results[0]['items_per_s'] else None
+    for r in results:
+        r['speedup'] = round(r['items_per_s'] / base, 2) if base and r['items_per_s'] else None
+    return {'size': args.size, 'node_interval_s': args.node_interval, 'runs': results, 'peak_rss_mb': peak_rss_mb()}
+
+CASES = {'engine': case_engine, 'db': case_db, 'scan': case_scan, 'log': case_log, 'control': case_control,
+         'startup': case_startup, 'lease': case_lease}
+
+# --- ORQUESTACIÓN ---
+def run_case(suite, size, args):
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", suite, "--size", str(size),
+           "--concurrency", str(args.concurrency), "--transcoders", str(args.transcoders),
+           "--latency-ms", str(args.latency_ms), "--p429", str(args.p429),
+           "--item-kb", str(args.item_kb), "--probes", str(args.probes), "--format", args.format,
+           "--extract-ms", str(args.extract_ms), "--prefetch", str(args.prefetch),
+           "--nodes", args.nodes, "--node-interval", str(args.node_interval)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'size': size, 'error': proc.stderr.strip()[-500:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(current, previous):
+    """Imprime la variación de cada métrica numérica respecto de un JSON anterior."""
+    for suite, cases in current['results'].items():
+        old_cases = {c.get('size'): c for c in previous.get('results', {}).get(suite, [])}
+        for case in cases:
+            old = old_cases.get(case.get('size'))
+            if not old: continue
+            for key, value in case.items():
+                before = old.get(key)
+                if key == 'size' or not isinstance(value, (int, float)) or not isinstance(before, (int, float)) or not before:
+                    continue
+                print(f"{suite}[{case['size']}].{key}: {before} -> {value} ({(value - before) / before * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suites', default="engine,db,scan,log")
+    parser.add_argument('--sizes', default="10,100,1000", help="Tamaños de playlist/tabla (ej. 10,1000,50000)")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--transcoders', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--p429', type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument('--item-kb', type=int, default=256)
+    parser.add_argument('--format', default="mp3", help="Formato destino de la suite engine (m4a ejercita la copia sin recodificar)")
+    parser.add_argument('--extract-ms', type=float, default=0, help="Duración simulada de la extracción de cada video")
+    parser.add_argument('--prefetch', type=int, default=4, help="Videos extraídos por adelantado (0 = sin anticipar)")
+    parser.add_argument('--nodes', default="1,2,4", help="Suite lease: cantidades de nodos a comparar")
+    parser.add_argument('--node-interval', type=float, default=0.1, help="Suite lease: intervalo mínimo entre descargas (compartido por los nodos)")
+    parser.add_argument('--probes', type=int, default=200, help="Búsquedas por caso en la suite scan")
+    parser.add_argument('--out', default=None, help="Archivo JSON de resultados")
+    parser.add_argument('--compare', default=None, help="JSON de una ejecución anterior")
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case: # Subproceso de un único caso
+        print(json.dumps(CASES[args.case](args)))
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    results = {}
+    for suite in [s for s in args.suites.split(",") if s]:
+        results[suite] = []
+        for size in sizes:
+            case = run_case(suite, size, args)
+            print(f"{suite:7} {size:>7}: {json.dumps(case)}", file=sys.stderr)
+            results[suite].append(case)
+
+    report = {'commit': git_commit(), 'timestamp': time.time(), 'python': platform.python_version(),
+              'platform': platform.platform(), 'params': {k: v for k, v in vars(args).items()
+                                                          if k not in ('case', 'size', 'out', 'compare')},
+              'results': results}
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        with open(args.compare) as f: compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
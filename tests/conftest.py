@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Los módulos viven en la raíz del repositorio; los sustitutos de yt_dlp, en benchmarks/
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from Database import DatabaseManager
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / "test.db"))
+    yield db
+    db.close()
+
+class EngineHarness:
+    """DownloadEngine contra el yt_dlp falso y el servidor de audio local de benchmarks/fakes.py."""
+    def __init__(self, tmp_path, server, fake, Engine):
+        self.tmp_path = tmp_path
+        self.server = server
+        self.fake = fake
+        self.Engine = Engine
+        self.out = str(tmp_path / "out")
+        self.db_path = str(tmp_path / "engine.db")
+        self.logs = []
+        self.engines = []
+        self.dbs = []
+
+    def engine(self, **kwargs):
+        if 'db' not in kwargs:
+            kwargs['db'] = self.Engine.DatabaseManager(self.db_path, log_callback=self.logs.append)
+            self.dbs.append(kwargs['db'])
+        engine = self.Engine.DownloadEngine(log_callback=self.logs.append, **kwargs)
+        # Sin pausas anti-bloqueo: se prueba el motor, no el ritmo
+        engine.throttle.interval = engine.throttle.min_interval = 0.0
+        self.engines.append(engine)
+        return engine
+
+    def config(self, **overrides):
+        config = {'format': 'mp3', 'bitrate': '192', 'name_template': '%(title)s', 'concurrency': 2,
+                  'transcode_workers': 1, 'cache_ttl': 0, 'prefetch': 0, 'staging_reserve_mb': 0,
+                  'staging_path': str(self.tmp_path / "scratch")}
+        config.update(overrides)
+        return config
+
+    def close(self):
+        for engine in self.engines:
+            engine.close()
+        for db in self.dbs:
+            db.close()
+
+@pytest.fixture
+def harness(tmp_path, monkeypatch):
+    from fakes import AudioServer, install_fake_yt_dlp, fake_transcode
+
+    with AudioServer(size_bytes=64 * 1024) as server:
+        fake = install_fake_yt_dlp(server, 6)
+        import Engine
+        monkeypatch.setattr(Engine, "transcode_job", fake_transcode)
+        # Sin backoff aleatorio: los reintentos caen fuera de la ventana de la ejecución
+        monkeypatch.setattr("Retry.random.uniform", lambda a, b: 1.0)
+        h = EngineHarness(tmp_path, server, fake, Engine)
+        yield h
+        h.close()
\ No newline at end of file
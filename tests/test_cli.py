@@ -0,0 +1,26 @@
+import argparse
+
+import Cli
+
+def cli_args(**overrides):
+    args = dict(path=None, max_downloads=2, playlists=2, metrics_dir=None, node=None, lease=120, staging=None)
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+def test_sync_all_counts_the_whole_pass(harness):
+    db = harness.engine().db
+    db.save_setting('throttle_interval', 0)
+    for url in ("https://a", "https://b", "https://c"):
+        db.get_or_create_playlist(url, url)
+
+    summary = Cli.sync_all(db, cli_args(path=harness.out, staging=str(harness.tmp_path / "scratch")))
+    assert summary['completed'] + summary['skipped'] == 18
+    # Los motores comparten el controlador: los contadores no se reinician por playlist
+    assert summary['downloads'] == harness.server.requests >= 6
+    assert summary['rate_limits'] == 0 and summary['items_per_hour'] > 0
+
+def test_build_config_prefers_arguments(harness):
+    path, config = Cli.build_config({'format': 'flac', 'download_path': "/saved"},
+                                    cli_args(path="/arg", staging="/scratch", playlists=1))
+    assert path == "/arg"
+    assert config['format'] == 'flac' and config['staging_path'] == "/scratch"
\ No newline at end of file
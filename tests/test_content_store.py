@@ -0,0 +1,70 @@
+import errno
+import os
+
+import pytest
+
+import ContentStore
+
+def write(path, data=b"audio"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+def cross_device(monkeypatch, src):
+    """os.replace falla con EXDEV al mover src, como entre dos discos."""
+    real = os.replace
+    def replace(a, b):
+        if a == src:
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real(a, b)
+    monkeypatch.setattr(ContentStore.os, "replace", replace)
+
+def test_publish_renames_on_the_same_disk(tmp_path):
+    src, dst = str(tmp_path / "scratch" / "a.out.mp3"), str(tmp_path / "lib" / "sub" / "A [a].mp3")
+    write(src)
+    assert ContentStore.publish(src, dst) == "rename"
+    assert read(dst) == b"audio" and not os.path.exists(src)
+
+def test_publish_copies_across_disks(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / "scratch" / "a.out.mp3"), str(tmp_path / "lib" / "A [a].mp3")
+    write(src, b"nuevo")
+    write(dst, b"viejo")
+    cross_device(monkeypatch, src)
+    assert ContentStore.publish(src, dst) == "copy"
+    assert read(dst) == b"nuevo" and not os.path.exists(src)
+    assert os.listdir(tmp_path / "lib") == ["A [a].mp3"] # Sin temporales .pub
+
+def test_failed_copy_keeps_source_and_leaves_no_temporary(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / "scratch" / "a.out.mp3"), str(tmp_path / "lib" / "A [a].mp3")
+    write(src)
+    cross_device(monkeypatch, src)
+    def full_disk(a, b):
+        with open(b, "wb") as f: f.write(b"a medias")
+        raise OSError(errno.ENOSPC, "No space left on device")
+    monkeypatch.setattr(ContentStore.shutil, "copyfile", full_disk)
+    with pytest.raises(OSError):
+        ContentStore.publish(src, dst)
+    assert os.path.exists(src)
+    assert os.listdir(tmp_path / "lib") == []
+
+def test_other_errors_are_not_treated_as_cross_device(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / "a.mp3"), str(tmp_path / "lib" / "A.mp3")
+    write(src)
+    def denied(a, b): raise PermissionError(errno.EACCES, "denied")
+    monkeypatch.setattr(ContentStore.os, "replace", denied)
+    with pytest.raises(PermissionError):
+        ContentStore.publish(src, dst)
+    assert os.path.exists(src)
+
+def test_link_into_falls_back_to_copy(tmp_path, monkeypatch):
+    src, dst = str(tmp_path / "store" / "a.mp3"), str(tmp_path / "lib" / "A.mp3")
+    write(src)
+    def no_link(a, b): raise OSError(errno.EXDEV, "cross-device")
+    monkeypatch.setattr(ContentStore.os, "link", no_link)
+    monkeypatch.setattr(ContentStore, "_reflink", no_link)
+    assert ContentStore.link_into(src, dst) == "copy"
+    assert read(dst) == b"audio" and os.path.exists(src)
\ No newline at end of file
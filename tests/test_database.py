@@ -0,0 +1,61 @@
+import sqlite3
+
+import pytest
+
+from Database import DatabaseManager
+
+def test_reads_after_close_raise(tmp_path):
+    db = DatabaseManager(str(tmp_path / "a.db"))
+    db.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.load_settings()
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.get_or_create_playlist("https://pl")
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.save_setting("k", "v")
+    db.close() # Cerrar dos veces no falla
+
+def test_close_commits_pending_writes(tmp_path):
+    path = str(tmp_path / "a.db")
+    db = DatabaseManager(path)
+    for i in range(50):
+        db.save_setting(f"k{i}", i)
+    db.close()
+    db = DatabaseManager(path)
+    assert db.load_settings()["k49"] == "49"
+    db.close()
+
+def test_fresh_reads_see_queued_writes(db):
+    db.save_setting("format", "flac")
+    assert db.load_settings()["format"] == "flac"
+
+def test_write_errors_go_to_the_log_callback(tmp_path):
+    logged = []
+    db = DatabaseManager(str(tmp_path / "a.db"), log_callback=logged.append)
+    db._write(lambda cursor: cursor.execute("INSERT INTO no_such_table VALUES (1)"))
+    db.flush()
+    db.close()
+    assert len(logged) == 1 and "no_such_table" in logged[0]
+
+def test_failed_op_does_not_undo_the_rest_of_the_batch(db):
+    db._write(lambda cursor: cursor.execute("INSERT INTO no_such_table VALUES (1)"))
+    db.save_setting("kept", "yes")
+    assert db.load_settings()["kept"] == "yes"
+
+def test_migration_adds_columns_to_an_old_database(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    # Esquema original, sin ninguna de las columnas añadidas después
+    conn.execute('''CREATE TABLE videos (id INTEGER PRIMARY KEY AUTOINCREMENT, playlist_id INTEGER,
+                    video_id TEXT, title TEXT, url TEXT, status TEXT DEFAULT 'PENDING', error_msg TEXT,
+                    filepath TEXT, UNIQUE(playlist_id, video_id))''')
+    conn.execute("INSERT INTO videos (playlist_id, video_id, title, url) VALUES (1, 'abc', 'T', 'u')")
+    conn.commit()
+    conn.close()
+
+    db = DatabaseManager(path)
+    columns = {row[1] for row in db._read("PRAGMA table_info(videos)")}
+    assert {'staging_path', 'attempt_count', 'part_path', 'lease_owner', 'loudness_mtime_ns'} <= columns
+    assert db._read("SELECT video_id, attempt_count FROM videos") == [('abc', 0)]
+    db.close()
+    DatabaseManager(path).close() # Reabrir una base ya migrada no vuelve a tocar el esquema
\ No newline at end of file
@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+URL = "https://www.youtube.com/playlist?list=PLBENCH"
+
+def run_in_thread(engine, harness, config):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(engine.run(URL, harness.out, config)), daemon=True)
+    thread.start()
+    return thread, result
+
+def test_run_completes_and_second_run_skips(harness):
+    engine = harness.engine()
+    assert engine.run(URL, harness.out, harness.config())['completed'] == 6
+    assert engine.run(URL, harness.out, harness.config()) == {'completed': 0, 'failed': 0, 'skipped': 0, 'cpu_saved_s': 0}
+
+def test_run_after_stop_is_not_blocked_by_stale_inflight(harness):
+    # Como la app: DETENER y luego INICIAR con el mismo motor
+    engine = harness.engine()
+    harness.server.bandwidth = 32 * 1024 # ~2 s por video: la parada encuentra la cola llena
+    thread, _ = run_in_thread(engine, harness, harness.config())
+    time.sleep(0.8)
+    engine.request_stop()
+    thread.join(timeout=30)
+    assert not thread.is_alive()
+    assert not engine.inflight
+
+    harness.server.bandwidth = 0
+    thread, result = run_in_thread(engine, harness, harness.config())
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "la segunda ejecución quedó esperando videos en curso"
+    playlist_id = engine.db.get_all_playlists()[0][0]
+    assert len(engine.db.get_completed_videos(playlist_id)) == 6
+
+def test_run_returns_when_the_dispatcher_fails(harness):
+    import sqlite3
+    engine = harness.engine()
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+    engine.db.count_pending_videos = locked
+    thread, result = run_in_thread(engine, harness, harness.config())
+    thread.join(timeout=10)
+    assert not thread.is_alive(), "run() quedó esperando centinelas que nunca llegaron"
+    assert result['completed'] == 0
+    assert any("database is locked" in line for line in harness.logs)
+    assert not engine.inflight
+
+def test_stopped_downloads_resume_from_their_part_files(harness):
+    server = harness.server
+    server.size = 1024 * 1024
+    server.payload = bytes(range(256)) * (server.size // 256)
+    server.bandwidth = 512 * 1024 # ~2 s por video: la parada deja .part a medias
+    engine = harness.engine()
+    thread, _ = run_in_thread(engine, harness, harness.config())
+    time.sleep(1.0)
+    engine.request_stop()
+    thread.join(timeout=30)
+    playlist_id = engine.db.get_all_playlists()[0][0]
+    assert engine.db.get_completed_videos(playlist_id) == []
+    partials = engine.db.get_partials(playlist_id)
+    resumed = sum(os.path.getsize(part_path) for _, _, part_path in partials)
+    assert partials and resumed > 0
+
+    server.bandwidth = 0
+    sent_before = server.bytes_sent
+    engine.run(URL, harness.out, harness.config())
+    assert len(engine.db.get_completed_videos(playlist_id)) == 6
+    # Lo que ya estaba en disco no se vuelve a pedir: los Range empiezan donde quedó cada .part
+    assert server.bytes_sent - sent_before == 6 * server.size - resumed
+    assert any("Retomando" in line for line in harness.logs)
+    assert engine.db.get_partials(playlist_id) == []
+
+def test_cpu_saved_is_not_reported_before_a_transcode_was_measured(harness):
+    # m4a: el yt_dlp falso entrega AAC, así que todo se copia sin recodificar
+    engine = harness.engine()
+    result = engine.run(URL, harness.out, harness.config(format='m4a'))
+    assert result['completed'] == 6 and result['cpu_saved_s'] is None
+    assert any("sin estimar" in line for line in harness.logs)
+    assert 'transcode_cpu_ratio' not in engine.db.load_settings()
+
+def test_cpu_saved_uses_the_measured_ratio(harness):
+    engine = harness.engine()
+    engine.db.save_setting('transcode_cpu_ratio', "0.05")
+    result = engine.run(URL, harness.out, harness.config(format='m4a'))
+    assert abs(result['cpu_saved_s'] - 6 * 180 * 0.05) < 1
+
+def test_video_in_a_second_playlist_is_linked_not_downloaded(harness, monkeypatch):
+    import ContentStore
+    engine = harness.engine()
+    assert engine.run(URL, harness.out, harness.config())['completed'] == 6
+    requests = harness.server.requests
+    converted = sum(1 for line in harness.logs if line.startswith("🎵 Convertido"))
+
+    # Otra playlist con los mismos videos, en otra carpeta y sin hardlinks (otro disco)
+    def cross_device(src, dst): raise OSError(18, "Invalid cross-device link")
+    monkeypatch.setattr(ContentStore.os, "link", cross_device)
+    other = str(harness.tmp_path / "other")
+    result = engine.run("https://www.youtube.com/playlist?list=PLOTHER", other, harness.config())
+    assert result['completed'] == 6
+    assert harness.server.requests == requests
+    assert sum(1 for line in harness.logs if line.startswith("🎵 Convertido")) == converted
+    reused = [line for line in harness.logs if line.startswith("🔗 Reutilizado")]
+    assert len(reused) == 6 and all("(hardlink)" not in line for line in reused)
+    first, second = sorted(os.listdir(harness.out)), sorted(os.listdir(other))
+    assert first == second
+    with open(os.path.join(harness.out, first[0]), "rb") as a, open(os.path.join(other, second[0]), "rb") as b:
+        assert a.read() == b.read()
+
+def test_reuse_on_the_same_disk_is_a_hardlink(harness):
+    engine = harness.engine()
+    engine.run(URL, harness.out, harness.config())
+    other = str(harness.tmp_path / "other")
+    assert engine.run("https://www.youtube.com/playlist?list=PLOTHER", other, harness.config())['completed'] == 6
+    assert sum(1 for line in harness.logs if "Reutilizado (hardlink)" in line) == 6
+    name = sorted(os.listdir(other))[0]
+    assert os.path.samefile(os.path.join(harness.out, name), os.path.join(other, name))
+
+def test_prefetched_videos_do_not_take_a_second_throttle_turn(harness, monkeypatch):
+    engine = harness.engine()
+    turns = []
+    acquire = engine.throttle.acquire
+    def counted(*args, **kwargs):
+        turns.append(threading.current_thread().name)
+        return acquire(*args, **kwargs)
+    monkeypatch.setattr(engine.throttle, "acquire", counted)
+    assert engine.run(URL, harness.out, harness.config(prefetch=4))['completed'] == 6
+    # Un turno por video: en la extracción anticipada o, si no se anticipó, en la descarga
+    assert len(turns) == 6
+    assert any(name.startswith("prefetch") for name in turns)
+
+def test_run_clears_the_ytdlp_progress_line(harness):
+    from Logger import LogChannel, YTDLP_PROGRESS_KEY
+    channel = LogChannel()
+    engine = harness.engine(progress_callback=channel.set_progress)
+    engine.progress(YTDLP_PROGRESS_KEY, "[download]  99.9% of 3.00MiB")
+    engine.run(URL, harness.out, harness.config())
+    assert channel.drain()[2] == ""
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+
+from FileIndex import FileIndex
+
+def touch(folder, name):
+    path = os.path.join(folder, name)
+    with open(path, "wb") as f:
+        f.write(b"x")
+    return path
+
+def bump_mtime(folder):
+    # Algunos sistemas de archivos tienen mtime de grano grueso: se fuerza el cambio
+    st = os.stat(folder)
+    os.utime(folder, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+def test_first_refresh_indexes_audio_files(db, tmp_path):
+    folder = str(tmp_path / "music")
+    os.makedirs(folder)
+    a = touch(folder, "Song A [aaa].mp3")
+    touch(folder, "notes.txt")
+    touch(folder, "No id.mp3")
+
+    index = FileIndex(db)
+    assert index.refresh(folder) is True
+    assert index.lookup(folder, "aaa") == a
+    assert index.refresh(folder) is False
+
+def test_own_writes_do_not_invalidate_the_index(db, tmp_path):
+    folder = str(tmp_path / "music")
+    os.makedirs(folder)
+    touch(folder, "Song A [aaa].mp3")
+    index = FileIndex(db)
+    index.refresh(folder)
+
+    b = touch(folder, "Song B [bbb].mp3")
+    bump_mtime(folder)
+    index.add(folder, "bbb", b)
+
+    fresh = FileIndex(db) # Como en la próxima ejecución: el índice sale de la DB
+    assert fresh.refresh(folder) is False
+    assert fresh.lookup(folder, "bbb") == b
+
+def test_external_changes_are_applied_incrementally(db, tmp_path):
+    folder = str(tmp_path / "music")
+    os.makedirs(folder)
+    a = touch(folder, "Song A [aaa].mp3")
+    b = touch(folder, "Song B [bbb].mp3")
+    index = FileIndex(db)
+    index.refresh(folder)
+
+    os.remove(a)
+    c = touch(folder, "Song C [ccc].m4a")
+    bump_mtime(folder)
+
+    fresh = FileIndex(db)
+    assert fresh.refresh(folder) is True
+    assert fresh.lookup(folder, "aaa") is None
+    assert fresh.lookup(folder, "bbb") == b
+    assert fresh.lookup(folder, "ccc") == c
+    assert db.load_file_index(fresh._key(folder)) == {"bbb": b, "ccc": c}
+
+def test_missing_folder_is_empty(db, tmp_path):
+    index = FileIndex(db)
+    assert index.refresh(str(tmp_path / "nope")) is False
+    assert index.lookup(str(tmp_path / "nope"), "aaa") is None
\ No newline at end of file
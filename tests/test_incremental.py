@@ -0,0 +1,20 @@
+URL = "https://www.youtube.com/playlist?list=PLBENCH"
+
+def test_incremental_stop_does_not_cache_or_touch(harness):
+    engine = harness.engine()
+    assert engine.run(URL, harness.out, harness.config())['completed'] == 6
+    synced_at = engine.db.get_playlist(URL)[1]
+    assert synced_at is not None
+
+    summary = engine.run(URL, harness.out, harness.config(incremental=True, known_run=2, cache_ttl=10))
+    assert summary['completed'] == 0
+    assert any("lectura detenida tras 2" in line for line in harness.logs)
+    # La lista truncada no debe servir a una ejecución completa dentro del TTL
+    assert engine.db.get_cached_extraction(URL, 600) is None
+    assert engine.db.get_playlist(URL)[1] == synced_at
+
+def test_full_read_is_cached(harness):
+    engine = harness.engine()
+    engine.run(URL, harness.out, harness.config(cache_ttl=10))
+    title, entries = engine.db.get_cached_extraction(URL, 600)
+    assert len(entries) == 6
\ No newline at end of file
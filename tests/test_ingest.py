@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from Ingest import IngestState, iter_chunks, slim_entry
+
+class FakePagedList:
+    """Como yt_dlp.utils.PagedList: solo getslice, y se cuentan las páginas pedidas."""
+    def __init__(self, n):
+        self.n = n
+        self.slices = 0
+
+    def getslice(self, start, end):
+        self.slices += 1
+        return list(range(start, min(end, self.n)))
+
+def test_iter_chunks_groups_lists_and_generators():
+    assert list(iter_chunks([1, 2, 3, 4, 5], size=2)) == [[1, 2], [3, 4], [5]]
+    assert list(iter_chunks((i for i in range(4)), size=2)) == [[0, 1], [2, 3]]
+    assert list(iter_chunks([], size=2)) == []
+
+def test_iter_chunks_pages_a_paged_list_on_demand():
+    entries = FakePagedList(5)
+    chunks = iter_chunks(entries, size=2)
+    assert next(chunks) == [0, 1]
+    assert entries.slices == 1
+    assert list(chunks) == [[2, 3], [4]]
+
+def test_ingest_state_signals_chunks_and_finish():
+    state = IngestState()
+    state.set_playlist(7)
+    assert state.wait_ready() == 7
+
+    def produce():
+        state.chunk_landed(3)
+        state.finish()
+    thread = threading.Thread(target=produce)
+    thread.start()
+    state.wait_for_more(0, timeout=5)
+    thread.join()
+    assert state.chunks == 1 and state.added == 3 and state.done
+
+def test_wait_ready_returns_none_when_ingest_fails():
+    state = IngestState()
+    state.finish(error=ValueError("boom"))
+    assert state.wait_ready() is None
+    assert isinstance(state.error, ValueError)
+
+def test_slim_entry_keeps_only_the_row_fields():
+    entry = {'id': "a", 'title': "T", 'webpage_url': "https://w", 'formats': [1, 2]}
+    assert slim_entry(entry) == {'id': "a", 'title': "T", 'url': "https://w"}
+
+class RedirectingYdl:
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def extract_info(self, url, download=True, ie_key=None, process=True):
+        self.calls.append((url, ie_key))
+        return self.results[url]
+
+def test_url_results_are_followed_to_the_playlist(harness):
+    engine = harness.engine()
+    ydl = RedirectingYdl({
+        "https://c/@handle": {'_type': 'url_transparent', 'url': "https://c/UC1", 'title': "Canal"},
+        "https://c/UC1": {'_type': 'playlist', 'title': "Uploads", 'entries': []},
+    })
+    info = engine._follow_url_results(ydl, {'_type': 'url', 'url': "https://c/@handle", 'ie_key': "YoutubeTab"})
+    assert info['_type'] == 'playlist' and info['title'] == "Canal"
+    assert ydl.calls == [("https://c/@handle", "YoutubeTab"), ("https://c/UC1", None)]
+
+def test_url_result_loops_are_cut(harness):
+    engine = harness.engine()
+    ydl = RedirectingYdl({"https://loop": {'_type': 'url', 'url': "https://loop"}})
+    with pytest.raises(ValueError):
+        engine._follow_url_results(ydl, {'_type': 'url', 'url': "https://loop"})
+
+def test_watch_link_with_list_ingests_the_whole_playlist(harness):
+    engine = harness.engine()
+    summary = engine.run("https://www.youtube.com/watch?v=bench000000&list=PLBENCH", harness.out, harness.config())
+    assert summary['completed'] == 6
+    playlist_id = engine.db.get_all_playlists()[0][0]
+    assert len(engine.db.get_completed_videos(playlist_id)) == 6
\ No newline at end of file
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from Database import DatabaseManager
+from Leases import MemoryLeaseStore, SqliteLeaseStore
+
+@pytest.fixture(params=[True, False], ids=["returning", "select-update"])
+def returning(request, monkeypatch):
+    monkeypatch.setattr(DatabaseManager, "HAS_RETURNING", request.param)
+    return request.param
+
+@pytest.fixture(params=[SqliteLeaseStore, MemoryLeaseStore])
+def store(request, db, returning):
+    return request.param(db)
+
+def make_playlist(db, count):
+    pl_id = db.get_or_create_playlist("https://pl")
+    db.add_videos_to_playlist(pl_id, [{'id': f"v{i}", 'title': f"T{i}"} for i in range(count)])
+    db.flush()
+    return pl_id
+
+def test_claims_do_not_overlap(db, store):
+    pl_id = make_playlist(db, 5)
+    a = store.claim("a", pl_id, 3, 60, 1000.0)
+    b = store.claim("b", pl_id, 3, 60, 1000.0)
+    assert [row[3] for row in a] == ["v0", "v1", "v2"]
+    assert [row[3] for row in b] == ["v3", "v4"]
+    assert store.claim("c", pl_id, 3, 60, 1000.0) == []
+
+def test_expired_leases_are_reclaimed(db, store):
+    pl_id = make_playlist(db, 2)
+    ids = {row[0] for row in store.claim("a", pl_id, 2, 60, 1000.0)}
+    assert store.acquire("b", ids, 60, 1030.0) == set()
+    assert store.renew("b", ids, 60, 1030.0) == set()
+    assert store.renew("a", ids, 60, 1030.0) == ids
+    # Renovado hasta 1090: a los 1100 ya vence y otro nodo lo toma
+    assert {row[0] for row in store.claim("b", pl_id, 5, 60, 1100.0)} == ids
+    assert store.renew("a", ids, 60, 1100.0) == set()
+
+def test_release_frees_rows(db, store):
+    pl_id = make_playlist(db, 2)
+    ids = {row[0] for row in store.claim("a", pl_id, 2, 60, 1000.0)}
+    store.release("b", ids) # No son suyos: no cambia nada
+    assert store.claim("b", pl_id, 2, 60, 1000.0) == []
+    store.release("a", ids)
+    db.flush()
+    assert store.acquire("b", ids, 60, 1000.0) == ids
+
+def test_downloaded_row_keeps_its_lease(db, returning):
+    store = SqliteLeaseStore(db)
+    pl_id = make_playlist(db, 2)
+    first, second = [row[0] for row in store.claim("a", pl_id, 2, 60, 1000.0)]
+    db.mark_downloaded(first, "/scratch/a.webm", "{}")
+    store.release("a", [first, second])
+    db.flush()
+    assert store.acquire("b", [first, second], 60, 1000.0) == {second}
+    assert store.acquire("a", [first], 60, 1000.0) == {first}
+
+def test_concurrent_connections_never_share_rows(tmp_path, returning):
+    # Dos DatabaseManager sobre el mismo archivo: como dos procesos del mismo equipo
+    path = str(tmp_path / "shared.db")
+    dbs = [DatabaseManager(path) for _ in range(2)]
+    try:
+        pl_id = make_playlist(dbs[0], 60)
+        got = {0: [], 1: []}
+
+        def drain(n):
+            store = SqliteLeaseStore(dbs[n])
+            while True:
+                batch = store.claim(f"n{n}", pl_id, 3, 60, 1000.0)
+                if not batch: return
+                got[n].extend(row[0] for row in batch)
+
+        threads = [threading.Thread(target=drain, args=(n,)) for n in range(2)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        assert len(got[0]) + len(got[1]) == 60
+        assert not set(got[0]) & set(got[1])
+    finally:
+        for db in dbs:
+            db.close()
\ No newline at end of file
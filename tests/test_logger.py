@@ -0,0 +1,38 @@
+from Logger import ConsoleLogger, LogChannel, YTDLP_PROGRESS_KEY
+
+def test_lines_are_drained_in_order_once():
+    channel = LogChannel()
+    for i in range(3):
+        channel.put(f"línea {i}")
+    assert channel.drain() == (["línea 0", "línea 1", "línea 2"], 0, None)
+    assert channel.drain() == ([], 0, None)
+
+def test_full_buffer_drops_the_oldest_lines():
+    channel = LogChannel(capacity=3)
+    for i in range(5):
+        channel.put(i)
+    assert channel.drain() == ([2, 3, 4], 2, None)
+    channel.put(5)
+    assert channel.drain() == ([5], 0, None) # El contador de descartes se reinicia
+
+def test_progress_keeps_the_last_value_per_key():
+    channel = LogChannel()
+    for pct in range(0, 101, 10):
+        channel.set_progress("a", f"a {pct}%")
+    channel.set_progress("b", "b 5%")
+    assert channel.drain()[2] == "a 100% | b 5%"
+    assert channel.drain()[2] is None # Sin cambios no se vuelve a dibujar
+    channel.set_progress("a", None)
+    assert channel.drain()[2] == "b 5%"
+    channel.set_progress("b", None)
+    assert channel.drain()[2] == ""
+
+def test_console_logger_routes_ytdlp_progress():
+    lines, progress = [], []
+    logger = ConsoleLogger(lines.append, lambda key, text: progress.append((key, text)))
+    logger.info("[download]  42.0% of 3.00MiB")
+    logger.info("[download] Destination: x.webm")
+    logger.debug("ruido")
+    logger.warning("lento")
+    assert progress == [(YTDLP_PROGRESS_KEY, "[download]  42.0% of 3.00MiB")]
+    assert lines == ["[download] Destination: x.webm", "⚠️ ADVERTENCIA: lento"]
\ No newline at end of file
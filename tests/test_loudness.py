@@ -0,0 +1,73 @@
+import shutil
+import subprocess
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import Loudness
+
+def sine(amplitude, seconds=5, channels=(0, 1)):
+    t = np.arange(Loudness.RATE * seconds) / Loudness.RATE
+    samples = np.zeros((len(t), 2), dtype=np.float32)
+    for channel in channels:
+        samples[:, channel] = amplitude * np.sin(2 * np.pi * 997 * t)
+    return samples
+
+def chunks(samples, size):
+    return (samples[i:i + size] for i in range(0, len(samples), size))
+
+def test_full_scale_sine_in_both_channels_is_0_lufs():
+    lufs, peak = Loudness.measure(sine(1.0))
+    assert lufs == pytest.approx(0.0, abs=0.01)
+    assert peak == pytest.approx(1.0)
+
+def test_full_scale_sine_in_one_channel_is_minus_3_lufs():
+    lufs, _ = Loudness.measure(sine(1.0, channels=(0,)))
+    assert lufs == pytest.approx(-3.01, abs=0.01)
+
+def test_minus_20_dbfs_sine_is_minus_20_lufs():
+    lufs, peak = Loudness.measure(sine(0.1))
+    assert lufs == pytest.approx(-20.0, abs=0.01)
+    assert peak == pytest.approx(0.1)
+
+def test_blocks_give_the_same_result_as_the_whole_track():
+    samples = sine(0.3, seconds=3) * np.linspace(0.0, 1.0, Loudness.RATE * 3, dtype=np.float32)[:, None]
+    whole = Loudness.measure(samples)
+    # Trozos que no caen en límites de tramo de 100 ms
+    assert Loudness.measure(chunks(samples, 7777)) == pytest.approx(whole, rel=1e-9)
+
+def test_k_filter_matches_the_biquads():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(Loudness.HOP * 3)
+    y = x
+    for b, a in Loudness.K_FILTERS: # Forma directa, muestra a muestra, con dos ceros de estado inicial
+        inp, out = np.concatenate(([0.0, 0.0], y)), np.zeros(len(y) + 2)
+        for i in range(2, len(out)):
+            out[i] = b[0] * inp[i] + b[1] * inp[i - 1] + b[2] * inp[i - 2] - a[1] * out[i - 1] - a[2] * out[i - 2]
+        y = out[2:]
+    meter = Loudness._Meter(channels=1)
+    for block in chunks(x[:, None], 1000):
+        meter.feed(block)
+    expected = np.square(y).reshape(-1, Loudness.HOP).sum(axis=1)
+    assert np.allclose(meter.segments, expected, rtol=1e-9)
+
+def test_silence_and_short_tracks_have_no_loudness():
+    assert Loudness.measure(np.zeros((Loudness.RATE * 2, 2), dtype=np.float32)) == (None, 0.0)
+    assert Loudness.measure(sine(1.0, seconds=0.3))[0] is None
+    assert Loudness.measure([]) == (None, 0.0)
+
+def test_replaygain_tags():
+    assert Loudness.replaygain_tags(-9.5, 0.98) == {
+        'REPLAYGAIN_TRACK_GAIN': "-8.50 dB",
+        'REPLAYGAIN_TRACK_PEAK': "0.980000",
+    }
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="requiere ffmpeg")
+def test_decode_streams_the_file(tmp_path):
+    path = str(tmp_path / "tone.wav")
+    subprocess.run(['ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'sine=frequency=997:duration=3',
+                    '-ac', '2', '-ar', '48000', path], check=True)
+    blocks = list(Loudness.decode(path, frames=Loudness.HOP))
+    assert len(blocks) > 1 and all(len(block) <= Loudness.HOP for block in blocks)
+    assert Loudness.measure(iter(blocks))[0] is not None
\ No newline at end of file
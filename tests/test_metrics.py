@@ -0,0 +1,59 @@
+import re
+
+from Metrics import RunMetrics
+
+SAMPLE = re.compile(r'^[a-z_]+(\{[a-z_]+="[^"]*"(,[a-z_]+="[^"]*")*\})? -?\d+(\.\d+)?$')
+
+def make_run(db):
+    metrics = RunMetrics(db, "run1")
+    with metrics.stage('transcode', 1):
+        pass
+    metrics.record('download', 2.0, 1, nbytes=3 * 1048576)
+    metrics.record('download', 1.0, 2, nbytes=1048576)
+    metrics.record('ttfb', 0.2, 1)
+    metrics.finish()
+    return metrics
+
+def test_stages_are_accumulated_and_stored(db):
+    metrics = make_run(db)
+    assert metrics.counts['download'] == 2 and metrics.seconds['download'] == 3.0
+    assert metrics.bytes == 4 * 1048576
+    stored = {stage: (count, nbytes) for stage, _, count, nbytes in db.get_run_metrics("run1")}
+    assert stored['download'] == (2, 4 * 1048576)
+    assert set(stored) == {'transcode', 'download', 'ttfb', 'db_commit'}
+    summary = metrics.summary()
+    assert "descarga 3.0 s" in summary and "4.0 MiB transferidos" in summary
+    assert "primer byte en 200 ms" in summary
+
+def test_prometheus_text_names_and_labels(db):
+    metrics = make_run(db)
+    outcome = {'completed': 5, 'failed': 1, 'skipped': 0, 'cpu_saved_s': 12.5}
+    text = metrics.prometheus_text(outcome, playlist_id=7)
+    assert text.endswith("\n")
+    samples = [line for line in text.splitlines() if not line.startswith("#")]
+    assert all(SAMPLE.match(line) for line in samples), samples
+    names = {line.split("{")[0].split(" ")[0] for line in samples}
+    assert names == {'musicdl_last_run_stage_seconds', 'musicdl_last_run_stage_count', 'musicdl_last_run_bytes',
+                     'musicdl_last_run_items', 'musicdl_last_run_cpu_saved_seconds',
+                     'musicdl_last_run_wall_seconds', 'musicdl_last_run_timestamp_seconds'}
+    for name in names: # Cada métrica con su HELP y su TYPE
+        assert f"# HELP {name} " in text and f"# TYPE {name} gauge" in text
+    assert 'musicdl_last_run_stage_seconds{playlist="7",stage="download"} 3.000' in samples
+    assert 'musicdl_last_run_stage_count{playlist="7",stage="download"} 2' in samples
+    assert 'musicdl_last_run_items{playlist="7",result="failed"} 1' in samples
+    assert 'musicdl_last_run_bytes{playlist="7"} 4194304' in samples
+
+def test_prometheus_text_without_playlist_or_cpu_estimate(db):
+    text = make_run(db).prometheus_text({'completed': 1, 'cpu_saved_s': None})
+    assert 'musicdl_last_run_stage_seconds{stage="download"} 3.000' in text
+    assert "musicdl_last_run_bytes 4194304" in text
+    assert "cpu_saved" not in text
+
+def test_write_prometheus_replaces_the_file(db, tmp_path):
+    path = str(tmp_path / "prom" / "musicdl.prom")
+    (tmp_path / "prom").mkdir()
+    metrics = make_run(db)
+    metrics.write_prometheus(path, {'completed': 1})
+    metrics.write_prometheus(path, {'completed': 2})
+    assert 'result="completed"} 2' in open(path).read()
+    assert [p.name for p in (tmp_path / "prom").iterdir()] == ["musicdl.prom"] # Sin .tmp
\ No newline at end of file
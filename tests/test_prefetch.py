@@ -0,0 +1,98 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from Prefetch import MetadataPrefetcher
+
+class FakeYdl:
+    def __init__(self):
+        self.calls = []
+
+    def extract_info(self, url, download=False, process=True):
+        self.calls.append(url)
+        return {'url': url}
+
+class FakePool:
+    def __init__(self):
+        self.ydl = FakeYdl()
+
+    @contextmanager
+    def get(self, opts):
+        yield self.ydl
+
+class CountingThrottle:
+    def __init__(self, allow=True):
+        self.allow = allow
+        self.acquired = 0
+
+    def acquire(self, should_stop, wait=None):
+        self.acquired += 1
+        return self.allow
+
+def wait(future):
+    return future.result(timeout=5)
+
+def make(**kwargs):
+    pool = FakePool()
+    return MetadataPrefetcher(pool, {}, **kwargs), pool.ydl
+
+def test_prefetched_info_is_taken_once():
+    prefetcher, ydl = make()
+    prefetcher.submit("u1")
+    prefetcher.submit("u1") # Encolado dos veces: una sola extracción
+    assert prefetcher.take("u1", wait) == {'url': "u1"}
+    assert prefetcher.take("u1", wait) is None
+    assert ydl.calls == ["u1"]
+    assert (prefetcher.hits, prefetcher.misses) == (1, 1)
+    prefetcher.close()
+
+def test_expired_info_is_not_used():
+    prefetcher, _ = make(ttl=0.05)
+    prefetcher.submit("u1")
+    prefetcher.entries["u1"].result(timeout=5)
+    time.sleep(0.1)
+    assert prefetcher.take("u1", wait) is None
+    assert prefetcher.expired == 1
+    prefetcher.close()
+
+def test_cooldown_defers_without_asking_the_host():
+    throttle = CountingThrottle()
+    prefetcher, ydl = make(should_defer=lambda: True, throttle=throttle)
+    prefetcher.submit("u1")
+    assert prefetcher.take("u1", wait) is None
+    assert ydl.calls == [] and throttle.acquired == 0
+    assert prefetcher.misses == 1
+    prefetcher.close()
+
+def test_each_extraction_takes_a_throttle_turn():
+    throttle = CountingThrottle()
+    prefetcher, ydl = make(throttle=throttle, workers=2)
+    for url in ("u1", "u2", "u3"):
+        prefetcher.submit(url)
+    for url in ("u1", "u2", "u3"):
+        assert prefetcher.take(url, wait) == {'url': url}
+    assert throttle.acquired == 3 and len(ydl.calls) == 3
+    prefetcher.close()
+
+def test_no_turn_means_no_extraction():
+    prefetcher, ydl = make(throttle=CountingThrottle(allow=False))
+    prefetcher.submit("u1")
+    assert prefetcher.take("u1", wait) is None
+    assert ydl.calls == []
+    prefetcher.close()
+
+def test_close_interrupts_a_turn_wait():
+    started = threading.Event()
+    class SlowThrottle:
+        def acquire(self, should_stop, wait):
+            started.set()
+            while not should_stop():
+                wait(0.05)
+            return False
+    prefetcher, ydl = make(throttle=SlowThrottle())
+    prefetcher.submit("u1")
+    assert started.wait(5)
+    future = prefetcher.entries["u1"]
+    prefetcher.close()
+    assert future.exception(timeout=5) is not None # Diferida: el worker la hará al descargar
+    assert ydl.calls == []
\ No newline at end of file
@@ -0,0 +1,98 @@
+import email.utils
+import time
+
+import pytest
+
+from RateLimiter import AdaptiveThrottle, parse_retry_after, retry_after_from_error
+
+def make(db, **kwargs):
+    params = {'min_interval': 1.0, 'start_interval': 4.0, 'step': 0.5, 'increase_after': 3,
+              'base_cooldown': 60, 'max_cooldown': 200}
+    params.update(kwargs)
+    return AdaptiveThrottle(db, **params)
+
+def test_streak_of_successes_shortens_the_interval(db):
+    throttle = make(db)
+    for _ in range(2):
+        throttle.on_success()
+    assert throttle.interval == 4.0
+    throttle.on_success()
+    assert throttle.interval == 3.5 and throttle.streak == 0
+    for _ in range(30):
+        throttle.on_success()
+    assert throttle.interval == 1.0 # Nunca por debajo del mínimo
+    assert throttle.completed == 33
+
+def test_rate_limit_doubles_interval_and_cooldown(db):
+    throttle = make(db)
+    assert throttle.on_rate_limit() == 60
+    assert throttle.interval == 8.0 and throttle.cooldown == 120
+    assert 59 < throttle.cooldown_remaining() <= 60
+    # El mismo 429 visto por otro worker no vuelve a multiplicar
+    assert throttle.on_rate_limit() == pytest.approx(60, abs=1)
+    assert throttle.interval == 8.0 and throttle.rate_limits == 2
+
+def test_cooldown_is_capped_and_reset_by_a_success(db):
+    throttle = make(db)
+    for _ in range(3):
+        throttle.cooldown_until = 0 # Enfriamiento ya cumplido
+        throttle.on_rate_limit()
+    assert throttle.cooldown == 200
+    throttle.on_success()
+    assert throttle.cooldown == 60
+
+def test_retry_after_overrides_the_cooldown(db):
+    throttle = make(db)
+    assert throttle.on_rate_limit(retry_after=5) == 5
+    assert throttle.cooldown == 120 # El escalón propio avanza igual
+
+def test_state_survives_a_restart(db):
+    make(db).on_rate_limit()
+    db.flush()
+    again = make(db)
+    assert again.interval == 8.0 and again.cooldown == 120
+    assert again.cooldown_remaining() > 0
+
+def test_acquire_spaces_starts_and_honours_stop(db, monkeypatch):
+    monkeypatch.setattr("RateLimiter.random.uniform", lambda a, b: 1.0)
+    throttle = make(db, start_interval=0.05, min_interval=0.05)
+    started = time.time()
+    assert throttle.acquire(lambda: False)
+    assert throttle.acquire(lambda: False)
+    assert time.time() - started >= 0.05
+    throttle.cooldown_until = time.time() + 60
+    assert not throttle.acquire(lambda: True)
+
+def test_parse_retry_after_seconds_and_http_date():
+    assert parse_retry_after("120") == 120.0
+    assert parse_retry_after(" 7 ") == 7.0
+    later = email.utils.formatdate(time.time() + 90, usegmt=True)
+    assert parse_retry_after(later) == pytest.approx(90, abs=2)
+    earlier = email.utils.formatdate(time.time() - 90, usegmt=True)
+    assert parse_retry_after(earlier) == 0.0
+    assert parse_retry_after("pronto") is None
+
+class Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+class HTTPError(Exception):
+    def __init__(self, headers):
+        super().__init__("HTTP Error 429")
+        self.response = Response(headers)
+
+def test_retry_after_is_found_in_the_exception_chain():
+    class DownloadError(Exception):
+        def __init__(self, inner):
+            super().__init__("ERROR: 429")
+            self.exc_info = (type(inner), inner, None)
+    assert retry_after_from_error(DownloadError(HTTPError({'Retry-After': "30"}))) == 30.0
+    try:
+        try:
+            raise HTTPError({'Retry-After': "12"})
+        except HTTPError as e:
+            raise RuntimeError("envoltorio") from e
+    except RuntimeError as wrapped:
+        assert retry_after_from_error(wrapped) == 12.0
+    assert retry_after_from_error(HTTPError({})) is None
+    assert retry_after_from_error(ValueError("otro")) is None
\ No newline at end of file
@@ -0,0 +1,55 @@
+import time
+
+import Retry
+
+def test_classify_error():
+    assert Retry.classify_error("ERROR: [youtube] x: Private video. Sign in") == Retry.PERMANENT
+    assert Retry.classify_error("ERROR: Video unavailable") == Retry.PERMANENT
+    assert Retry.classify_error("HTTP Error 503: Service Unavailable") == Retry.TRANSIENT
+    assert Retry.classify_error(None) == Retry.TRANSIENT
+
+def test_retry_delay_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(Retry.random, "uniform", lambda a, b: 1.0)
+    assert Retry.retry_delay(1) == Retry.BASE_DELAY
+    assert Retry.retry_delay(3) == Retry.BASE_DELAY * 4
+    assert Retry.retry_delay(50) == Retry.MAX_DELAY
+
+def test_retry_delay_jitter_stays_within_20_percent():
+    for _ in range(100):
+        assert 0.8 * Retry.BASE_DELAY <= Retry.retry_delay(1) <= 1.2 * Retry.BASE_DELAY
+
+def add_videos(db, n):
+    playlist_id = db.get_or_create_playlist("https://pl")
+    db.add_videos_to_playlist(playlist_id, [{'id': f"v{i}", 'title': f"T{i}"} for i in range(n)])
+    return playlist_id, [row[0] for row in db.iter_pending_videos(playlist_id)]
+
+def test_pending_queue_honours_backoff_and_permanent_errors(db):
+    playlist_id, ids = add_videos(db, 3)
+    now = time.time()
+    db.record_failure(ids[0], Retry.TRANSIENT, "503", now + 60)
+    db.record_failure(ids[1], Retry.PERMANENT, "Private video")
+
+    assert [row[0] for row in db.iter_pending_videos(playlist_id, now=now)] == [ids[2]]
+    assert db.count_pending_videos(playlist_id, now=now) == 1
+    assert db.next_retry_at(playlist_id) == now + 60
+    # Vencido el backoff vuelve a la cola; el permanente no
+    assert [row[0] for row in db.iter_pending_videos(playlist_id, now=now + 61)] == [ids[0], ids[2]]
+    assert db.get_attempt_count(ids[0]) == 1
+
+def test_download_resets_the_attempt_count(db):
+    playlist_id, ids = add_videos(db, 1)
+    db.record_failure(ids[0], Retry.TRANSIENT, "503", time.time() - 1)
+    db.record_failure(ids[0], Retry.TRANSIENT, "503", time.time() - 1)
+    assert db.get_attempt_count(ids[0]) == 2
+    db.mark_downloaded(ids[0], "/staging/x.webm", "{}")
+    assert db.get_attempt_count(ids[0]) == 0
+    assert db.next_retry_at(playlist_id) is None
+
+def test_engine_schedules_transient_and_drops_permanent(harness):
+    engine = harness.engine()
+    playlist_id, ids = add_videos(engine.db, 2)
+    engine._fail(ids[0], "HTTP Error 503")
+    engine._fail(ids[1], "Video unavailable")
+    assert engine.retry_scheduled == {ids[0]}
+    assert engine.stats['failed'] == 1
+    assert engine.db.next_retry_at(playlist_id) > time.time() + 30
\ No newline at end of file
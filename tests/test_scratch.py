@@ -0,0 +1,115 @@
+import json
+import os
+import time
+
+import pytest
+
+import Transcoder
+
+URL = "https://www.youtube.com/playlist?list=PLBENCH"
+
+def touch(path, data=b"x", age=0):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if age:
+        old = time.time() - age
+        os.utime(path, (old, old))
+
+def job_for(tmp_path, **extra):
+    src = str(tmp_path / "a.f251.webm")
+    touch(src, b"original")
+    job = {'db_id': 1, 'video_id': 'a', 'src': src, 'dst': str(tmp_path / "lib" / "A [a].mp3"), 'format': 'mp3',
+           'bitrate': '192', 'tags': {}, 'copy': False, 'out': str(tmp_path / "a.f251.out192.mp3")}
+    job.update(extra)
+    return job
+
+def test_transcode_keeps_source_and_renames_when_done(tmp_path, monkeypatch):
+    commands = []
+    def ffmpeg(cmd, **kwargs):
+        commands.append(cmd)
+        touch(cmd[-1], b"convertido")
+        return type("Proc", (), {'returncode': 0, 'stderr': b""})()
+    monkeypatch.setattr(Transcoder.subprocess, "run", ffmpeg)
+    job = job_for(tmp_path)
+    result = Transcoder.transcode_job(job)
+    assert commands[0][-1] == str(tmp_path / "a.f251.out192.tmp.mp3")
+    assert result['filepath'] == job['out'] and open(job['out'], "rb").read() == b"convertido"
+    assert os.path.exists(job['src']) # Lo borra el motor al publicar
+
+def test_transcode_reuses_a_finished_output(tmp_path, monkeypatch):
+    def ffmpeg(cmd, **kwargs): raise AssertionError("no debía convertir de nuevo")
+    monkeypatch.setattr(Transcoder.subprocess, "run", ffmpeg)
+    job = job_for(tmp_path)
+    touch(job['out'], b"de antes")
+    assert Transcoder.transcode_job(job)['filepath'] == job['out']
+
+def test_failed_transcode_leaves_no_output(tmp_path, monkeypatch):
+    def ffmpeg(cmd, **kwargs):
+        touch(cmd[-1], b"a medias")
+        return type("Proc", (), {'returncode': 1, 'stderr': b"boom"})()
+    monkeypatch.setattr(Transcoder.subprocess, "run", ffmpeg)
+    job = job_for(tmp_path)
+    with pytest.raises(RuntimeError):
+        Transcoder.transcode_job(job)
+    assert sorted(os.listdir(tmp_path)) == ["a.f251.webm"]
+
+def test_clean_partials_keeps_outputs_whose_source_is_there(harness):
+    engine = harness.engine()
+    staging = str(harness.tmp_path / "scratch" / "pl1")
+    for name in ("a.f251.webm", "a.f251.out192.mp3", "a.f251.out192.rg.mp3", "b.f251.out192.mp3",
+                 "c.f251.out192.tmp.mp3", "d.f251.webm.part"):
+        touch(os.path.join(staging, name))
+    engine._clean_partials(1, staging)
+    assert sorted(os.listdir(staging)) == ["a.f251.out192.mp3", "a.f251.webm"]
+
+def test_sweep_removes_only_old_unreferenced_files(harness):
+    engine = harness.engine()
+    db = engine.db
+    root = str(harness.tmp_path / "scratch")
+    pl_id = db.get_or_create_playlist("https://otra")
+    db.add_videos_to_playlist(pl_id, [{'id': 'kept'}, {'id': 'part'}])
+    db.flush()
+    (kept_id, *_), (part_id, *_) = db.iter_pending_videos(pl_id)
+    day = 2 * engine.SCRATCH_MAX_AGE
+    staged = os.path.join(root, "pl7", "kept.f251.webm")
+    db.mark_downloaded(kept_id, staged, "{}")
+    part = os.path.join(root, "pl7", "node-1", "part.f251.webm.part")
+    db.update_partial(part_id, part, 10, 100)
+    for path in (staged, os.path.join(root, "pl7", "kept.f251.out192.mp3"), part, part + "-Frag3"):
+        touch(path, age=day)
+    touch(os.path.join(root, "pl7", "old.f251.webm"), age=day)
+    touch(os.path.join(root, "pl8", "node-2", "old.f251.out192.mp3"), age=day)
+    touch(os.path.join(root, "pl8", "fresh.f251.webm.part")) # De otro proceso trabajando ahora
+    os.utime(os.path.join(root, "pl8", "node-2"), (time.time() - day,) * 2)
+    engine._sweep_scratch(root)
+    left = sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+    assert left == [os.path.join("pl7", "kept.f251.out192.mp3"), os.path.join("pl7", "kept.f251.webm"),
+                    os.path.join("pl7", "node-1", "part.f251.webm.part"),
+                    os.path.join("pl7", "node-1", "part.f251.webm.part-Frag3"),
+                    os.path.join("pl8", "fresh.f251.webm.part")]
+    assert not os.path.exists(os.path.join(root, "pl8", "node-2"))
+
+def test_staging_is_empty_after_publishing(harness):
+    engine = harness.engine()
+    assert engine.run(URL, harness.out, harness.config())['completed'] == 6
+    scratch = harness.tmp_path / "scratch"
+    assert [f for _, _, files in os.walk(scratch) for f in files] == []
+
+def test_output_converted_before_a_crash_is_published_without_downloading(harness):
+    engine = harness.engine()
+    engine.run(URL, harness.out, harness.config())
+    db = engine.db
+    playlist_id = db.get_all_playlists()[0][0]
+    db_id, dst = db.get_completed_videos(playlist_id)[0]
+    os.remove(dst)
+    # Como tras un cierre entre la conversión y la publicación
+    src = str(harness.tmp_path / "scratch" / f"pl{playlist_id}" / "vid.f251.webm")
+    touch(src, b"original")
+    touch(src.replace(".webm", ".out192.mp3"), b"convertido")
+    db.mark_downloaded(db_id, src, json.dumps({'target': dst}))
+    requests = harness.server.requests
+    assert engine.run(URL, harness.out, harness.config())['completed'] == 1
+    assert harness.server.requests == requests
+    assert open(dst, "rb").read() == b"convertido"
+    assert not os.path.exists(src)
\ No newline at end of file
@@ -0,0 +1,36 @@
+import Transcoder
+
+def test_format_selector_prefers_copyable_streams():
+    assert Transcoder.format_selector('m4a') == "bestaudio[acodec^=mp4a]/bestaudio[acodec^=aac]/bestaudio/best"
+    assert Transcoder.format_selector('mp3') == "bestaudio[acodec^=mp3]/bestaudio/best"
+    assert Transcoder.format_selector('flac') == "bestaudio/best"
+
+def test_matching_codec_is_copied():
+    assert Transcoder.can_copy('m4a', '192', {'acodec': "mp4a.40.2", 'abr': 129})
+    assert Transcoder.can_copy('mp3', '320', {'acodec': "mp3", 'abr': 320})
+
+def test_other_codec_is_transcoded():
+    assert not Transcoder.can_copy('m4a', '192', {'acodec': "opus", 'abr': 128})
+    assert not Transcoder.can_copy('mp3', '192', {'acodec': "mp4a.40.2", 'abr': 128})
+    assert not Transcoder.can_copy('m4a', '192', None)
+
+def test_bitrate_margin():
+    source = {'acodec': "mp4a.40.2"}
+    assert Transcoder.can_copy('m4a', '128', dict(source, abr=140)) # Dentro del 10%
+    assert not Transcoder.can_copy('m4a', '128', dict(source, abr=141)) # Se recorta
+    assert Transcoder.can_copy('m4a', '320', dict(source, abr=128)) # Subir el bitrate no mejora nada
+
+def test_unknown_abr_or_bitrate_is_copied():
+    assert Transcoder.can_copy('m4a', '192', {'acodec': "mp4a.40.2", 'abr': None})
+    assert Transcoder.can_copy('m4a', '', {'acodec': "mp4a.40.2", 'abr': 256})
+
+def test_wav_and_flac_are_always_transcoded():
+    for fmt in ('wav', 'flac'):
+        assert not Transcoder.can_copy(fmt, '', {'acodec': "pcm_s16le", 'abr': 1411})
+        assert not Transcoder.can_copy(fmt, '', {'acodec': "flac"})
+
+def test_copy_command_does_not_reencode():
+    cmd = Transcoder.build_command("in.m4a", "out.m4a", 'm4a', '192', {'title': "T"}, copy=True)
+    assert cmd[cmd.index('-c:a') + 1] == "copy" and '-b:a' not in cmd
+    cmd = Transcoder.build_command("in.webm", "out.mp3", 'mp3', '192', {})
+    assert cmd[cmd.index('-c:a') + 1] == "libmp3lame" and cmd[cmd.index('-b:a') + 1] == "192k"
\ No newline at end of file
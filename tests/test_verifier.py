@@ -0,0 +1,57 @@
+import os
+
+import Verifier
+from Verifier import LibraryVerifier
+
+def completed(db, tmp_path, name, data, filesize=None):
+    playlist_id = db.get_or_create_playlist("https://pl")
+    db.add_videos_to_playlist(playlist_id, [{'id': name, 'title': name}])
+    db_id = db._read("SELECT id FROM videos WHERE video_id = ?", (name,), fresh=True)[0][0]
+    path = str(tmp_path / f"{name}.mp3")
+    if data is not None:
+        with open(path, "wb") as f:
+            f.write(data)
+    db.mark_completed(db_id, path, len(data or b"") if filesize is None else filesize)
+    return db_id, path
+
+def status(db, db_id):
+    return db._read("SELECT status, filesize FROM videos WHERE id = ?", (db_id,), fresh=True)[0]
+
+def verifier(db, ffprobe, probe=False):
+    v = LibraryVerifier(db, lambda msg: None, workers=2, probe=probe)
+    v.ffprobe = ffprobe
+    return v
+
+def test_unchanged_files_are_ok_then_cached(db, tmp_path):
+    completed(db, tmp_path, "a", b"audio")
+    assert verifier(db, ffprobe=False).run()['ok'] == 1
+    assert verifier(db, ffprobe=False).run()['cached'] == 1
+
+def test_size_change_without_ffprobe_is_only_reported(db, tmp_path):
+    db_id, path = completed(db, tmp_path, "a", b"audio+tags", filesize=5)
+    result = verifier(db, ffprobe=False).run()
+    assert result['unverified'] == 1 and result['broken'] == 0
+    assert os.path.exists(path)
+    assert status(db, db_id) == ('COMPLETED', 5)
+
+def test_size_change_that_still_decodes_updates_the_record(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(Verifier, "probe_duration", lambda path: 180.0)
+    db_id, path = completed(db, tmp_path, "a", b"audio+tags", filesize=5)
+    result = verifier(db, ffprobe=True).run()
+    assert result['changed'] == 1 and result['ok'] == 1
+    assert os.path.exists(path)
+    assert status(db, db_id) == ('COMPLETED', len(b"audio+tags"))
+
+def test_undecodable_file_is_quarantined(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(Verifier, "probe_duration", lambda path: None)
+    db_id, path = completed(db, tmp_path, "a", b"garbage", filesize=5)
+    assert verifier(db, ffprobe=True).run()['broken'] == 1
+    assert not os.path.exists(path) and os.path.exists(path + ".broken")
+    assert status(db, db_id)[0] == 'PENDING'
+
+def test_missing_and_empty_files_go_back_to_the_queue(db, tmp_path):
+    missing, _ = completed(db, tmp_path, "gone", None, filesize=10)
+    empty, path = completed(db, tmp_path, "empty", b"")
+    assert verifier(db, ffprobe=False).run()['broken'] == 2
+    assert status(db, missing)[0] == 'PENDING' and status(db, empty)[0] == 'PENDING'
+    assert os.path.exists(path + ".broken")
\ No newline at end of file